@@ -0,0 +1,190 @@
+"""
+Semantic answer cache.
+Answers are stored in SQLite with the index they came from, the IDs of the
+chunks the question retrieved and the question's normalized embedding. A
+new question on the same index version that retrieves the same chunks and
+whose embedding is close enough to a cached question gets the cached answer
+instead of running the LLM. Entries expire after a TTL, the least recently
+used ones are evicted beyond a size limit, and rebuilding an index
+invalidates its answers.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import threading
+
+import numpy as np
+
+ANSWER_CACHE_PATH = os.environ.get("ANSWER_CACHE_PATH", "./answer_cache.db")
+# Cosine similarity two questions need to share an answer
+ANSWER_CACHE_SIMILARITY = float(os.environ.get("ANSWER_CACHE_SIMILARITY", "0.95"))
+# Seconds an answer is served from the cache (default: one week)
+ANSWER_CACHE_TTL = float(os.environ.get("ANSWER_CACHE_TTL", str(7 * 24 * 3600)))
+ANSWER_CACHE_MAX_ENTRIES = int(os.environ.get("ANSWER_CACHE_MAX_ENTRIES", "5000"))
+
+class AnswerCache:
+    def __init__(self, db_path=ANSWER_CACHE_PATH, similarity=ANSWER_CACHE_SIMILARITY, ttl=ANSWER_CACHE_TTL,
+                 max_entries=ANSWER_CACHE_MAX_ENTRIES):
+        """
+        Open (or create) the answer cache database.
+
+        Args:
+            db_path (str): SQLite database file
+            similarity (float): Lowest cosine similarity of a question to a cached one for a hit
+            ttl (float): Seconds after which an answer is no longer served
+            max_entries (int): Answers kept; the least recently used are evicted beyond this
+        """
+        self.db_path = db_path
+        self.similarity = similarity
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.lookups = 0
+        self.hits = 0
+        self.seconds_saved = 0.0
+        self._lock = threading.Lock()
+        self._create_tables()
+
+    def lookup(self, index_id, index_version, model, chunk_ids, question_embedding):
+        """
+        Find a cached answer for a question.
+
+        Args:
+            index_id (str): Identifies the searched index (path, or global index and video filter)
+            index_version (str): Changes whenever the index is rebuilt
+            model (str): LLM that produced the answers
+            chunk_ids (list): IDs of the chunks the question retrieved
+            question_embedding (np.ndarray): Normalized embedding of the question
+
+        Returns:
+            dict: {answer, question, similarity, generation_seconds} or None
+        """
+        start_time = time.time()
+        question_embedding = np.asarray(question_embedding, dtype="float32").reshape(-1)
+        conn = self._connect()
+        try:
+            self._invalidate_stale(conn, index_id, index_version)
+            rows = conn.execute(
+                "SELECT id, question, embedding, answer, generation_seconds FROM answers "
+                "WHERE index_id = ? AND model = ? AND chunk_ids = ? AND created > ?",
+                (index_id, model, chunk_key(chunk_ids), time.time() - self.ttl)
+            ).fetchall()
+            best = None
+            for row_id, question, embedding, answer, generation_seconds in rows:
+                similarity = float(np.dot(np.frombuffer(embedding, dtype="float32"), question_embedding))
+                if similarity >= self.similarity and (best is None or similarity > best["similarity"]):
+                    best = {"id": row_id, "answer": answer, "question": question, "similarity": similarity,
+                            "generation_seconds": generation_seconds}
+            if best is not None:
+                conn.execute("UPDATE answers SET last_used = ?, hits = hits + 1 WHERE id = ?",
+                             (time.time(), best.pop("id")))
+        finally:
+            conn.close()
+
+        with self._lock:
+            self.lookups += 1
+            if best is not None:
+                self.hits += 1
+                # The cached answer took generation_seconds to produce; the lookup is the price of skipping that
+                self.seconds_saved += max(best["generation_seconds"] - (time.time() - start_time), 0)
+        return best
+
+    def store(self, index_id, index_version, model, chunk_ids, question, question_embedding, answer,
+              generation_seconds):
+        """Cache the answer to a question (see lookup for the arguments)."""
+        embedding = np.asarray(question_embedding, dtype="float32").reshape(-1)
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            self._invalidate_stale(conn, index_id, index_version)
+            conn.execute(
+                "INSERT INTO answers (index_id, index_version, model, chunk_ids, question, embedding, answer, "
+                "generation_seconds, created, last_used) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (index_id, str(index_version), model, chunk_key(chunk_ids), question, embedding.tobytes(), answer,
+                 generation_seconds, now, now)
+            )
+            conn.execute("DELETE FROM answers WHERE created <= ?", (now - self.ttl,))
+            conn.execute(
+                "DELETE FROM answers WHERE id IN "
+                "(SELECT id FROM answers ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+    def invalidate(self, index_id):
+        """Drop every answer from an index, e.g. after it was rebuilt."""
+        conn = self._connect()
+        try:
+            conn.execute("DELETE FROM answers WHERE index_id = ?", (index_id,))
+        finally:
+            conn.close()
+
+    def stats(self):
+        """Return hit rate and seconds of generation saved in this process, and the number of cached answers."""
+        with self._lock:
+            lookups, hits, seconds_saved = self.lookups, self.hits, self.seconds_saved
+        conn = self._connect()
+        try:
+            entries = conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+        finally:
+            conn.close()
+        return {
+            "lookups": lookups,
+            "hits": hits,
+            "hit_rate": round(hits / lookups, 4) if lookups else None,
+            "seconds_saved": round(seconds_saved, 1),
+            "entries": entries,
+        }
+
+    def _invalidate_stale(self, conn, index_id, index_version):
+        # Answers from an earlier build of the index may cite chunks that changed
+        conn.execute("DELETE FROM answers WHERE index_id = ? AND index_version != ?", (index_id, str(index_version)))
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+
+    def _create_tables(self):
+        directory = os.path.dirname(self.db_path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        conn = self._connect()
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS answers (
+                    id INTEGER PRIMARY KEY,
+                    index_id TEXT NOT NULL,
+                    index_version TEXT NOT NULL,
+                    model TEXT NOT NULL,
+                    chunk_ids TEXT NOT NULL,
+                    question TEXT NOT NULL,
+                    embedding BLOB NOT NULL,
+                    answer TEXT NOT NULL,
+                    generation_seconds REAL NOT NULL,
+                    created REAL NOT NULL,
+                    last_used REAL NOT NULL,
+                    hits INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS answers_lookup ON answers (index_id, chunk_ids)")
+        finally:
+            conn.close()
+
+def chunk_key(chunk_ids):
+    """Retrieved chunk IDs as a key; the order does not matter since the prompt sorts chunks itself."""
+    return json.dumps(sorted(int(chunk_id) for chunk_id in chunk_ids))
+
+_answer_cache = None
+_answer_cache_lock = threading.Lock()
+
+def get_answer_cache():
+    """Return the answer cache shared by the whole process."""
+    global _answer_cache
+    with _answer_cache_lock:
+        if _answer_cache is None:
+            _answer_cache = AnswerCache()
+        return _answer_cache
@@ -8,15 +8,19 @@ import streamlit as st
 import os
 import sys
 import time
-import pandas as pd
 from datetime import datetime
-import json
 
 # YouTube modülünü içe aktar
 sys.path.append(".")
-from youtube_downloader import sanitize_filename, install_yt_dlp, download_youtube_audio
-from audio_transcriber import install_packages as install_whisper_packages, transcribe_audio
-from rag_helper import install_packages as install_rag_packages, download_model_if_needed, RAGProcessor, LocalLLM
+from capabilities import get_capabilities, is_available
+from transcript_format import TRANSCRIPT_EXTENSION, read_transcript, transcript_text
+from rag_helper import download_model_if_needed, RAGProcessor, LocalLLM
+from global_index import get_global_index
+from embedding_cache import get_embedding_cache
+from prompt_cache import get_prompt_cache
+from answer_cache import get_answer_cache
+from model_manager import get_model_manager
+from pipeline import get_job_queue
 
 # Sayfa yapılandırması
 st.set_page_config(
@@ -103,6 +107,26 @@ if not os.path.exists("./models"):
 if not os.path.exists("./rag_indexes"):
     os.makedirs("./rag_indexes")
 
+# Kurulu arka uçlar süreç başına bir kez kontrol edilir; eksik olanların özellikleri kapatılır
+capabilities = get_capabilities()
+
+FEATURE_LABELS = {
+    "download": "İndirme",
+    "transcribe": "Metne dönüştürme",
+    "rag": "RAG indeksleme ve arama",
+    "llm": "LLM ile cevaplama",
+}
+
+def missing_feature_warning(feature):
+    """Bir özelliğin paketleri kurulu değilse uyarı göster; özellik kullanılabiliyorsa True döndür."""
+    if is_available(feature):
+        return True
+    packages = " ".join(capabilities[feature]["missing"])
+    st.warning(f"{FEATURE_LABELS[feature]} devre dışı: `{packages}` kurulu değil. "
+               f"Kurmak için `pip install {packages}` veya `python capabilities.py --install` "
+               f"çalıştırıp uygulamayı yeniden başlatın.")
+    return False
+
 # Sekmeleri oluştur
 tab1, tab2, tab3, tab4, tab5 = st.tabs(["Ses İndir", "Metne Dönüştür", "RAG Hazırla", "Soru Sor", "Dosyalar"])
 
@@ -119,10 +143,110 @@ if "current_transcript_path" not in st.session_state:
     st.session_state["current_transcript_path"] = None
 if "current_transcript_title" not in st.session_state:
     st.session_state["current_transcript_title"] = None
+if "jobs" not in st.session_state:
+    st.session_state["jobs"] = []  # Bu oturumun gönderdiği iş ID'leri
+if "applied_jobs" not in st.session_state:
+    st.session_state["applied_jobs"] = set()
+
+# İndirme, dönüştürme ve indeksleme arka plandaki iş kuyruğunda çalışır
+job_queue = get_job_queue()
+
+JOB_STATUS_LABELS = {
+    "queued": "⏳ Sırada",
+    "running": "⚙️ Çalışıyor",
+    "completed": "✅ Tamamlandı",
+    "failed": "❌ Başarısız",
+    "cancelled": "🛑 İptal edildi",
+}
+
+def submit_job(stage, params):
+    """Kuyruğa bir iş ekle ve bu oturumun işleri arasında takip et."""
+    job_id = job_queue.submit(stage, params)
+    st.session_state["jobs"].append(job_id)
+    return job_id
+
+def apply_job_result(job):
+    """Tamamlanan bir işin sonucunu oturum durumuna bir kez aktar."""
+    if job["id"] in st.session_state["applied_jobs"]:
+        return
+    st.session_state["applied_jobs"].add(job["id"])
+    result = job["result"] or {}
+    if job["stage"] == "download":
+        st.session_state["last_downloaded"] = result["audio_path"]
+        st.session_state["last_downloaded_captions"] = result.get("captions_path")
+    elif job["stage"] == "transcribe":
+        st.session_state["current_transcript_path"] = result["transcript_path"]
+        st.session_state["current_transcript_title"] = os.path.basename(job["params"]["audio_path"]).rsplit(".", 1)[0]
+        if result.get("index_path"):
+            st.session_state["current_rag_index"] = result["index_path"]
+    elif job["stage"] == "index":
+        st.session_state["current_rag_index"] = result["index_path"]
+
+def render_job_details(job):
+    """Bir işin aşamaya özgü çıktısını göster."""
+    result = job["result"] or {}
+    if job["stage"] == "download" and job["status"] == "completed":
+        st.audio(result["audio_path"])
+        if result.get("captions_path"):
+            kind = "elle eklenmiş" if result["caption_kind"] == "manual" else "otomatik"
+            st.info(f"💬 Videonun {kind} altyazıları bulundu; dönüştürmede Whisper atlanabilir.")
+    elif job["stage"] == "transcribe":
+        # Dönüştürme sürerken segmentler dosyaya yazıldıkça kısmi metin gösterilir
+        transcript_path = result.get("transcript_path") or job["params"].get("transcript_path")
+        if transcript_path and os.path.exists(transcript_path):
+            full_transcript = transcript_text(read_transcript(transcript_path))
+            with st.expander("Dönüştürülen Metin", expanded=job["status"] == "running"):
+                st.markdown(full_transcript)
+            if job["status"] == "completed":
+                st.download_button(
+                    label="📝 Metni İndir",
+                    data=full_transcript,
+                    file_name=os.path.basename(result["text_path"]),
+                    mime="text/plain",
+                    key=f"download_text_{job['id']}"
+                )
+                if result.get("source") == "captions":
+                    st.write("Metin videonun altyazılarından alındı, Whisper çalıştırılmadı.")
+                if result.get("index_path"):
+                    st.write(f"RAG indeksi kaydedildi: {result['index_path']}")
+    elif job["stage"] == "index" and job["status"] == "completed":
+        st.success(f"RAG indeksi oluşturuldu ve kaydedildi: {result['index_path']}")
+
+def render_jobs(stage, title):
+    """Bu oturumun bir aşamadaki işlerini göster. Devam eden iş varsa True döner."""
+    jobs = [job_queue.get(job_id) for job_id in reversed(st.session_state["jobs"])]
+    jobs = [job for job in jobs if job is not None and job["stage"] == stage]
+    if not jobs:
+        return False
+    
+    st.subheader("İşler")
+    active = False
+    for job in jobs:
+        with st.container():
+            st.markdown(f"**{JOB_STATUS_LABELS[job['status']]}** — {title(job)}")
+            if job["status"] in ("queued", "running"):
+                active = True
+                st.progress(job["progress"], text=job["message"] or "")
+                if st.button("🛑 İptal Et", key=f"cancel_{job['id']}"):
+                    job_queue.cancel(job["id"])
+                    st.rerun()
+            elif job["status"] == "completed":
+                apply_job_result(job)
+            else:
+                if job["error"]:
+                    st.error(job["error"])
+                if st.button("🔁 Tekrar Dene", key=f"retry_{job['id']}"):
+                    job_queue.retry(job["id"])
+                    st.rerun()
+            render_job_details(job)
+    return active
+
+active_jobs = False
 
 # Ses indirme sekmesi
 with tab1:
     st.header("YouTube'dan Ses İndir")
+    download_available = missing_feature_warning("download")
     
     # Form oluştur
     with st.form(key="download_form"):
@@ -132,39 +256,43 @@ with tab1:
         with col1:
             output_dir = st.text_input("Çıktı Dizini", value="./audios")
         
+        with col2:
+            audio_format = st.selectbox(
+                "Ses Formatı",
+                ["native", "wav16k", "mp3"],
+                format_func=lambda fmt: {
+                    "native": "Orijinal akış (opus/m4a, dönüştürmesiz - önerilen)",
+                    "wav16k": "16 kHz mono WAV (Whisper için doğrudan)",
+                    "mp3": "MP3 192 kbps (dinlemek için)",
+                }[fmt]
+            )
+            caption_policy = st.selectbox(
+                "Altyazı Kullanımı",
+                ["manual", "auto", "asr"],
+                format_func=lambda policy: {
+                    "manual": "Elle eklenmiş altyazı varsa kullan",
+                    "auto": "Otomatik altyazılar da kullanılabilir",
+                    "asr": "Her zaman Whisper ile dönüştür",
+                }[policy]
+            )
+        
         download_button = st.form_submit_button("🔽 İndir")
         
-    # İndirme işlemini gerçekleştir
+    # İndirme işini kuyruğa ekle
     if download_button and youtube_url:
-        with st.status("İndirme işlemi başlatılıyor...") as status:
-            try:
-                st.write("YouTube URL'si doğrulanıyor...")
-                
-                # yt-dlp'yi yükle
-                if not install_yt_dlp():
-                    st.error("yt-dlp yüklenemedi!")
-                    status.update(label="İndirme başarısız", state="error")
-                else:
-                    st.write("yt-dlp kurulumu başarılı!")
-                    
-                    # Ses indirme işlemi
-                    st.write("Ses indiriliyor...")
-                    audio_path = download_youtube_audio(youtube_url, output_dir)
-                    
-                    # Başarılı
-                    st.session_state["last_downloaded"] = audio_path
-                    status.update(label="İndirme başarılı!", state="complete")
-                    
-                    st.success(f"Ses başarıyla indirildi: {audio_path}")
-                    st.audio(audio_path)
-                    
-            except Exception as e:
-                st.error(f"İndirme sırasında bir hata oluştu: {str(e)}")
-                status.update(label="İndirme başarısız", state="error")
+        if not download_available:
+            st.error("yt-dlp kurulu değil!")
+        else:
+            submit_job("download", {"url": youtube_url, "output_dir": output_dir, "audio_format": audio_format,
+                                    "caption_policy": caption_policy})
+            st.success("İndirme işi kuyruğa eklendi.")
+    
+    active_jobs |= render_jobs("download", lambda job: job["params"]["url"])
 
 # Metne dönüştürme sekmesi
 with tab2:
     st.header("Ses Dosyasını Metne Dönüştür")
+    transcribe_available = missing_feature_warning("transcribe")
     
     # Form oluştur
     with st.form(key="transcribe_form"):
@@ -172,19 +300,27 @@ with tab2:
         use_last_downloaded = st.checkbox("Son indirilen dosyayı kullan", 
                                          value="last_downloaded" in st.session_state)
         
+        captions_path = None
         if use_last_downloaded and "last_downloaded" in st.session_state:
             audio_file_path = st.session_state["last_downloaded"]
             st.info(f"Kullanılacak dosya: {audio_file_path}")
+            if st.session_state.get("last_downloaded_captions"):
+                use_captions = st.checkbox("Videonun altyazılarını kullan (Whisper çalıştırılmaz)", value=True)
+                if use_captions:
+                    captions_path = st.session_state["last_downloaded_captions"]
         else:
-            audio_file_path = st.file_uploader("Ses Dosyası Seç", type=["mp3", "wav", "m4a", "ogg"])
+            audio_file_path = st.file_uploader("Ses Dosyası Seç", type=["mp3", "wav", "m4a", "ogg", "opus", "webm"])
             if audio_file_path:
-                # Yüklenen dosyayı geçici bir dosyaya kaydet
-                bytes_data = audio_file_path.read()
-                temp_file = f"./audios/temp_{int(time.time())}_{audio_file_path.name}"
-                with open(temp_file, "wb") as f:
-                    f.write(bytes_data)
-                audio_file_path = temp_file
-                st.session_state["last_uploaded"] = audio_file_path
+                # Yüklenen dosyayı geçici bir dosyaya kaydet (iş durumu yenilemelerinde tekrar yazma)
+                upload_key = f"{audio_file_path.name}_{audio_file_path.size}"
+                if st.session_state.get("last_uploaded_key") != upload_key:
+                    bytes_data = audio_file_path.read()
+                    temp_file = f"./audios/temp_{int(time.time())}_{audio_file_path.name}"
+                    with open(temp_file, "wb") as f:
+                        f.write(bytes_data)
+                    st.session_state["last_uploaded"] = temp_file
+                    st.session_state["last_uploaded_key"] = upload_key
+                audio_file_path = st.session_state["last_uploaded"]
         
         col1, col2 = st.columns(2)
         
@@ -194,75 +330,59 @@ with tab2:
                 ["tiny", "base", "small", "medium", "large-v2"],
                 index=3  # Varsayılan olarak "medium" seçili
             )
+            transcription_mode = st.selectbox(
+                "Dönüştürme Modu",
+                ["standard", "throughput", "parallel"],
+                format_func=lambda mode: {
+                    "standard": "Standart (en doğru)",
+                    "throughput": "Throughput (toplu çıkarım, çok daha hızlı)",
+                    "parallel": "Paralel (uzun sesler, çok çekirdekli CPU)",
+                }[mode]
+            )
+        
+        with col2:
+            # RAG paketleri yoksa yalnızca indeksleme kapanır, dönüştürme çalışmaya devam eder
+            build_index_while_transcribing = st.checkbox(
+                "Dönüştürürken RAG indeksini de oluştur", value=is_available("rag"),
+                disabled=not is_available("rag"),
+                help=None if is_available("rag") else "RAG paketleri kurulu değil (python capabilities.py --install)"
+            )
             
         transcribe_button = st.form_submit_button("🔊 Metne Dönüştür")
     
-    # Transcribe işlemini gerçekleştir
+    # Dönüştürme işini kuyruğa ekle
     if transcribe_button and (audio_file_path is not None):
-        with st.status("Metne dönüştürme işlemi başlatılıyor...") as status:
-            try:
-                # Paketleri yükle
-                st.write("Gerekli paketler kontrol ediliyor...")
-                if install_whisper_packages():
-                    st.write("Gerekli paketler kuruldu.")
-                    
-                    # Metne dönüştürme işlemi
-                    st.write(f"{model_size} modeli yükleniyor... (Bu biraz zaman alabilir)")
-                    transcript_segments = transcribe_audio(audio_file_path, model_size)
-                    
-                    # Tam metni oluştur
-                    full_transcript = "\n".join(transcript_segments)
-                    
-                    # Metni göster
-                    st.subheader("Dönüştürülen Metin:")
-                    st.markdown(full_transcript)
-                    
-                    # Metni dosyaya kaydet
-                    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                    base_filename = os.path.basename(audio_file_path).rsplit(".", 1)[0]
-                    transcript_file = f"./transcripts/{base_filename}_{timestamp}.txt"
-                    
-                    with open(transcript_file, "w", encoding="utf-8") as f:
-                        f.write(full_transcript)
-                    
-                    # Session state'e kaydet
-                    st.session_state["current_transcript_path"] = transcript_file
-                    st.session_state["current_transcript_title"] = base_filename
-                    
-                    # Metni indirme butonu
-                    st.download_button(
-                        label="📝 Metni İndir",
-                        data=full_transcript,
-                        file_name=f"{base_filename}_{timestamp}.txt",
-                        mime="text/plain"
-                    )
-                    
-                    status.update(label="Dönüştürme başarılı!", state="complete")
-                    
-                else:
-                    st.error("Gerekli paketler yüklenemedi!")
-                    status.update(label="Dönüştürme başarısız", state="error")
-                    
-            except Exception as e:
-                st.error(f"Metne dönüştürme sırasında bir hata oluştu: {str(e)}")
-                status.update(label="Dönüştürme başarısız", state="error")
+        if not transcribe_available:
+            st.error("faster-whisper kurulu değil!")
+        else:
+            # Zaman damgalı segmentler dönüştürme sırasında bu dosyaya yazılır
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            base_filename = os.path.basename(audio_file_path).rsplit(".", 1)[0]
+            submit_job("transcribe", {
+                "audio_path": audio_file_path,
+                "model_size": model_size,
+                "mode": transcription_mode,
+                "build_index": build_index_while_transcribing,
+                "transcript_path": f"./transcripts/{base_filename}_{timestamp}{TRANSCRIPT_EXTENSION}",
+                "captions_path": captions_path,
+            })
+            st.success("Dönüştürme işi kuyruğa eklendi.")
+    
+    active_jobs |= render_jobs(
+        "transcribe",
+        lambda job: f"{os.path.basename(job['params']['audio_path'])} ({job['params']['model_size']}, {job['params']['mode']})"
+    )
 
 # RAG Hazırlama sekmesi
 with tab3:
     st.header("RAG Sistemi Hazırla")
     
-    # RAG için gerekli paketleri yükle
-    if st.button("🔧 RAG Bağımlılıklarını Kur"):
-        with st.status("RAG için gerekli paketler yükleniyor...") as status:
-            if install_rag_packages():
-                st.success("RAG paketleri başarıyla kuruldu!")
-                status.update(label="Kurulum başarılı", state="complete")
-            else:
-                st.error("RAG paketleri kurulumunda hata!")
-                status.update(label="Kurulum başarısız", state="error")
+    # Paketler uygulama içinden kurulmaz; eksikler başlangıçta tespit edilir
+    rag_available = missing_feature_warning("rag")
+    llm_available = missing_feature_warning("llm")
     
     # LLM modelini hazırla
-    if st.button("🧠 LLM Modelini Hazırla"):
+    if st.button("🧠 LLM Modelini Hazırla", disabled=not llm_available):
         with st.status("LLM modeli kontrol ediliyor...") as status:
             if download_model_if_needed():
                 st.success("LLM modeli hazır!")
@@ -288,13 +408,49 @@ with tab3:
                 """)
                 status.update(label="Model bulunamadı", state="error")
     
+    # Tüm oturumların paylaştığı modellerin durumu
+    shared_models = get_model_manager().stats()
+    if shared_models:
+        with st.expander("Paylaşılan Modeller"):
+            for model_info in shared_models:
+                st.write(
+                    f"**{model_info['name']}** — "
+                    f"{'yüklü' if model_info['loaded'] else 'bellekte değil'}, "
+                    f"{model_info['refcount']} oturum, "
+                    f"{model_info['queued_requests']} bekleyen istek, "
+                    f"{model_info['idle_seconds']} sn boşta"
+                )
+            cache_stats = get_embedding_cache().stats()
+            st.write(
+                f"**Gömme önbelleği** — {cache_stats['entries']} kayıt, "
+                f"{cache_stats['hits']} isabet, {cache_stats['misses']} kodlanan parça"
+            )
+            prompt_stats = get_prompt_cache().stats()
+            st.write(
+                f"**İstem önbelleği (KV)** — {prompt_stats['entries']} durum, {prompt_stats['size_mb']} MB, "
+                f"{prompt_stats['hits']} isabet, {prompt_stats['misses']} ıska, "
+                f"{prompt_stats['tokens_reused']} token yeniden işlenmedi"
+            )
+            answer_stats = get_answer_cache().stats()
+            hit_rate = f"%{answer_stats['hit_rate'] * 100:.0f}" if answer_stats["hit_rate"] is not None else "-"
+            st.write(
+                f"**Cevap önbelleği** — {answer_stats['entries']} cevap, isabet oranı {hit_rate} "
+                f"({answer_stats['hits']}/{answer_stats['lookups']}), {answer_stats['seconds_saved']} sn kazanıldı"
+            )
+    
     # Transcript seçimi ve RAG hazırlama
     st.subheader("Transcript'i RAG İçin Hazırla")
     
     # Transcript dosyalarını listele
     transcript_files = []
     if os.path.exists("./transcripts"):
-        transcript_files = [f for f in os.listdir("./transcripts") if f.endswith(".txt")]
+        all_transcripts = os.listdir("./transcripts")
+        # Zaman damgalı sürümü olan düz metin dosyalarını tekrar listeleme
+        transcript_files = sorted(
+            f for f in all_transcripts
+            if f.endswith(TRANSCRIPT_EXTENSION) or
+            (f.endswith(".txt") and f.rsplit(".", 1)[0] + TRANSCRIPT_EXTENSION not in all_transcripts)
+        )
     
     # Transcript seçimi
     selected_transcript = None
@@ -320,42 +476,20 @@ with tab3:
         else:
             st.warning("Henüz transcript dosyası bulunmuyor. Önce bir ses dosyasını metne dönüştürün.")
     
-    # RAG hazırlama butonu
-    if selected_transcript and st.button("🔍 RAG İçin Hazırla"):
-        with st.status("Transcript RAG için hazırlanıyor...") as status:
-            try:
-                # Transcript dosyasını oku
-                with open(selected_transcript, "r", encoding="utf-8") as f:
-                    transcript_text = f.read()
-                
-                # RAG işleyicisini oluştur
-                if "rag_processor" not in st.session_state or st.session_state["rag_processor"] is None:
-                    st.session_state["rag_processor"] = RAGProcessor()
-                
-                # Transcripti işle
-                if st.session_state["rag_processor"].process_transcript(transcript_text):
-                    # RAG indeksini kaydet
-                    base_name = os.path.basename(selected_transcript).rsplit(".", 1)[0]
-                    index_path = f"./rag_indexes/{base_name}"
-                    
-                    if st.session_state["rag_processor"].save_index(index_path):
-                        st.success(f"RAG indeksi başarıyla oluşturuldu ve kaydedildi: {index_path}")
-                        st.session_state["current_rag_index"] = index_path
-                        status.update(label="RAG hazırlama başarılı", state="complete")
-                    else:
-                        st.error("RAG indeksi kaydedilemedi!")
-                        status.update(label="RAG indeksi kaydedilemedi", state="error")
-                else:
-                    st.error("Transcript RAG için hazırlanamadı!")
-                    status.update(label="RAG hazırlama başarısız", state="error")
-                    
-            except Exception as e:
-                st.error(f"RAG hazırlama sırasında bir hata oluştu: {str(e)}")
-                status.update(label="RAG hazırlama başarısız", state="error")
+    # RAG hazırlama işini kuyruğa ekle
+    if selected_transcript and st.button(
+        "🔍 RAG İçin Hazırla", disabled=not rag_available,
+        help=None if rag_available else "RAG paketleri kurulu değil, yukarıdaki uyarıya bakın"
+    ):
+        submit_job("index", {"transcript_path": selected_transcript})
+        st.success("RAG hazırlama işi kuyruğa eklendi.")
+    
+    active_jobs |= render_jobs("index", lambda job: os.path.basename(job["params"]["transcript_path"]))
 
 # Soru Sorma sekmesi
 with tab4:
     st.header("Video İçeriği Hakkında Soru Sor")
+    rag_available = missing_feature_warning("rag")
     
     # RAG indekslerini listele
     rag_indexes = []
@@ -363,42 +497,66 @@ with tab4:
         # .index uzantılı dosyaları bul ve .index uzantısını kaldır
         rag_indexes = [f.rsplit(".", 1)[0] for f in os.listdir("./rag_indexes") if f.endswith(".index")]
     
+    # Tüm videoları içeren genel indeksteki videolar
+    global_videos = get_global_index().list_videos()
+    
     # Eğer RAG indeksi varsa
-    if rag_indexes:
-        # Son oluşturulan RAG indeksini kullan
-        use_current_index = st.checkbox(
-            "Son oluşturulan RAG indeksini kullan", 
-            value="current_rag_index" in st.session_state
+    if rag_indexes or global_videos:
+        search_scope = st.radio(
+            "Arama Kapsamı",
+            ["single", "global"] if global_videos else ["single"],
+            format_func=lambda scope: {
+                "single": "Tek video (seçilen RAG indeksi)",
+                "global": "Tüm videolar (genel indeks)",
+            }[scope],
+            horizontal=True
         )
         
         selected_index = None
-        if use_current_index and "current_rag_index" in st.session_state:
-            selected_index = st.session_state["current_rag_index"]
-            index_basename = os.path.basename(selected_index)
-            st.info(f"Kullanılacak RAG indeksi: {index_basename}")
+        selected_videos = []
+        if search_scope == "global":
+            video_titles = {video["video_id"]: video["title"] for video in global_videos}
+            selected_videos = st.multiselect(
+                "Aranacak videolar (boş bırakılırsa tümü)",
+                options=list(video_titles),
+                format_func=lambda video_id: video_titles[video_id]
+            )
+        elif not rag_indexes:
+            st.warning("Henüz tek videoluk RAG indeksi yok.")
         else:
-            index_option = st.selectbox(
-                "RAG indeksi seç", 
-                options=[os.path.basename(idx) for idx in rag_indexes],
-                format_func=lambda x: x
+            # Son oluşturulan RAG indeksini kullan
+            use_current_index = st.checkbox(
+                "Son oluşturulan RAG indeksini kullan", 
+                value="current_rag_index" in st.session_state
             )
-            if index_option:
-                selected_index = os.path.join("./rag_indexes", index_option)
+            
+            if use_current_index and "current_rag_index" in st.session_state:
+                selected_index = st.session_state["current_rag_index"]
+                index_basename = os.path.basename(selected_index)
+                st.info(f"Kullanılacak RAG indeksi: {index_basename}")
+            else:
+                index_option = st.selectbox(
+                    "RAG indeksi seç", 
+                    options=[os.path.basename(idx) for idx in rag_indexes],
+                    format_func=lambda x: x
+                )
+                if index_option:
+                    selected_index = os.path.join("./rag_indexes", index_option)
         
         # Eğer LLM yüklenmemişse uyarı ver
         if not st.session_state.get("llm_loaded", False):
             st.warning("LLM henüz yüklenmedi. Soru sormadan önce 'RAG Hazırla' sekmesinden LLM modelini yükleyin.")
         
         # Eğer indeks seçildi ve LLM yüklendiyse
-        if selected_index and st.session_state.get("llm_loaded", False):
-            # RAG indeksini yükle
-            if ("rag_processor" not in st.session_state or 
-                st.session_state["rag_processor"] is None or
-                not hasattr(st.session_state["rag_processor"], "index") or
-                st.session_state["rag_processor"].index is None):
-                
-                with st.spinner("RAG indeksi yükleniyor..."):
+        if (selected_index or search_scope == "global") and st.session_state.get("llm_loaded", False) and rag_available:
+            # RAG işleyicisi oturum boyunca tekrar kullanılır, sadece indeks değişir
+            if "rag_processor" not in st.session_state or st.session_state["rag_processor"] is None:
+                with st.spinner("Gömme modeli hazırlanıyor..."):
                     st.session_state["rag_processor"] = RAGProcessor()
+            
+            # Seçilen indeks yüklü değilse yükle (son kullanılanlar bellekte tutulur)
+            if selected_index and st.session_state["rag_processor"].loaded_index_path != selected_index:
+                with st.spinner("RAG indeksi yükleniyor..."):
                     if st.session_state["rag_processor"].load_index(selected_index):
                         st.success("RAG indeksi başarıyla yüklendi")
                     else:
@@ -420,6 +578,14 @@ with tab4:
                             <b>Cevap:</b> {message["content"]}
                         </div>
                         """, unsafe_allow_html=True)
+                        metrics = message.get("metrics")
+                        if metrics and metrics.get("cached"):
+                            st.caption(f"⚡ Önbellekten (benzerlik {metrics['similarity']:.2f}, "
+                                       f"~{metrics['seconds_saved']:.1f} sn kazanıldı)")
+                        elif metrics and metrics["time_to_first_token"] is not None:
+                            speed = f" · {metrics['tokens_per_second']} token/sn" if metrics["tokens_per_second"] else ""
+                            st.caption(f"⏱️ İlk token: {metrics['time_to_first_token']:.2f} sn · "
+                                       f"{metrics['tokens']} token{speed}")
             
             # Yeni soru sorma alanı
             st.subheader("Yeni Soru")
@@ -436,20 +602,61 @@ with tab4:
                     
                     # İlgili chunk'ları getir
                     with st.spinner("İlgili içerik aranıyor..."):
-                        relevant_chunks = st.session_state["rag_processor"].retrieve_relevant_chunks(
-                            question, top_k=3
-                        )
+                        if search_scope == "global":
+                            relevant_chunks = st.session_state["rag_processor"].retrieve_from_global_index(
+                                question, top_k=3, video_ids=selected_videos or None
+                            )
+                        else:
+                            relevant_chunks = st.session_state["rag_processor"].retrieve_relevant_chunks(
+                                question, top_k=3
+                            )
                     
-                    # LLM ile cevap oluştur
-                    with st.spinner("Cevap oluşturuluyor..."):
-                        answer = st.session_state["llm"].generate_response(
-                            question, relevant_chunks
-                        )
+                    # Aynı parçaları getiren çok benzer bir soru daha önce cevaplandıysa önbellekten al
+                    retrieval = st.session_state["rag_processor"].last_retrieval
+                    answer_cache_key = None
+                    if retrieval and retrieval["index_id"] and retrieval["chunk_ids"]:
+                        answer_cache_key = (retrieval["index_id"], retrieval["index_version"],
+                                            st.session_state["llm"].model_file, retrieval["chunk_ids"])
+                    cached = get_answer_cache().lookup(
+                        *answer_cache_key, retrieval["query_embedding"]
+                    ) if answer_cache_key else None
+                    
+                    if cached:
+                        answer = cached["answer"]
+                        metrics = {"cached": True, "similarity": cached["similarity"],
+                                   "seconds_saved": cached["generation_seconds"]}
+                    else:
+                        # LLM ile cevabı token token oluştur ve geldikçe göster
+                        answer_placeholder = st.empty()
+                        answer_placeholder.markdown("""
+                        <div class="chat-message assistant-message">
+                            <b>Cevap:</b> <i>Cevap oluşturuluyor...</i>
+                        </div>
+                        """, unsafe_allow_html=True)
+                        answer = ""
+                        metrics = None
+                        try:
+                            for piece in st.session_state["llm"].stream_response(question, relevant_chunks):
+                                answer += piece
+                                answer_placeholder.markdown(f"""
+                                <div class="chat-message assistant-message">
+                                    <b>Cevap:</b> {answer.strip()}▌
+                                </div>
+                                """, unsafe_allow_html=True)
+                            metrics = st.session_state["llm"].last_generation_stats
+                            if answer_cache_key and answer.strip():
+                                get_answer_cache().store(
+                                    *answer_cache_key, question, retrieval["query_embedding"], answer.strip(),
+                                    metrics["total_seconds"]
+                                )
+                        except Exception as e:
+                            answer = f"Cevap oluşturulurken hata oluştu: {str(e)}"
                     
                     # Cevabı kaydet
                     st.session_state["chat_history"].append({
                         "role": "assistant",
-                        "content": answer
+                        "content": answer.strip(),
+                        "metrics": metrics
                     })
                     
                     # Sayfayı yenile (son eklenen mesajları göstermek için)
@@ -457,4 +664,9 @@ with tab4:
         else:
             st.warning("Soru sormadan önce LLM modelini yükleyin ve RAG indeksini hazırlayın.")
     else:
-        st.warning("Henüz hiç RAG indeksi oluşturulmamış. Önce 'RAG Hazırla' sekmesinden bir indeks oluşturun.")
\ No newline at end of file
+        st.warning("Henüz hiç RAG indeksi oluşturulmamış. Önce 'RAG Hazırla' sekmesinden bir indeks oluşturun.")
+
+# Devam eden işler varsa durumlarını düzenli olarak yenile
+if active_jobs:
+    time.sleep(2)
+    st.rerun()
@@ -4,121 +4,486 @@ This module handles transcribing audio files to text.
 """
 
 import os
-import subprocess
-import sys
-import torch
 import time
 import shutil
+import json
+import threading
+from collections import OrderedDict
+from functools import lru_cache
 
-def install_packages():
-    """Install required packages if not already installed."""
-    packages = ["faster-whisper"]
-    
-    for package in packages:
-        try:
-            if package == "faster-whisper":
-                import faster_whisper
-                print("✅ faster-whisper already installed.")
-            else:
-                __import__(package.replace("-", "_"))
-                print(f"✅ {package} already installed.")
-        except ImportError:
-            print(f"📦 Installing {package}...")
-            try:
-                subprocess.check_call([sys.executable, "-m", "pip", "install", package])
-                print(f"✅ {package} installed successfully.")
-            except Exception as e:
-                print(f"❌ Failed to install {package}: {e}")
-                return False
-    return True
+from transcript_format import segment_to_dict, append_segments, write_transcript
+from file_utils import file_sha256
+from capabilities import require
+
+# Persistent on-disk store for converted Whisper models
+WHISPER_MODEL_DIR = "./models/whisper"
+MODEL_MANIFEST_NAME = "manifest.json"
+REQUIRED_MODEL_FILES = ["model.bin", "config.json", "tokenizer.json"]
+
+# Transcription modes: sequential, batched (faster, slightly less accurate) and multi-process
+TRANSCRIPTION_MODES = ["standard", "throughput", "parallel"]
+DEFAULT_BEAM_SIZES = {"standard": 5, "throughput": 1, "parallel": 5}
+DEFAULT_BATCH_SIZE = 16
+
+# Parallel mode: audio is decoded at 16 kHz and windows are padded at silence cuts
+SAMPLING_RATE = 16000
+WINDOW_PADDING_SECONDS = 0.2
 
-def create_safe_temp_dir():
-    """Create a safe temporary directory for intermediate files."""
-    base_dir = "./temp_whisper"
-    # Create with timestamp to avoid conflicts
-    temp_dir = f"{base_dir}_{int(time.time())}"
+# RAM budget for loaded Whisper models kept in this process
+WHISPER_RAM_BUDGET_MB = int(os.environ.get("WHISPER_RAM_BUDGET_MB", "6144"))
+
+# Loaded models keyed by (model_size, device, compute_type), least recently used first
+_model_registry = OrderedDict()
+_model_memory_mb = {}
+_registry_lock = threading.Lock()
+# One lock per model download/load, so a long download only blocks callers waiting for that model
+_model_locks = {}
+
+def _model_lock(key):
+    with _registry_lock:
+        return _model_locks.setdefault(key, threading.Lock())
+
+def write_model_manifest(model_dir):
+    """
+    Record size and SHA-256 of every file in a downloaded model directory.
     
-    if not os.path.exists(temp_dir):
-        os.makedirs(temp_dir)
+    Args:
+        model_dir (str): Directory holding the converted model files
+        
+    Returns:
+        dict: The manifest that was written
+    """
+    files = {}
+    for name in sorted(os.listdir(model_dir)):
+        path = os.path.join(model_dir, name)
+        if name == MODEL_MANIFEST_NAME or not os.path.isfile(path):
+            continue
+        files[name] = {"size": os.path.getsize(path), "sha256": file_sha256(path)}
     
-    print(f"📁 Created temporary directory: {temp_dir}")
-    return temp_dir
+    manifest = {"created": int(time.time()), "files": files}
+    with open(os.path.join(model_dir, MODEL_MANIFEST_NAME), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
 
-def cleanup_temp_dir(temp_dir):
-    """Clean up temporary directory."""
+def verify_model_dir(model_dir, check_hashes=False):
+    """
+    Check that a stored model is complete and matches its manifest.
+    
+    File sizes are always compared; hashing the weights is optional because
+    it reads the whole model from disk.
+    
+    Args:
+        model_dir (str): Directory holding the converted model files
+        check_hashes (bool): Also compare SHA-256 hashes
+        
+    Returns:
+        bool: True if the model can be used as-is
+    """
+    manifest_path = os.path.join(model_dir, MODEL_MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        return False
+    
     try:
-        if os.path.exists(temp_dir):
-            shutil.rmtree(temp_dir)
-            print(f"🧹 Cleaned up temporary directory: {temp_dir}")
-    except Exception as e:
-        print(f"⚠️ Failed to clean up temporary directory: {e}")
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            files = json.load(f)["files"]
+    except (ValueError, KeyError, OSError):
+        return False
+    
+    for name in REQUIRED_MODEL_FILES:
+        if name not in files:
+            return False
+    
+    for name, entry in files.items():
+        path = os.path.join(model_dir, name)
+        if not os.path.exists(path) or os.path.getsize(path) != entry["size"]:
+            return False
+        if check_hashes and file_sha256(path) != entry["sha256"]:
+            return False
+    return True
 
-def transcribe_audio(audio_path, model_size="medium"):
+def ensure_whisper_model(model_size, model_dir=WHISPER_MODEL_DIR, check_hashes=False):
     """
-    Transcribe audio file using Whisper model.
+    Return the local path of a Whisper model, downloading it only if missing or corrupt.
     
     Args:
-        audio_path (str): Path to audio file
         model_size (str): Whisper model size (options: tiny, base, small, medium, large-v2)
+        model_dir (str): Root directory of the persistent model store
+        check_hashes (bool): Verify SHA-256 hashes of a stored model
         
     Returns:
-        list: List of transcribed text segments
+        str: Directory containing the model files
+    """
+    from faster_whisper.utils import download_model
+    
+    local_path = os.path.join(model_dir, model_size)
+    with _model_lock(os.path.abspath(local_path)):
+        return _ensure_model_dir(model_size, local_path, download_model, check_hashes)
+
+def _ensure_model_dir(model_size, local_path, download_model, check_hashes):
+    if verify_model_dir(local_path, check_hashes=check_hashes):
+        return local_path
+    
+    if os.path.exists(local_path):
+        print(f"⚠️ Stored model {model_size} is incomplete or corrupt, downloading again...")
+        shutil.rmtree(local_path)
+    
+    os.makedirs(local_path)
+    print(f"📥 Downloading Whisper model ({model_size}) to {local_path}...")
+    download_model(model_size, output_dir=local_path)
+    
+    missing = [name for name in REQUIRED_MODEL_FILES
+               if not os.path.exists(os.path.join(local_path, name))]
+    if missing:
+        shutil.rmtree(local_path)
+        raise FileNotFoundError(f"❌ Downloaded model is missing files: {', '.join(missing)}")
+    
+    write_model_manifest(local_path)
+    print(f"✅ Whisper model stored at: {local_path}")
+    return local_path
+
+@lru_cache(maxsize=1)
+def get_device_and_compute_type():
+    """Determine the device and compute type used for Whisper models."""
+    # Ask CTranslate2, which runs the Whisper models, instead of importing torch just for this check
+    try:
+        import ctranslate2
+        if ctranslate2.get_cuda_device_count() > 0:
+            return "cuda", "float16"
+    except ImportError:
+        pass
+    return "cpu", "int8"
+
+def estimate_model_memory_mb(model_dir):
+    """Estimate the RAM a loaded model needs from the size of its weights file."""
+    return os.path.getsize(os.path.join(model_dir, "model.bin")) / (1024 * 1024)
+
+def get_whisper_model(model_size, device=None, compute_type=None, model_dir=WHISPER_MODEL_DIR):
     """
-    # Install packages if needed
-    if not install_packages():
-        raise ImportError("Failed to install required packages")
+    Get a loaded WhisperModel, reusing an instance already held by this process.
     
-    # Import after ensuring it's installed
+    Models are kept per (model_size, device, compute_type). When loading a new
+    model would exceed WHISPER_RAM_BUDGET_MB, the least recently used models are
+    released first.
+    
+    Args:
+        model_size (str): Whisper model size
+        device (str): "cuda" or "cpu" (detected if None)
+        compute_type (str): CTranslate2 compute type (detected if None)
+        model_dir (str): Root directory of the persistent model store
+        
+    Returns:
+        WhisperModel: The loaded model
+    """
     from faster_whisper import WhisperModel
     
+    default_device, default_compute_type = get_device_and_compute_type()
+    device = device or default_device
+    compute_type = compute_type or default_compute_type
+    key = (model_size, device, compute_type)
+    
+    model = _registered_model(key)
+    if model is not None:
+        return model
+    
+    # Downloading and loading happen outside the registry lock; only callers of this model wait
+    with _model_lock(key):
+        model = _registered_model(key)
+        if model is not None:
+            return model
+        
+        local_path = ensure_whisper_model(model_size, model_dir)
+        needed_mb = estimate_model_memory_mb(local_path)
+        with _registry_lock:
+            while _model_registry and sum(_model_memory_mb.values()) + needed_mb > WHISPER_RAM_BUDGET_MB:
+                old_key, _ = _model_registry.popitem(last=False)
+                _model_memory_mb.pop(old_key, None)
+                print(f"🧹 Unloaded Whisper model {old_key[0]} ({old_key[1]}, {old_key[2]}) to stay within RAM budget")
+        
+        print(f"🧠 Loading Whisper model ({model_size}) on {'GPU' if device == 'cuda' else 'CPU'}...")
+        model = WhisperModel(local_path, device=device, compute_type=compute_type)
+        with _registry_lock:
+            _model_registry[key] = model
+            _model_memory_mb[key] = needed_mb
+        return model
+
+def _registered_model(key):
+    """Return a loaded model from the registry (marking it recently used), or None."""
+    with _registry_lock:
+        if key not in _model_registry:
+            return None
+        _model_registry.move_to_end(key)
+        print(f"♻️ Reusing loaded Whisper model ({key[0]}, {key[1]}, {key[2]})")
+        return _model_registry[key]
+
+def unload_whisper_models():
+    """Release every Whisper model held by this process."""
+    with _registry_lock:
+        _model_registry.clear()
+        _model_memory_mb.clear()
+
+def iter_transcribe_audio(audio_path, model_size="medium", output_path=None, mode="standard",
+                          beam_size=None, batch_size=DEFAULT_BATCH_SIZE, progress_callback=None):
+    """
+    Transcribe audio file, yielding segments as soon as Whisper produces them.
+    
+    Args:
+        audio_path (str): Path to audio file
+        model_size (str): Whisper model size (options: tiny, base, small, medium, large-v2)
+        output_path (str): Optional .jsonl transcript file; each segment is appended
+            and flushed as it arrives, so a crash keeps the work done so far
+        mode (str): "standard" (sequential decoding), "throughput" (batched
+            decoding of VAD-filtered speech, faster but slightly less accurate)
+            or "parallel" (see transcribe_audio_parallel; segments arrive once
+            every window is done)
+        beam_size (int): Beam size (defaults to the mode's setting)
+        batch_size (int): Batch size for the throughput mode
+        progress_callback (callable): Called with the fraction of audio transcribed
+        
+    Yields:
+        dict: Segment record (start, end, text, avg_logprob, language)
+    """
+    if mode not in TRANSCRIPTION_MODES:
+        raise ValueError(f"Unknown transcription mode: {mode} (options: {', '.join(TRANSCRIPTION_MODES)})")
+    require("transcribe")
+    
+    if mode == "parallel":
+        for record in transcribe_audio_parallel(audio_path, model_size, output_path=output_path, beam_size=beam_size):
+            yield record
+        return
+    
     # Verify the audio file exists
     if not os.path.exists(audio_path):
         raise FileNotFoundError(f"❌ Audio file not found: {audio_path}")
     
-    # Create temporary directory for any intermediate files
-    temp_dir = create_safe_temp_dir()
-    
+    output_file = open(output_path, "w", encoding="utf-8") if output_path else None
     try:
-        print(f"🧠 Loading Whisper model ({model_size}) on {'GPU' if torch.cuda.is_available() else 'CPU'}...")
-        
-        # Determine device and compute type
-        device = "cuda" if torch.cuda.is_available() else "cpu"
-        compute_type = "float16" if torch.cuda.is_available() else "int8"
-        
-        # Set download directory for model files
-        # This helps avoid problems with special characters in paths
-        os.environ["XDG_CACHE_HOME"] = temp_dir
-        os.environ["HF_HOME"] = os.path.join(temp_dir, "huggingface")
-        
-        # Initialize the model with safe download paths
-        model = WhisperModel(
-            model_size, 
-            device=device, 
-            compute_type=compute_type,
-            download_root=os.path.join(temp_dir, "models")
-        )
-        
-        print("📝 Transcribing audio...")
-        segments, info = model.transcribe(
-            audio_path, 
-            beam_size=5,
-            word_timestamps=False  # Set to True if you want word-level timestamps
-        )
-        
-        # Collect segments
-        transcript_segments = []
+        # Loaded once per process and reused by later transcriptions
+        model = get_whisper_model(model_size)
+        
+        beam_size = beam_size or DEFAULT_BEAM_SIZES[mode]
+        
+        # faster-whisper decodes lazily while the returned generator is consumed
+        if mode == "throughput":
+            try:
+                from faster_whisper import BatchedInferencePipeline
+            except ImportError:
+                raise ImportError("Throughput mode requires faster-whisper>=1.1.0")
+            
+            print(f"📝 Transcribing audio in batches of {batch_size}...")
+            segments, info = BatchedInferencePipeline(model=model).transcribe(
+                audio_path,
+                batch_size=batch_size,
+                beam_size=beam_size,
+                vad_filter=True,
+                word_timestamps=False
+            )
+        else:
+            print("📝 Transcribing audio...")
+            segments, info = model.transcribe(
+                audio_path, 
+                beam_size=beam_size,
+                word_timestamps=False  # Set to True if you want word-level timestamps
+            )
+        
+        segment_count = 0
         for segment in segments:
-            transcript_segments.append(segment.text)
+            record = segment_to_dict(segment, info.language)
+            if output_file:
+                append_segments(output_file, [record])
+                output_file.flush()
+            segment_count += 1
+            if progress_callback and info.duration:
+                progress_callback(min(1.0, segment.end / info.duration))
+            yield record
         
-        print(f"✅ Transcription complete! Found {len(transcript_segments)} segments.")
-        return transcript_segments
+        print(f"✅ Transcription complete! Found {segment_count} segments.")
         
     except Exception as e:
         print(f"❌ Transcription error: {str(e)}")
         raise
     finally:
-        # Always clean up temporary directory
-        cleanup_temp_dir(temp_dir)
+        if output_file:
+            output_file.close()
+
+def transcribe_audio_segments(audio_path, model_size="medium", output_path=None, mode="standard", **options):
+    """
+    Transcribe audio file into timestamped segments.
+    
+    Args:
+        audio_path (str): Path to audio file
+        model_size (str): Whisper model size (options: tiny, base, small, medium, large-v2)
+        output_path (str): Optional .jsonl transcript file written while transcribing
+        mode (str): One of TRANSCRIPTION_MODES
+        **options: Mode settings (beam_size, batch_size, num_workers, cpu_threads, window_seconds)
+        
+    Returns:
+        list: Segment records (start, end, text, avg_logprob, language)
+    """
+    if mode not in TRANSCRIPTION_MODES:
+        raise ValueError(f"Unknown transcription mode: {mode} (options: {', '.join(TRANSCRIPTION_MODES)})")
+    if mode == "parallel":
+        return transcribe_audio_parallel(audio_path, model_size, output_path=output_path, **options)
+    return list(iter_transcribe_audio(audio_path, model_size, output_path, mode=mode, **options))
+
+def transcribe_audio(audio_path, model_size="medium"):
+    """
+    Transcribe audio file using Whisper model.
+    
+    Args:
+        audio_path (str): Path to audio file
+        model_size (str): Whisper model size (options: tiny, base, small, medium, large-v2)
+        
+    Returns:
+        list: List of transcribed text segments
+    """
+    return [segment["text"] for segment in transcribe_audio_segments(audio_path, model_size)]
+
+# Model loaded once in each worker process of the parallel mode
+_worker_model = None
+
+def split_audio_on_silence(audio, window_seconds=300, sampling_rate=SAMPLING_RATE):
+    """
+    Split decoded audio into windows that end in silence.
+    
+    Speech regions found by the Silero VAD are grouped until a window would
+    exceed window_seconds, so no cut falls in the middle of speech.
+    
+    Args:
+        audio (numpy.ndarray): 16 kHz mono audio
+        window_seconds (float): Maximum window length
+        sampling_rate (int): Sample rate of the audio
+        
+    Returns:
+        list: (start_sample, end_sample) tuples in order
+    """
+    from faster_whisper.vad import VadOptions, get_speech_timestamps
+    
+    speech = get_speech_timestamps(audio, VadOptions(min_silence_duration_ms=500))
+    max_samples = int(window_seconds * sampling_rate)
+    pad = int(WINDOW_PADDING_SECONDS * sampling_rate)
+    
+    windows = []
+    window_start, window_end = None, None
+    for region in speech:
+        if window_start is not None and region["end"] - window_start > max_samples:
+            windows.append((window_start, window_end))
+            window_start = None
+        if window_start is None:
+            window_start = max(0, region["start"] - pad)
+        window_end = min(len(audio), region["end"] + pad)
+    
+    if window_start is not None:
+        windows.append((window_start, window_end))
+    return windows
+
+def _init_parallel_worker(model_path, cpu_threads):
+    """Load the Whisper model once per worker process."""
+    global _worker_model
+    from faster_whisper import WhisperModel
+    
+    _worker_model = WhisperModel(model_path, device="cpu", compute_type="int8", cpu_threads=cpu_threads)
+
+def _transcribe_window(window_audio, offset_seconds, beam_size):
+    """Transcribe one window in a worker process and shift timestamps to the full file."""
+    segments, info = _worker_model.transcribe(window_audio, beam_size=beam_size, word_timestamps=False)
+    records = []
+    for segment in segments:
+        record = segment_to_dict(segment, info.language)
+        record["start"] = round(record["start"] + offset_seconds, 3)
+        record["end"] = round(record["end"] + offset_seconds, 3)
+        records.append(record)
+    return records
+
+def _normalize_segment_text(text):
+    return " ".join(text.lower().split())
+
+def merge_window_segments(window_results):
+    """
+    Merge per-window segments in order, dropping repeats at window boundaries.
+    
+    Windows are padded, so the same words can be decoded at the end of one
+    window and the start of the next. A segment that starts before the previous
+    one ended and repeats its text is dropped.
+    
+    Args:
+        window_results (list): Segment record lists, one per window, in order
+        
+    Returns:
+        list: Merged segment records
+    """
+    merged = []
+    for records in window_results:
+        for record in records:
+            if merged:
+                previous = merged[-1]
+                overlaps = record["start"] < previous["end"] - 0.05
+                text = _normalize_segment_text(record["text"])
+                previous_text = _normalize_segment_text(previous["text"])
+                if overlaps and text and (text in previous_text or previous_text in text):
+                    if len(text) > len(previous_text):
+                        merged[-1] = record
+                    continue
+            merged.append(record)
+    return merged
+
+def get_parallel_budget(num_workers=None, cpu_threads=None):
+    """Split the available CPU cores between worker processes and their decoding threads."""
+    cores = os.cpu_count() or 1
+    if num_workers is None:
+        num_workers = max(1, cores // (cpu_threads or 4))
+    if cpu_threads is None:
+        cpu_threads = max(1, cores // num_workers)
+    return num_workers, cpu_threads
+
+def transcribe_audio_parallel(audio_path, model_size="medium", num_workers=None, cpu_threads=None,
+                              window_seconds=300, output_path=None, beam_size=None):
+    """
+    Transcribe a long audio file on CPU by decoding silence-separated windows in parallel.
+    
+    Args:
+        audio_path (str): Path to audio file
+        model_size (str): Whisper model size (options: tiny, base, small, medium, large-v2)
+        num_workers (int): Worker processes (defaults to cores / cpu_threads)
+        cpu_threads (int): Decoding threads per worker (defaults to cores / num_workers)
+        window_seconds (float): Maximum length of one window
+        output_path (str): Optional .jsonl transcript file written when done
+        beam_size (int): Beam size (defaults to the parallel mode's setting)
+        
+    Returns:
+        list: Segment records (start, end, text, avg_logprob, language) in order
+    """
+    require("transcribe")
+    from concurrent.futures import ProcessPoolExecutor
+    from faster_whisper.audio import decode_audio
+    
+    # Verify the audio file exists
+    if not os.path.exists(audio_path):
+        raise FileNotFoundError(f"❌ Audio file not found: {audio_path}")
+    
+    # Download once in the parent so workers only load from the store
+    model_path = ensure_whisper_model(model_size)
+    num_workers, cpu_threads = get_parallel_budget(num_workers, cpu_threads)
+    
+    print("🔊 Decoding audio and detecting silence...")
+    audio = decode_audio(audio_path, sampling_rate=SAMPLING_RATE)
+    windows = split_audio_on_silence(audio, window_seconds)
+    print(f"📝 Transcribing {len(windows)} windows with {num_workers} workers x {cpu_threads} threads...")
+    
+    with ProcessPoolExecutor(max_workers=num_workers, initializer=_init_parallel_worker,
+                             initargs=(model_path, cpu_threads)) as executor:
+        futures = [
+            executor.submit(_transcribe_window, audio[start:end], start / SAMPLING_RATE,
+                            beam_size or DEFAULT_BEAM_SIZES["parallel"])
+            for start, end in windows
+        ]
+        window_results = [future.result() for future in futures]
+    
+    transcript_segments = merge_window_segments(window_results)
+    if output_path:
+        write_transcript(output_path, transcript_segments)
+    
+    print(f"✅ Transcription complete! Found {len(transcript_segments)} segments.")
+    return transcript_segments
 
 # Test function
 if __name__ == "__main__":
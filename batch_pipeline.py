@@ -0,0 +1,253 @@
+"""
+Headless batch pipeline.
+Runs download -> transcribe -> index for a list of URLs or a playlist/channel,
+with the stages overlapped and a resumable manifest.
+
+Usage:
+    python batch_pipeline.py urls.txt
+    python batch_pipeline.py "https://www.youtube.com/playlist?list=..." --download-workers 4
+"""
+
+import os
+import json
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from capabilities import get_capabilities
+from pipeline import run_download, run_transcribe, run_index
+from embedding_cache import get_embedding_cache
+
+STAGES = ["download", "transcribe", "index"]
+
+class StageProgress:
+    """Minimal job context for stage handlers run outside the job queue."""
+
+    def __init__(self, url, stage):
+        self.url = url
+        self.stage = stage
+
+    def update(self, progress=None, message=None):
+        if message:
+            print(f"   [{self.stage}] {self.url}: {message}")
+
+    def check_cancelled(self):
+        pass
+
+def read_sources(source):
+    """
+    Turn the CLI source argument into a list of video URLs.
+
+    Args:
+        source (str): A text file with one URL per line, or a video/playlist/channel URL
+
+    Returns:
+        list: Video URLs in order, without duplicates
+    """
+    from youtube_downloader import expand_playlist, is_collection_url
+
+    if os.path.exists(source):
+        with open(source, "r", encoding="utf-8") as f:
+            entries = [line.strip() for line in f if line.strip() and not line.startswith("#")]
+    else:
+        entries = [source]
+
+    urls = []
+    for entry in entries:
+        # Expanding a single video would cost a metadata request per URL
+        for url in (expand_playlist(entry) if is_collection_url(entry) else [entry]):
+            if url not in urls:
+                urls.append(url)
+    return urls
+
+def caption_savings(items):
+    """
+    Summarize how many items used captions instead of Whisper and the time that saved.
+
+    The Whisper time of captioned items is estimated from the real-time factor
+    of the items Whisper transcribed in the same run.
+
+    Returns:
+        dict: Items per transcript source, Whisper real-time factor and estimated seconds saved
+    """
+    transcribed = [item for item in items if "transcribe" in item["stages"]]
+    by_source = {"captions": [], "whisper": []}
+    for item in transcribed:
+        by_source.setdefault(item["stages"]["transcribe"].get("source", "whisper"), []).append(item)
+
+    whisper_audio = sum(item["stages"]["transcribe"].get("audio_seconds", 0) for item in by_source["whisper"])
+    whisper_seconds = sum(item["timings"].get("transcribe", 0) for item in by_source["whisper"])
+    rtf = whisper_seconds / whisper_audio if whisper_audio else None
+
+    saved = None
+    if rtf is not None:
+        saved = sum(item["stages"]["transcribe"].get("audio_seconds", 0) * rtf - item["timings"].get("transcribe", 0)
+                    for item in by_source["captions"])
+    return {
+        "items_from_captions": len(by_source["captions"]),
+        "items_from_whisper": len(by_source["whisper"]),
+        "whisper_rtf": round(rtf, 3) if rtf is not None else None,
+        "estimated_seconds_saved": round(saved, 2) if saved is not None else None,
+    }
+
+class BatchPipeline:
+    def __init__(self, manifest_path, workers, options):
+        """
+        Initialize the pipeline and load the manifest of a previous run, if any.
+
+        Args:
+            manifest_path (str): JSON file recording each item's progress
+            workers (dict): Parallel workers per stage
+            options (dict): Stage parameters (output_dir, audio_format, caption_policy, model_size, mode)
+        """
+        self.manifest_path = manifest_path
+        self.options = options
+        self.lock = threading.Lock()
+        self.manifest = {"items": {}}
+        if os.path.exists(manifest_path):
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                self.manifest = json.load(f)
+        self.executors = {stage: ThreadPoolExecutor(max_workers=workers[stage], thread_name_prefix=stage)
+                          for stage in STAGES}
+        self.pending = 0
+        self.done = threading.Condition(self.lock)
+
+    def run(self, urls):
+        """Run every URL through the remaining stages and return the report."""
+        start_time = time.time()
+        for url in urls:
+            item = self.manifest["items"].setdefault(url, {"url": url, "stages": {}, "timings": {}})
+            self._schedule_next(item)
+
+        with self.done:
+            while self.pending:
+                self.done.wait()
+        for executor in self.executors.values():
+            executor.shutdown()
+
+        items = [self.manifest["items"][url] for url in urls]
+        return {
+            "total_seconds": round(time.time() - start_time, 2),
+            "items": len(items),
+            "completed": sum(1 for item in items if item.get("status") == "completed"),
+            "failed": sum(1 for item in items if item.get("status") == "failed"),
+            "stage_seconds": {
+                stage: round(sum(item["timings"].get(stage, 0) for item in items), 2) for stage in STAGES
+            },
+            "captions": caption_savings(items),
+            "embedding_cache": get_embedding_cache().stats(),
+            "per_item": items,
+        }
+
+    def _schedule_next(self, item):
+        # Completed stages recorded in the manifest are skipped on resume
+        for stage in STAGES:
+            if stage not in item["stages"]:
+                if stage == "index" and item["stages"]["transcribe"].get("index_path"):
+                    item["stages"]["index"] = {"index_path": item["stages"]["transcribe"]["index_path"]}
+                    continue
+                with self.lock:
+                    self.pending += 1
+                    item["status"] = f"{stage}_queued"
+                self.executors[stage].submit(self._run_stage, item, stage)
+                return
+        with self.lock:
+            item["status"] = "completed"
+            self._save_manifest()
+
+    def _run_stage(self, item, stage):
+        url = item["url"]
+        start_time = time.time()
+        try:
+            print(f"▶️ {stage}: {url}")
+            result = self._call_handler(item, stage, StageProgress(url, stage))
+            with self.lock:
+                item["stages"][stage] = result
+                item["timings"][stage] = round(time.time() - start_time, 2)
+                item.pop("error", None)
+                self._save_manifest()
+            self._schedule_next(item)
+        except Exception as e:
+            print(f"❌ {stage} failed for {url}: {e}")
+            with self.lock:
+                item["status"] = "failed"
+                item["error"] = f"{stage}: {str(e)}"
+                item["timings"][stage] = round(time.time() - start_time, 2)
+                self._save_manifest()
+        finally:
+            with self.done:
+                self.pending -= 1
+                self.done.notify_all()
+
+    def _call_handler(self, item, stage, progress):
+        if stage == "download":
+            return run_download({"url": item["url"], "output_dir": self.options["output_dir"],
+                                 "audio_format": self.options["audio_format"],
+                                 "caption_policy": self.options["caption_policy"]}, progress)
+        if stage == "transcribe":
+            return run_transcribe({
+                "audio_path": item["stages"]["download"]["audio_path"],
+                "captions_path": item["stages"]["download"].get("captions_path"),
+                "model_size": self.options["model_size"],
+                "mode": self.options["mode"],
+                "build_index": self.options["index_while_transcribing"],
+            }, progress)
+        return run_index({"transcript_path": item["stages"]["transcribe"]["transcript_path"]}, progress)
+
+    def _save_manifest(self):
+        # Write then rename so an interrupted run never leaves a truncated manifest
+        temp_path = self.manifest_path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(self.manifest, f, ensure_ascii=False, indent=2)
+        os.replace(temp_path, self.manifest_path)
+
+def main():
+    parser = argparse.ArgumentParser(description="Download, transcribe and index YouTube videos in bulk")
+    parser.add_argument("source", help="Text file with one URL per line, or a video/playlist/channel URL")
+    parser.add_argument("--manifest", default="./batch_manifest.json", help="Progress file used to resume")
+    parser.add_argument("--report", default="./batch_report.json", help="JSON report of per-item timings")
+    parser.add_argument("--output-dir", default="./audios")
+    parser.add_argument("--audio-format", default="native", choices=["native", "wav16k", "mp3"],
+                        help="native/wav16k skip the lossy MP3 round trip before transcription")
+    parser.add_argument("--caption-policy", default="manual", choices=["manual", "auto", "asr"],
+                        help="Use manual captions, also automatic captions, or always Whisper")
+    parser.add_argument("--model-size", default="medium")
+    parser.add_argument("--mode", default="standard", choices=["standard", "throughput", "parallel"])
+    parser.add_argument("--index-while-transcribing", action="store_true",
+                        help="Build the RAG index during transcription instead of as a separate stage")
+    parser.add_argument("--download-workers", type=int, default=3)
+    parser.add_argument("--transcribe-workers", type=int, default=1)
+    parser.add_argument("--index-workers", type=int, default=1)
+    args = parser.parse_args()
+
+    for directory in [args.output_dir, "./transcripts", "./rag_indexes"]:
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+    # Report missing backends once up front instead of failing item by item
+    get_capabilities()
+
+    urls = read_sources(args.source)
+    print(f"📋 {len(urls)} videos to process")
+
+    pipeline = BatchPipeline(
+        args.manifest,
+        {"download": args.download_workers, "transcribe": args.transcribe_workers, "index": args.index_workers},
+        {"output_dir": args.output_dir, "audio_format": args.audio_format, "caption_policy": args.caption_policy,
+         "model_size": args.model_size, "mode": args.mode,
+         "index_while_transcribing": args.index_while_transcribing},
+    )
+    report = pipeline.run(urls)
+
+    with open(args.report, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"✅ {report['completed']}/{report['items']} completed in {report['total_seconds']}s, "
+          f"report saved to {args.report}")
+    captions = report["captions"]
+    if captions["items_from_captions"]:
+        print(f"💬 {captions['items_from_captions']} transcripts came from captions, "
+              f"estimated Whisper time saved: {captions['estimated_seconds_saved']}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,699 @@
+"""
+Benchmarks for the content assistant pipeline.
+Run with: python benchmark.py <benchmark> [options]
+"""
+
+import argparse
+import difflib
+import json
+import os
+import re
+import sys
+import time
+
+AUDIO_EXTENSIONS = (".mp3", ".wav", ".m4a", ".ogg", ".opus", ".webm")
+
+# Project modules app.py imports before the page renders
+APP_MODULES = ("youtube_downloader", "audio_transcriber", "transcript_format", "rag_helper", "global_index",
+               "embedding_cache", "prompt_cache", "answer_cache", "model_manager", "pipeline",
+               "capabilities")
+# Packages that must only be imported when the feature using them runs
+HEAVY_MODULES = ("torch", "transformers", "sentence_transformers", "faiss", "langchain", "llama_cpp",
+                 "faster_whisper", "ctranslate2", "yt_dlp", "pandas")
+
+def report_results(results, output_path=None):
+    """Print benchmark results and optionally save them as JSON."""
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+    if output_path:
+        with open(output_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+        print(f"✅ Results saved to: {output_path}")
+
+def benchmark_parallel_transcription(audio_path, model_size="medium", num_workers=None, cpu_threads=None,
+                                     window_seconds=300):
+    """
+    Compare the single-stream transcription path with the parallel windowed one.
+
+    Args:
+        audio_path (str): Audio file to transcribe
+        model_size (str): Whisper model size
+        num_workers (int): Worker processes for the parallel mode
+        cpu_threads (int): Decoding threads per worker
+        window_seconds (float): Maximum window length for the parallel mode
+
+    Returns:
+        dict: Wall times, real-time factors, speedup and text similarity
+    """
+    from faster_whisper.audio import decode_audio
+    from audio_transcriber import (SAMPLING_RATE, ensure_whisper_model, get_parallel_budget,
+                                   transcribe_audio_segments, transcribe_audio_parallel)
+
+    duration = len(decode_audio(audio_path, sampling_rate=SAMPLING_RATE)) / SAMPLING_RATE
+    num_workers, cpu_threads = get_parallel_budget(num_workers, cpu_threads)
+    # Keep the one-time download out of both measurements
+    ensure_whisper_model(model_size)
+
+    print("⏱️ Single-stream transcription...")
+    start_time = time.time()
+    single = transcribe_audio_segments(audio_path, model_size)
+    single_seconds = time.time() - start_time
+
+    print("⏱️ Parallel transcription...")
+    start_time = time.time()
+    parallel = transcribe_audio_parallel(audio_path, model_size, num_workers, cpu_threads, window_seconds)
+    parallel_seconds = time.time() - start_time
+
+    single_text = " ".join(segment["text"] for segment in single)
+    parallel_text = " ".join(segment["text"] for segment in parallel)
+    return {
+        "audio_path": audio_path,
+        "audio_seconds": round(duration, 1),
+        "model_size": model_size,
+        "num_workers": num_workers,
+        "cpu_threads": cpu_threads,
+        "single_stream_seconds": round(single_seconds, 2),
+        "single_stream_rtf": round(single_seconds / duration, 3),
+        "parallel_seconds": round(parallel_seconds, 2),
+        "parallel_rtf": round(parallel_seconds / duration, 3),
+        "speedup": round(single_seconds / parallel_seconds, 2),
+        "text_similarity": round(difflib.SequenceMatcher(None, single_text, parallel_text).ratio(), 4),
+    }
+
+def normalize_words(text):
+    """Lowercase text and split it into words without punctuation."""
+    return re.sub(r"[^\w\s]", " ", text.lower()).split()
+
+def word_error_rate(reference, hypothesis):
+    """
+    Compute the word error rate between a reference and a hypothesis transcript.
+
+    Returns:
+        float: (substitutions + deletions + insertions) / reference word count
+    """
+    ref = normalize_words(reference)
+    hyp = normalize_words(hypothesis)
+    if not ref:
+        return 0.0 if not hyp else 1.0
+
+    # Word-level edit distance, one row at a time
+    previous = list(range(len(hyp) + 1))
+    for i, ref_word in enumerate(ref, 1):
+        current = [i] + [0] * len(hyp)
+        for j, hyp_word in enumerate(hyp, 1):
+            current[j] = min(previous[j] + 1, current[j - 1] + 1,
+                             previous[j - 1] + (ref_word != hyp_word))
+        previous = current
+    return previous[-1] / len(ref)
+
+def find_fixtures(fixtures_dir):
+    """Return (audio_path, reference_text) pairs for audio files with a .txt reference next to them."""
+    fixtures = []
+    for name in sorted(os.listdir(fixtures_dir)):
+        base, ext = os.path.splitext(name)
+        reference_path = os.path.join(fixtures_dir, base + ".txt")
+        if ext.lower() in AUDIO_EXTENSIONS and os.path.exists(reference_path):
+            with open(reference_path, "r", encoding="utf-8") as f:
+                fixtures.append((os.path.join(fixtures_dir, name), f.read()))
+    return fixtures
+
+def benchmark_asr_modes(fixtures_dir, model_size="medium", modes=("standard", "throughput"),
+                        batch_size=16):
+    """
+    Measure word error rate and speed of each transcription mode on a local fixture set.
+
+    Each fixture is an audio file with a reference transcript of the same name
+    and a .txt extension.
+
+    Args:
+        fixtures_dir (str): Directory holding the fixtures
+        model_size (str): Whisper model size
+        modes (tuple): Transcription modes to compare
+        batch_size (int): Batch size for the throughput mode
+
+    Returns:
+        dict: Per-file and overall WER, wall time and real-time factor per mode
+    """
+    from faster_whisper.audio import decode_audio
+    from audio_transcriber import SAMPLING_RATE, get_whisper_model, transcribe_audio_segments
+
+    fixtures = find_fixtures(fixtures_dir)
+    if not fixtures:
+        raise FileNotFoundError(f"❌ No audio fixtures with .txt references in {fixtures_dir}")
+
+    # Load the model before timing so every mode is measured warm
+    get_whisper_model(model_size)
+
+    results = {"model_size": model_size, "fixtures": len(fixtures), "modes": {}}
+    for mode in modes:
+        options = {"batch_size": batch_size} if mode == "throughput" else {}
+        files = []
+        for audio_path, reference in fixtures:
+            duration = len(decode_audio(audio_path, sampling_rate=SAMPLING_RATE)) / SAMPLING_RATE
+            start_time = time.time()
+            segments = transcribe_audio_segments(audio_path, model_size, mode=mode, **options)
+            seconds = time.time() - start_time
+            hypothesis = " ".join(segment["text"] for segment in segments)
+            files.append({
+                "audio_path": audio_path,
+                "audio_seconds": round(duration, 1),
+                "seconds": round(seconds, 2),
+                "wer": round(word_error_rate(reference, hypothesis), 4),
+            })
+
+        total_audio = sum(item["audio_seconds"] for item in files)
+        total_seconds = sum(item["seconds"] for item in files)
+        results["modes"][mode] = {
+            "mean_wer": round(sum(item["wer"] for item in files) / len(files), 4),
+            "total_seconds": round(total_seconds, 2),
+            "rtf": round(total_seconds / total_audio, 3) if total_audio else None,
+            "files": files,
+        }
+
+    baseline = results["modes"].get("standard")
+    if baseline:
+        for mode, summary in results["modes"].items():
+            summary["speedup_vs_standard"] = round(baseline["total_seconds"] / summary["total_seconds"], 2)
+            summary["wer_delta_vs_standard"] = round(summary["mean_wer"] - baseline["mean_wer"], 4)
+    return results
+
+def benchmark_bulk_download(fixtures_dir, workers=4, audio_format="native"):
+    """
+    Measure concurrent download throughput against a local HTTP server serving fixture media.
+
+    Args:
+        fixtures_dir (str): Directory of media files to serve
+        workers (int): Downloads running at once
+        audio_format (str): Audio format requested from the downloader
+
+    Returns:
+        dict: The download report with per-item throughput
+    """
+    import functools
+    import tempfile
+    import threading
+    from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+    from bulk_downloader import download_many
+
+    handler = functools.partial(SimpleHTTPRequestHandler, directory=fixtures_dir)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        base_url = f"http://127.0.0.1:{server.server_address[1]}"
+        urls = [f"{base_url}/{name}" for name in sorted(os.listdir(fixtures_dir))
+                if name.lower().endswith(AUDIO_EXTENSIONS)]
+        with tempfile.TemporaryDirectory() as output_dir:
+            # The local server is one host, so per-host limits are relaxed to measure the workers
+            return download_many(urls, output_dir, audio_format, max_workers=workers,
+                                 per_host_interval=0, per_host_concurrency=workers, max_retries=1)
+    finally:
+        server.shutdown()
+
+def synthetic_embeddings(num_vectors, dimension, seed=0):
+    """Clustered unit vectors; closer to sentence embeddings than uniform noise."""
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((max(1, num_vectors // 100), dimension), dtype=np.float32)
+    vectors = centers[rng.integers(0, len(centers), num_vectors)]
+    vectors += 0.5 * rng.standard_normal((num_vectors, dimension), dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+def benchmark_ann_indexes(sizes=(10000, 100000, 1000000), dimension=384, index_types=("flat", "hnsw", "ivfpq"),
+                          num_queries=200, top_k=10, nprobe=None, ef_search=None, vectors_path=None):
+    """
+    Measure recall@k against exact search and single-query latency of each index type.
+
+    Args:
+        sizes (tuple): Corpus sizes to test
+        dimension (int): Dimension of synthetic vectors
+        index_types (tuple): Index types to build at every size
+        num_queries (int): Queries per measurement
+        top_k (int): k for recall@k
+        nprobe (int): IVF lists visited per query
+        ef_search (int): HNSW candidate list size
+        vectors_path (str): Optional .npy file of real embeddings, sampled instead of synthetic vectors
+
+    Returns:
+        dict: Per size, the automatic choice and build time, recall@k, p50 and p99 latency per type
+    """
+    import numpy as np
+    from index_builder import build_index, choose_index_type, estimate_index_memory_mb
+
+    real_vectors = np.load(vectors_path).astype("float32") if vectors_path else None
+    results = {"top_k": top_k, "queries": num_queries, "sizes": {}}
+    for size in sizes:
+        if real_vectors is not None:
+            size = min(size, len(real_vectors))
+            vectors = real_vectors[:size]
+        else:
+            vectors = synthetic_embeddings(size, dimension)
+        rng = np.random.default_rng(1)
+        queries = vectors[rng.choice(size, num_queries, replace=False)]
+        queries = queries + 0.05 * rng.standard_normal(queries.shape, dtype=np.float32)
+
+        print(f"⏱️ {size} vectors: exact baseline...")
+        _, exact = build_index(vectors, index_type="flat", encoding="float32").search(queries, top_k)
+
+        size_results = {"auto_choice": choose_index_type(size, vectors.shape[1]), "index_types": {}}
+        for index_type in index_types:
+            print(f"⏱️ {size} vectors: {index_type}...")
+            start_time = time.time()
+            index = build_index(vectors, index_type=index_type, nprobe=nprobe, ef_search=ef_search)
+            build_seconds = time.time() - start_time
+
+            latencies, recalls = [], []
+            for query, expected in zip(queries, exact):
+                start_time = time.perf_counter()
+                _, found = index.search(query.reshape(1, -1), top_k)
+                latencies.append((time.perf_counter() - start_time) * 1000)
+                recalls.append(len(set(found[0]) & set(expected)) / top_k)
+
+            size_results["index_types"][index_type] = {
+                "build_seconds": round(build_seconds, 2),
+                "estimated_memory_mb": round(estimate_index_memory_mb(index_type, size, vectors.shape[1]), 1),
+                f"recall@{top_k}": round(float(np.mean(recalls)), 4),
+                "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+                "p99_ms": round(float(np.percentile(latencies, 99)), 3),
+            }
+        results["sizes"][size] = size_results
+    return results
+
+def benchmark_retrieval_quality(transcripts_dir, top_k=5, encodings=("float32", "float16", "int8"),
+                                min_recall=0.95, max_queries=500):
+    """
+    Check that normalized, compressed indexes retrieve what exact search does.
+
+    Every chunk of the .jsonl transcripts in transcripts_dir gives one query:
+    its longest sentence. For each encoding the benchmark reports recall@k
+    against exact float32 inner-product search, how often the query's own
+    chunk is retrieved (also for the old raw-L2 setup), and the index size.
+
+    Args:
+        transcripts_dir (str): Directory of .jsonl transcripts
+        top_k (int): k for recall@k
+        encodings (tuple): Vector encodings to check
+        min_recall (float): Lowest acceptable recall@k of any encoding
+        max_queries (int): Upper bound on the number of queries
+
+    Returns:
+        dict: Per-encoding results and whether every encoding passed
+    """
+    import faiss
+    import numpy as np
+    from rag_helper import RAGProcessor
+    from transcript_format import TRANSCRIPT_EXTENSION, read_transcript
+    from index_builder import build_index
+
+    processor = RAGProcessor()
+    chunks = []
+    for name in sorted(os.listdir(transcripts_dir)):
+        if name.endswith(TRANSCRIPT_EXTENSION):
+            chunks.extend(processor.chunk_segments(read_transcript(os.path.join(transcripts_dir, name)))[0])
+    if not chunks:
+        raise FileNotFoundError(f"❌ No .jsonl transcripts in {transcripts_dir}")
+
+    sources = list(range(0, len(chunks), max(1, len(chunks) // max_queries)))[:max_queries]
+    queries = [max(re.split(r"(?<=[.!?])\s+", chunks[i]), key=len) for i in sources]
+
+    embeddings = processor.embedder.encode(chunks)
+    query_embeddings = processor.embedder.encode(queries, use_cache=False)
+    _, exact = build_index(embeddings, index_type="flat", encoding="float32").search(query_embeddings, top_k)
+
+    def source_hit_rate(found):
+        return round(sum(source in row for source, row in zip(sources, found)) / len(sources), 4)
+
+    # The previous setup: raw embeddings in an L2 index
+    raw_index = faiss.IndexFlatL2(embeddings.shape[1])
+    raw_index.add(np.array(processor.embedding_model.encode(chunks), dtype="float32"))
+    _, raw_found = raw_index.search(np.array(processor.embedding_model.encode(queries), dtype="float32"), top_k)
+
+    results = {
+        "chunks": len(chunks),
+        "queries": len(sources),
+        "top_k": top_k,
+        "min_recall": min_recall,
+        "raw_l2": {"source_hit_rate": source_hit_rate(raw_found),
+                   "index_bytes": len(faiss.serialize_index(raw_index))},
+        "encodings": {},
+    }
+    for encoding in encodings:
+        index = build_index(embeddings, index_type="flat", encoding=encoding)
+        _, found = index.search(query_embeddings, top_k)
+        recall = float(np.mean([len(set(row) & set(expected)) / top_k for row, expected in zip(found, exact)]))
+        results["encodings"][encoding] = {
+            f"recall@{top_k}": round(recall, 4),
+            "source_hit_rate": source_hit_rate(found),
+            "index_bytes": len(faiss.serialize_index(index)),
+        }
+    results["passed"] = all(result[f"recall@{top_k}"] >= min_recall for result in results["encodings"].values())
+    return results
+
+def benchmark_hybrid_retrieval(transcripts_dir, top_k=3, max_queries=500):
+    """
+    Compare dense, BM25 and hybrid (RRF) retrieval on the chunks of the .jsonl transcripts in transcripts_dir.
+
+    Each sampled chunk gives two queries: its longest sentence, and its three
+    rarest words (names, numbers and specific terms, as users type them).
+    The benchmark reports how often the query's own chunk is ranked first
+    and within top_k.
+
+    Args:
+        transcripts_dir (str): Directory of .jsonl transcripts
+        top_k (int): Number of retrieved chunks
+        max_queries (int): Upper bound on the number of chunks queried
+
+    Returns:
+        dict: Hit rates per query type and retrieval mode
+    """
+    from collections import Counter
+    from rag_helper import RAGProcessor, RAGIndex
+    from transcript_format import TRANSCRIPT_EXTENSION, read_transcript
+    from index_builder import build_index
+    from bm25_index import BM25Index, tokenize
+
+    processor = RAGProcessor()
+    chunks = []
+    for name in sorted(os.listdir(transcripts_dir)):
+        if name.endswith(TRANSCRIPT_EXTENSION):
+            chunks.extend(processor.chunk_segments(read_transcript(os.path.join(transcripts_dir, name)))[0])
+    if not chunks:
+        raise FileNotFoundError(f"❌ No .jsonl transcripts in {transcripts_dir}")
+
+    bm25 = BM25Index.build(chunks)
+    rag_index = RAGIndex(build_index(processor.embedder.encode(chunks)), chunks, bm25=bm25)
+    document_frequency = Counter(term for chunk in chunks for term in set(tokenize(chunk)))
+
+    def rare_words(chunk):
+        words = list(dict.fromkeys(re.findall(r"\w+", chunk)))
+        return " ".join(sorted(words, key=lambda word: sum(document_frequency[t] for t in tokenize(word)))[:3])
+
+    sources = list(range(0, len(chunks), max(1, len(chunks) // max_queries)))[:max_queries]
+    query_sets = {
+        "sentence": [max(re.split(r"(?<=[.!?])\s+", chunks[i]), key=len) for i in sources],
+        "keywords": [rare_words(chunks[i]) for i in sources],
+    }
+
+    results = {"chunks": len(chunks), "queries": len(sources), "top_k": top_k}
+    for query_type, queries in query_sets.items():
+        query_embeddings = processor.embedder.encode(queries, use_cache=False)
+        found = {"dense": [], "bm25": [], "hybrid": []}
+        for query, query_embedding in zip(queries, query_embeddings):
+            query_embedding = query_embedding.reshape(1, -1)
+            found["dense"].append(rag_index.search_ids(query_embedding, top_k, mode="dense"))
+            found["bm25"].append([doc_id for doc_id, score in bm25.search(query, top_k)])
+            found["hybrid"].append(rag_index.search_ids(query_embedding, top_k, query, mode="hybrid"))
+        results[query_type] = {
+            mode: {
+                "hit@1": round(sum(row[:1] == [source] for source, row in zip(sources, rows)) / len(sources), 4),
+                f"hit@{top_k}": round(sum(source in row for source, row in zip(sources, rows)) / len(sources), 4),
+            }
+            for mode, rows in found.items()
+        }
+    return results
+
+def benchmark_prefix_cache(model_path, index_path, questions, max_tokens=16, top_k=3):
+    """
+    Measure how much prompt prefix state reuse shortens time to first token.
+
+    Every question is asked twice over the same index: cold (model state reset,
+    no prefix cache) and with the prompt prefix cache. Follow-up questions that
+    retrieve the same chunks share the prompt prefix, so only the question is
+    processed when the cache hits.
+
+    Args:
+        model_path (str): GGUF model file
+        index_path (str): Saved RAG index (path without extension)
+        questions (list): Questions about the indexed video
+        max_tokens (int): Answer length; kept short so prompt processing dominates
+        top_k (int): Chunks retrieved per question
+
+    Returns:
+        dict: Time to first token per question and mode, and prefix cache statistics
+    """
+    import statistics
+    from prompt_cache import PROMPT_CACHE_MB, PromptStateCache
+    from rag_helper import RAGProcessor, LocalLLM
+
+    processor = RAGProcessor()
+    if not processor.load_index(index_path):
+        raise FileNotFoundError(f"❌ Could not load index {index_path}")
+    llm = LocalLLM(os.path.dirname(model_path) or ".")
+    if not llm.load_model(os.path.basename(model_path)):
+        raise FileNotFoundError(f"❌ Could not load model {model_path}")
+    contexts = [processor.retrieve_relevant_chunks(question, top_k) for question in questions]
+
+    def ask_all(reset):
+        runs = []
+        for question, context in zip(questions, contexts):
+            if reset:
+                llm.llm.run(lambda model: model.reset())
+            for _ in llm.stream_response(question, context, max_tokens):
+                pass
+            runs.append(dict(llm.last_generation_stats))
+        return runs
+
+    results = {"questions": len(questions), "max_tokens": max_tokens}
+    for mode in ("cold", "cached"):
+        llm.prompt_cache = PromptStateCache(0 if mode == "cold" else PROMPT_CACHE_MB)
+        runs = ask_all(reset=mode == "cold")
+        ttft = [run["time_to_first_token"] for run in runs if run["time_to_first_token"] is not None]
+        results[mode] = {
+            "time_to_first_token": [run["time_to_first_token"] for run in runs],
+            "median_time_to_first_token": round(statistics.median(ttft), 3) if ttft else None,
+            "prompt_tokens": [run["prompt_tokens"] for run in runs],
+            "cache": llm.prompt_cache.stats(),
+        }
+    if results["cold"]["median_time_to_first_token"] and results["cached"]["median_time_to_first_token"]:
+        results["ttft_speedup"] = round(results["cold"]["median_time_to_first_token"] /
+                                        results["cached"]["median_time_to_first_token"], 2)
+    return results
+
+def benchmark_import_time(modules=APP_MODULES, budget_ms=500, runs=5):
+    """
+    Measure the import time of the app's modules with python -X importtime.
+
+    Each run is a fresh interpreter. The check fails if the median import
+    time exceeds the budget or if any of HEAVY_MODULES is imported.
+
+    Args:
+        modules (tuple): Modules to import
+        budget_ms (float): Highest acceptable median import time
+        runs (int): Interpreter runs
+
+    Returns:
+        dict: Median and per-run import time, the slowest modules, heavy modules imported and whether the check passed
+    """
+    import subprocess
+    import statistics
+
+    project_dir = os.path.dirname(os.path.abspath(__file__))
+    totals = []
+    for _ in range(runs):
+        completed = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {', '.join(modules)}"],
+            cwd=project_dir, capture_output=True, text=True
+        )
+        if completed.returncode != 0:
+            raise RuntimeError(f"❌ Importing the app modules failed:\n{completed.stderr[-2000:]}")
+
+        # Lines look like "import time:  self [us] | cumulative | <indent>package"; nesting is shown by indentation
+        entries = []
+        for line in completed.stderr.splitlines():
+            match = re.match(r"import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)", line)
+            if match:
+                entries.append((match.group(4), len(match.group(3)), int(match.group(1)), int(match.group(2))))
+        totals.append(sum(cumulative for _, depth, _, cumulative in entries if depth == 0) / 1000)
+
+    imported = {name for name, _, _, _ in entries}
+    heavy = sorted(module for module in HEAVY_MODULES
+                   if any(name == module or name.startswith(module + ".") for name in imported))
+    slowest = sorted(entries, key=lambda entry: entry[2], reverse=True)[:10]
+    median_ms = statistics.median(totals)
+    return {
+        "modules": list(modules),
+        "median_ms": round(median_ms, 1),
+        "runs_ms": [round(total, 1) for total in totals],
+        "budget_ms": budget_ms,
+        "slowest_self_ms": {name: round(self_us / 1000, 1) for name, _, self_us, _ in slowest},
+        "heavy_modules_imported": heavy,
+        "passed": median_ms <= budget_ms and not heavy,
+    }
+
+def benchmark_chunk_store(sizes=(10000, 100000, 1000000), chunk_length=500, reads=1000):
+    """
+    Compare loading chunks from indented JSON with opening a memory-mapped chunk store.
+
+    Args:
+        sizes (tuple): Chunk counts to test
+        chunk_length (int): Characters per synthetic chunk
+        reads (int): Random chunk reads timed after loading
+
+    Returns:
+        dict: Per size, file sizes, load times and per-read latency of both formats
+    """
+    import random
+    import tempfile
+    from chunk_store import ChunkStore, write_chunk_store
+
+    results = {}
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for size in sizes:
+            chunks = [f"{i} " + "ç" * (chunk_length - len(str(i)) - 1) for i in range(size)]
+            chunk_times = [(i * 30.0, i * 30.0 + 30.0) for i in range(size)]
+            json_path = os.path.join(temp_dir, f"{size}.chunks.json")
+            store_path = os.path.join(temp_dir, f"{size}.chunks.bin")
+            with open(json_path, "w", encoding="utf-8") as f:
+                json.dump(chunks, f, ensure_ascii=False, indent=2)
+            write_chunk_store(store_path, chunks, chunk_times)
+            del chunks
+            positions = [rng.randrange(size) for _ in range(reads)]
+
+            start = time.perf_counter()
+            with open(json_path, "r", encoding="utf-8") as f:
+                loaded = json.load(f)
+            json_load = time.perf_counter() - start
+            start = time.perf_counter()
+            for position in positions:
+                loaded[position]
+            json_read = time.perf_counter() - start
+            del loaded
+
+            start = time.perf_counter()
+            store = ChunkStore(store_path)
+            store_load = time.perf_counter() - start
+            start = time.perf_counter()
+            for position in positions:
+                store[position]
+                store.chunk_times[position]
+            store_read = time.perf_counter() - start
+            store.close()
+
+            results[size] = {
+                "json_mb": round(os.path.getsize(json_path) / (1024 * 1024), 2),
+                "store_mb": round(os.path.getsize(store_path) / (1024 * 1024), 2),
+                "json_load_ms": round(json_load * 1000, 3),
+                "store_load_ms": round(store_load * 1000, 3),
+                "json_read_us": round(json_read / reads * 1e6, 3),
+                "store_read_us": round(store_read / reads * 1e6, 3),
+            }
+            print(f"📊 {size} chunks: {results[size]}")
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks for the content assistant pipeline")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    parallel_parser = subparsers.add_parser("parallel-transcription",
+                                            help="Single-stream vs parallel windowed transcription")
+    parallel_parser.add_argument("audio_path")
+    parallel_parser.add_argument("--model-size", default="medium")
+    parallel_parser.add_argument("--num-workers", type=int)
+    parallel_parser.add_argument("--cpu-threads", type=int)
+    parallel_parser.add_argument("--window-seconds", type=float, default=300)
+    parallel_parser.add_argument("--output")
+
+    asr_parser = subparsers.add_parser("asr-modes", help="WER and speed of each transcription mode")
+    asr_parser.add_argument("fixtures_dir", help="Audio files with same-named .txt reference transcripts")
+    asr_parser.add_argument("--model-size", default="medium")
+    asr_parser.add_argument("--modes", nargs="+", default=["standard", "throughput"])
+    asr_parser.add_argument("--batch-size", type=int, default=16)
+    asr_parser.add_argument("--output")
+
+    download_parser = subparsers.add_parser("bulk-download",
+                                            help="Concurrent download throughput against a local HTTP server")
+    download_parser.add_argument("fixtures_dir", help="Directory of media files to serve")
+    download_parser.add_argument("--workers", type=int, default=4)
+    download_parser.add_argument("--audio-format", default="native")
+    download_parser.add_argument("--output")
+
+    ann_parser = subparsers.add_parser("ann-index", help="Recall@k and query latency of Flat, HNSW and IVF-PQ")
+    ann_parser.add_argument("--sizes", nargs="+", type=int, default=[10000, 100000, 1000000])
+    ann_parser.add_argument("--dimension", type=int, default=384)
+    ann_parser.add_argument("--index-types", nargs="+", default=["flat", "hnsw", "ivfpq"])
+    ann_parser.add_argument("--queries", type=int, default=200)
+    ann_parser.add_argument("--top-k", type=int, default=10)
+    ann_parser.add_argument("--nprobe", type=int)
+    ann_parser.add_argument("--ef-search", type=int)
+    ann_parser.add_argument("--vectors", help=".npy file of real embeddings to use instead of synthetic ones")
+    ann_parser.add_argument("--output")
+
+    quality_parser = subparsers.add_parser("retrieval-quality",
+                                           help="Regression check of normalized, compressed indexes")
+    quality_parser.add_argument("transcripts_dir", help="Directory of .jsonl transcripts")
+    quality_parser.add_argument("--top-k", type=int, default=5)
+    quality_parser.add_argument("--encodings", nargs="+", default=["float32", "float16", "int8"])
+    quality_parser.add_argument("--min-recall", type=float, default=0.95)
+    quality_parser.add_argument("--output")
+
+    hybrid_parser = subparsers.add_parser("hybrid-retrieval", help="Dense vs BM25 vs hybrid (RRF) retrieval")
+    hybrid_parser.add_argument("transcripts_dir", help="Directory of .jsonl transcripts")
+    hybrid_parser.add_argument("--top-k", type=int, default=3)
+    hybrid_parser.add_argument("--output")
+
+    prefix_parser = subparsers.add_parser("prefix-cache",
+                                          help="Time to first token with and without prompt state reuse")
+    prefix_parser.add_argument("model_path", help="GGUF model file")
+    prefix_parser.add_argument("index_path", help="Saved RAG index, without extension")
+    prefix_parser.add_argument("questions", nargs="+")
+    prefix_parser.add_argument("--max-tokens", type=int, default=16)
+    prefix_parser.add_argument("--top-k", type=int, default=3)
+    prefix_parser.add_argument("--output")
+
+    import_parser = subparsers.add_parser("import-time",
+                                          help="Import time of the app's modules against a budget")
+    import_parser.add_argument("--budget-ms", type=float, default=500)
+    import_parser.add_argument("--runs", type=int, default=5)
+    import_parser.add_argument("--output")
+
+    chunk_parser = subparsers.add_parser("chunk-store",
+                                         help="Load time and random access of JSON chunks vs the chunk store")
+    chunk_parser.add_argument("--sizes", nargs="+", type=int, default=[10000, 100000, 1000000])
+    chunk_parser.add_argument("--chunk-length", type=int, default=500)
+    chunk_parser.add_argument("--reads", type=int, default=1000)
+    chunk_parser.add_argument("--output")
+
+    args = parser.parse_args()
+    if args.benchmark == "parallel-transcription":
+        results = benchmark_parallel_transcription(
+            args.audio_path, args.model_size, args.num_workers, args.cpu_threads, args.window_seconds
+        )
+        report_results(results, args.output)
+    elif args.benchmark == "asr-modes":
+        results = benchmark_asr_modes(args.fixtures_dir, args.model_size, tuple(args.modes), args.batch_size)
+        report_results(results, args.output)
+    elif args.benchmark == "bulk-download":
+        results = benchmark_bulk_download(args.fixtures_dir, args.workers, args.audio_format)
+        report_results(results, args.output)
+    elif args.benchmark == "ann-index":
+        results = benchmark_ann_indexes(tuple(args.sizes), args.dimension, tuple(args.index_types), args.queries,
+                                        args.top_k, args.nprobe, args.ef_search, args.vectors)
+        report_results(results, args.output)
+    elif args.benchmark == "retrieval-quality":
+        results = benchmark_retrieval_quality(args.transcripts_dir, args.top_k, tuple(args.encodings),
+                                              args.min_recall)
+        report_results(results, args.output)
+        if not results["passed"]:
+            print(f"❌ Recall@{args.top_k} fell below {args.min_recall}")
+            sys.exit(1)
+    elif args.benchmark == "hybrid-retrieval":
+        results = benchmark_hybrid_retrieval(args.transcripts_dir, args.top_k)
+        report_results(results, args.output)
+    elif args.benchmark == "prefix-cache":
+        results = benchmark_prefix_cache(args.model_path, args.index_path, args.questions, args.max_tokens,
+                                         args.top_k)
+        report_results(results, args.output)
+    elif args.benchmark == "import-time":
+        results = benchmark_import_time(budget_ms=args.budget_ms, runs=args.runs)
+        report_results(results, args.output)
+        if not results["passed"]:
+            print(f"❌ Import time over {args.budget_ms} ms or heavy modules imported at startup: "
+                  f"{', '.join(results['heavy_modules_imported']) or 'none'}")
+            sys.exit(1)
+    elif args.benchmark == "chunk-store":
+        results = benchmark_chunk_store(tuple(args.sizes), args.chunk_length, args.reads)
+        report_results(results, args.output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+BM25 keyword index.
+An inverted index over the chunks of a saved index. It finds exact names,
+numbers and rare terms that dense embeddings miss, and its ranking is
+fused with the vector search by reciprocal rank fusion (RRF).
+
+Terms are lowercased with dotted and dotless i folded together (so
+"İstanbul", "Istanbul" and "istanbul" match) and words are cut to a fixed
+prefix, a simple stemmer that works well for Turkish suffixes. The index
+is stored as numpy arrays next to the FAISS index.
+"""
+
+import os
+import re
+from collections import Counter
+
+import numpy as np
+
+BM25_EXTENSION = ".bm25.npz"
+# Words are cut to this many characters (0 keeps whole words); numbers are never cut
+BM25_PREFIX_LENGTH = int(os.environ.get("BM25_PREFIX_LENGTH", "5"))
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Rank constant of reciprocal rank fusion
+RRF_K = 60
+
+TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+# str.lower() turns "İ" into "i" plus a combining dot
+DOTTED_CAPITAL_I = str.maketrans({"İ": "i"})
+DOTLESS_I = str.maketrans({"ı": "i"})
+
+def tokenize(text, prefix_length=BM25_PREFIX_LENGTH):
+    """Split text into lowercased, prefix-stemmed terms."""
+    terms = []
+    for token in TOKEN_PATTERN.findall(text.translate(DOTTED_CAPITAL_I).lower().translate(DOTLESS_I)):
+        if prefix_length and not token.isdigit():
+            token = token[:prefix_length]
+        terms.append(token)
+    return terms
+
+def reciprocal_rank_fusion(rankings, top_k, k=RRF_K):
+    """
+    Merge ranked ID lists; an ID scores 1 / (k + rank) in every list it appears in.
+
+    Args:
+        rankings (list): Lists of IDs, best first
+        top_k (int): Number of IDs to return
+        k (int): Rank constant; larger values flatten the difference between ranks
+
+    Returns:
+        list: IDs sorted by fused score, best first
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)[:top_k]
+
+class BM25Index:
+    def __init__(self, terms, offsets, doc_ids, term_counts, doc_lengths, prefix_length=BM25_PREFIX_LENGTH):
+        """
+        An inverted index in flat arrays; build() or load() create one.
+
+        Args:
+            terms (np.ndarray): Sorted vocabulary
+            offsets (np.ndarray): Start of each term's postings in doc_ids/term_counts, plus the end
+            doc_ids (np.ndarray): Chunk IDs of all postings
+            term_counts (np.ndarray): Occurrences of the term in the chunk, per posting
+            doc_lengths (np.ndarray): Terms per chunk
+            prefix_length (int): Stemming prefix the chunks were tokenized with
+        """
+        self.terms = terms
+        self.offsets = offsets
+        self.doc_ids = doc_ids
+        self.term_counts = term_counts
+        self.doc_lengths = doc_lengths
+        self.prefix_length = prefix_length
+        self.average_length = float(doc_lengths.mean()) if len(doc_lengths) else 0.0
+
+    @classmethod
+    def build(cls, chunks, prefix_length=BM25_PREFIX_LENGTH):
+        """Build the index of chunks, whose positions are their IDs."""
+        postings = {}
+        doc_lengths = np.zeros(len(chunks), dtype="int32")
+        for doc_id, chunk in enumerate(chunks):
+            counts = Counter(tokenize(chunk, prefix_length))
+            doc_lengths[doc_id] = sum(counts.values())
+            for term, count in counts.items():
+                postings.setdefault(term, []).append((doc_id, count))
+
+        terms = sorted(postings)
+        offsets = np.zeros(len(terms) + 1, dtype="int64")
+        doc_ids, term_counts = [], []
+        for i, term in enumerate(terms):
+            for doc_id, count in postings[term]:
+                doc_ids.append(doc_id)
+                term_counts.append(count)
+            offsets[i + 1] = len(doc_ids)
+        return cls(np.array(terms, dtype=str), offsets, np.array(doc_ids, dtype="int32"),
+                   np.array(term_counts, dtype="int32"), doc_lengths, prefix_length)
+
+    @classmethod
+    def load(cls, path):
+        """Load an index saved with save()."""
+        with np.load(path, allow_pickle=False) as data:
+            return cls(data["terms"], data["offsets"], data["doc_ids"], data["term_counts"],
+                       data["doc_lengths"], int(data["prefix_length"]))
+
+    def save(self, path):
+        """Save the index; path should end in BM25_EXTENSION."""
+        # np.savez appends .npz to names without it, so write to a name that has it
+        temp_path = path + ".tmp.npz"
+        np.savez(temp_path, terms=self.terms, offsets=self.offsets, doc_ids=self.doc_ids,
+                 term_counts=self.term_counts, doc_lengths=self.doc_lengths,
+                 prefix_length=np.array(self.prefix_length))
+        os.replace(temp_path, path)
+
+    def __len__(self):
+        return len(self.doc_lengths)
+
+    def search(self, query, top_k=3):
+        """
+        Rank chunks by BM25 score for a query.
+
+        Returns:
+            list: (chunk ID, score) of the best matching chunks, best first; chunks sharing no term are left out
+        """
+        if len(self.doc_lengths) == 0:
+            return []
+        scores = np.zeros(len(self.doc_lengths), dtype="float32")
+        length_norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lengths / max(self.average_length, 1e-9))
+        for term in set(tokenize(query, self.prefix_length)):
+            position = np.searchsorted(self.terms, term)
+            if position >= len(self.terms) or self.terms[position] != term:
+                continue
+            start, end = self.offsets[position], self.offsets[position + 1]
+            doc_ids = self.doc_ids[start:end]
+            term_counts = self.term_counts[start:end]
+            idf = np.log(1 + (len(self.doc_lengths) - len(doc_ids) + 0.5) / (len(doc_ids) + 0.5))
+            scores[doc_ids] += idf * term_counts * (BM25_K1 + 1) / (term_counts + length_norm[doc_ids])
+
+        matched = np.flatnonzero(scores)
+        best = matched[np.argsort(-scores[matched], kind="stable")[:top_k]]
+        return [(int(doc_id), float(scores[doc_id])) for doc_id in best]
@@ -0,0 +1,182 @@
+"""
+Concurrent downloader for playlists, channels and URL lists.
+Downloads several items at once with per-host rate limiting, resumable
+partial files and retries with exponential backoff.
+
+Usage:
+    python bulk_downloader.py "https://www.youtube.com/@channel/videos" --workers 4
+"""
+
+import os
+import json
+import time
+import random
+import argparse
+import threading
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
+
+from youtube_downloader import download_youtube_audio, expand_playlist, extract_video_id
+
+class HostRateLimiter:
+    def __init__(self, min_interval=1.0, max_concurrent=2):
+        """
+        Limit how fast and how many downloads start against the same host.
+
+        Args:
+            min_interval (float): Minimum seconds between two request starts per host
+            max_concurrent (int): Maximum simultaneous downloads per host
+        """
+        self.min_interval = min_interval
+        self.max_concurrent = max_concurrent
+        self._lock = threading.Lock()
+        self._next_start = {}
+        self._slots = {}
+
+    def acquire(self, host):
+        """Block until a download against host may start."""
+        with self._lock:
+            slots = self._slots.setdefault(host, threading.Semaphore(self.max_concurrent))
+        slots.acquire()
+        with self._lock:
+            now = time.time()
+            start_at = max(now, self._next_start.get(host, 0))
+            self._next_start[host] = start_at + self.min_interval
+        if start_at > now:
+            time.sleep(start_at - now)
+
+    def release(self, host):
+        """Free the host slot taken by acquire()."""
+        self._slots[host].release()
+
+def download_with_retries(url, output_dir, audio_format, limiter, max_retries=4, backoff_base=2.0):
+    """
+    Download one item, retrying with exponential backoff and jitter.
+
+    Partial files are kept between attempts, so yt-dlp continues them
+    instead of starting over.
+
+    Returns:
+        dict: url, status, audio_path, bytes, seconds, throughput_mbps, attempts, error
+    """
+    host = urlparse(url).netloc or "local"
+    start_time = time.time()
+    for attempt in range(1, max_retries + 2):
+        limiter.acquire(host)
+        try:
+            audio_path = download_youtube_audio(url, output_dir, audio_format)
+            size = os.path.getsize(audio_path)
+            seconds = time.time() - start_time
+            return {
+                "url": url,
+                "status": "completed",
+                "audio_path": audio_path,
+                "bytes": size,
+                "seconds": round(seconds, 2),
+                "throughput_mbps": round(size * 8 / 1e6 / seconds, 2) if seconds > 0 else None,
+                "attempts": attempt,
+            }
+        except Exception as e:
+            error = str(e)
+        finally:
+            limiter.release(host)
+        
+        if attempt > max_retries:
+            break
+        # The host slot is free while waiting, so other items can use it
+        delay = backoff_base ** attempt * (0.5 + random.random())
+        print(f"⚠️ Attempt {attempt} failed for {url}, retrying in {delay:.1f}s: {error}")
+        time.sleep(delay)
+
+    return {
+        "url": url,
+        "status": "failed",
+        "seconds": round(time.time() - start_time, 2),
+        "attempts": max_retries + 1,
+        "error": error,
+    }
+
+def expand_source(source, limiter):
+    """Expand a playlist/channel URL into video URLs, counting the metadata request against the host limit."""
+    if extract_video_id(source):
+        # A known single video needs no request
+        return [source]
+    host = urlparse(source).netloc or "local"
+    limiter.acquire(host)
+    try:
+        return expand_playlist(source)
+    finally:
+        limiter.release(host)
+
+def download_many(sources, output_dir="./audios", audio_format="native", max_workers=4,
+                  per_host_interval=1.0, per_host_concurrency=2, max_retries=4):
+    """
+    Expand playlists/channels and download all items with bounded parallelism.
+
+    Args:
+        sources (list): Video, playlist or channel URLs
+        output_dir (str): Directory to save audio files
+        audio_format (str): "native", "wav16k" or "mp3"
+        max_workers (int): Downloads running at once
+        per_host_interval (float): Minimum seconds between request starts per host
+        per_host_concurrency (int): Maximum simultaneous downloads per host
+        max_retries (int): Retries per item after the first attempt
+
+    Returns:
+        dict: Totals and per-item results with throughput
+    """
+    limiter = HostRateLimiter(per_host_interval, per_host_concurrency)
+    urls = []
+    for source in sources:
+        for url in expand_source(source, limiter):
+            if url not in urls:
+                urls.append(url)
+    print(f"📋 {len(urls)} items to download with {max_workers} workers")
+
+    start_time = time.time()
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="download") as executor:
+        items = list(executor.map(
+            lambda url: download_with_retries(url, output_dir, audio_format, limiter, max_retries), urls
+        ))
+
+    total_seconds = time.time() - start_time
+    total_bytes = sum(item.get("bytes", 0) for item in items)
+    return {
+        "items": len(items),
+        "completed": sum(1 for item in items if item["status"] == "completed"),
+        "failed": sum(1 for item in items if item["status"] == "failed"),
+        "total_seconds": round(total_seconds, 2),
+        "total_bytes": total_bytes,
+        "throughput_mbps": round(total_bytes * 8 / 1e6 / total_seconds, 2) if total_seconds > 0 else None,
+        "per_item": items,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Download many YouTube videos concurrently")
+    parser.add_argument("sources", nargs="+", help="Video, playlist or channel URLs, or files with one URL per line")
+    parser.add_argument("--output-dir", default="./audios")
+    parser.add_argument("--audio-format", default="native", choices=["native", "wav16k", "mp3"])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--per-host-interval", type=float, default=1.0)
+    parser.add_argument("--per-host-concurrency", type=int, default=2)
+    parser.add_argument("--max-retries", type=int, default=4)
+    parser.add_argument("--report", default="./download_report.json")
+    args = parser.parse_args()
+
+    sources = []
+    for source in args.sources:
+        if os.path.exists(source):
+            with open(source, "r", encoding="utf-8") as f:
+                sources.extend(line.strip() for line in f if line.strip() and not line.startswith("#"))
+        else:
+            sources.append(source)
+
+    report = download_many(sources, args.output_dir, args.audio_format, args.workers,
+                           args.per_host_interval, args.per_host_concurrency, args.max_retries)
+    with open(args.report, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"✅ {report['completed']}/{report['items']} downloaded at {report['throughput_mbps']} Mbit/s, "
+          f"report saved to {args.report}")
+
+if __name__ == "__main__":
+    main()
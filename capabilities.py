@@ -0,0 +1,119 @@
+"""
+Environment capability probe.
+Checks once per process which optional backends are installed, reports the
+missing ones and lets callers disable the features that need them. Packages
+are located without importing them, so the probe is fast and does not load
+heavy libraries at startup. Nothing is installed at runtime; missing
+packages are installed explicitly with this module's command line.
+
+Usage:
+    python capabilities.py
+    python capabilities.py --install
+"""
+
+import sys
+import argparse
+import threading
+import subprocess
+import importlib.util
+
+# Feature -> (module, pip package) pairs it needs
+FEATURE_BACKENDS = {
+    "download": [("yt_dlp", "yt-dlp")],
+    "transcribe": [("faster_whisper", "faster-whisper")],
+    "rag": [("sentence_transformers", "sentence-transformers"), ("faiss", "faiss-cpu"), ("langchain", "langchain")],
+    "llm": [("llama_cpp", "llama-cpp-python")],
+}
+
+def module_installed(module_name):
+    """True if a module can be found, without importing it."""
+    try:
+        return importlib.util.find_spec(module_name) is not None
+    except (ImportError, ValueError):
+        return False
+
+def probe_capabilities():
+    """
+    Check which features have their backends installed.
+
+    Returns:
+        dict: Feature -> {"available": bool, "missing": list of pip packages}
+    """
+    capabilities = {}
+    for feature, backends in FEATURE_BACKENDS.items():
+        missing = [package for module_name, package in backends if not module_installed(module_name)]
+        capabilities[feature] = {"available": not missing, "missing": missing}
+    return capabilities
+
+def report_capabilities(capabilities):
+    """Print the features that are disabled and how to enable them."""
+    missing = {feature: info["missing"] for feature, info in capabilities.items() if not info["available"]}
+    if not missing:
+        print("✅ All optional backends are installed.")
+        return
+    for feature, packages in missing.items():
+        print(f"⚠️ {feature} disabled, missing: {', '.join(packages)} (pip install {' '.join(packages)})")
+
+_capabilities = None
+_capabilities_lock = threading.Lock()
+
+def get_capabilities():
+    """Return the probe result, probing and reporting on first use in the process."""
+    global _capabilities
+    with _capabilities_lock:
+        if _capabilities is None:
+            _capabilities = probe_capabilities()
+            report_capabilities(_capabilities)
+        return _capabilities
+
+def is_available(feature):
+    """True if every backend of a feature is installed."""
+    return get_capabilities()[feature]["available"]
+
+def require(feature):
+    """Raise ImportError naming the missing packages if a feature's backends are not installed."""
+    info = get_capabilities()[feature]
+    if not info["available"]:
+        raise ImportError(f"❌ {feature} needs packages that are not installed: {', '.join(info['missing'])}. "
+                          f"Install them with: pip install {' '.join(info['missing'])}")
+
+def install_missing(features=None):
+    """
+    Install the missing packages of features (all by default) with pip.
+
+    Meant for setup; the app itself never installs packages.
+
+    Returns:
+        bool: True if every installation succeeded
+    """
+    capabilities = probe_capabilities()
+    packages = sorted({package for feature, info in capabilities.items()
+                       if features is None or feature in features for package in info["missing"]})
+    if not packages:
+        print("✅ Nothing to install.")
+        return True
+    print(f"📦 Installing {', '.join(packages)}...")
+    try:
+        subprocess.check_call([sys.executable, "-m", "pip", "install", *packages])
+    except Exception as e:
+        print(f"❌ Failed to install packages: {e}")
+        return False
+    print("✅ Packages installed. Restart the app to enable the features.")
+    return True
+
+def main():
+    parser = argparse.ArgumentParser(description="Check (and install) the optional backends of each feature")
+    parser.add_argument("--install", action="store_true", help="pip install the missing packages")
+    parser.add_argument("--features", nargs="+", choices=list(FEATURE_BACKENDS), help="Limit to these features")
+    args = parser.parse_args()
+
+    if args.install:
+        sys.exit(0 if install_missing(args.features) else 1)
+    capabilities = probe_capabilities()
+    for feature, info in capabilities.items():
+        if args.features is None or feature in args.features:
+            status = "✅" if info["available"] else f"❌ missing {', '.join(info['missing'])}"
+            print(f"{feature}: {status}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+"""
+Binary chunk store.
+The chunk texts of a saved index live in one file: a small header, a table
+of byte offsets and the UTF-8 encoded texts back to back, followed by the
+chunk time ranges. The file is memory-mapped, so opening it costs the same
+for ten chunks or ten million, and a chunk is decoded only when it is read
+(by its FAISS ID, in O(1)).
+
+Layout (little-endian):
+    header   magic "YTCHUNK1", uint64 chunk count, uint64 flags
+    offsets  (count + 1) uint64, start of each text in the blob plus its end
+    blob     UTF-8 texts
+    times    count * 2 float64 (start, end) if FLAG_TIMES is set; NaN if unknown
+
+Usage:
+    python chunk_store.py convert ./rag_indexes
+"""
+
+import os
+import json
+import mmap
+import struct
+import argparse
+from collections.abc import Sequence
+
+CHUNK_STORE_EXTENSION = ".chunks.bin"
+LEGACY_CHUNKS_EXTENSION = ".chunks.json"
+
+MAGIC = b"YTCHUNK1"
+HEADER = struct.Struct("<8sQQ")
+OFFSET = struct.Struct("<Q")
+TIME_RANGE = struct.Struct("<dd")
+# The file holds a time range per chunk
+FLAG_TIMES = 1
+
+def write_chunk_store(path, chunks, chunk_times=None):
+    """
+    Write chunks (and their time ranges) to a chunk store file.
+
+    The file is written next to its destination and renamed into place.
+    Windows refuses to replace a file that is memory-mapped, so the
+    ChunkStores of path must be closed first (RAGIndex.save does this for
+    the stores of the index cache).
+
+    Args:
+        path (str): Destination file
+        chunks (list): Chunk texts, in FAISS ID order
+        chunk_times (list): (start, end) seconds per chunk, or None
+    """
+    encoded = [chunk.encode("utf-8") for chunk in chunks]
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, len(encoded), FLAG_TIMES if chunk_times is not None else 0))
+        offset = 0
+        offsets = bytearray()
+        for data in encoded:
+            offsets += OFFSET.pack(offset)
+            offset += len(data)
+        offsets += OFFSET.pack(offset)
+        f.write(offsets)
+        f.write(b"".join(encoded))
+        if chunk_times is not None:
+            f.write(b"".join(
+                TIME_RANGE.pack(float("nan") if start is None else start, float("nan") if end is None else end)
+                for start, end in chunk_times
+            ))
+    os.replace(temp_path, path)
+
+class ChunkStore(Sequence):
+    def __init__(self, path):
+        """
+        Map a chunk store file. Nothing beyond the header is read until chunks are accessed.
+
+        Args:
+            path (str): Chunk store file
+        """
+        self.path = path
+        with open(path, "rb") as f:
+            self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self._count, flags = HEADER.unpack_from(self._data, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a chunk store")
+        self._offsets_start = HEADER.size
+        self._blob_start = self._offsets_start + (self._count + 1) * OFFSET.size
+        blob_size = self._offset(self._count)
+        self.chunk_times = ChunkTimes(self._data, self._blob_start + blob_size, self._count) \
+            if flags & FLAG_TIMES else None
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(self._count))]
+        if idx < 0:
+            idx += self._count
+        if not 0 <= idx < self._count:
+            raise IndexError("chunk index out of range")
+        start = self._blob_start + self._offset(idx)
+        end = self._blob_start + self._offset(idx + 1)
+        return self._data[start:end].decode("utf-8")
+
+    def _offset(self, idx):
+        return OFFSET.unpack_from(self._data, self._offsets_start + idx * OFFSET.size)[0]
+
+    @property
+    def closed(self):
+        return self._data.closed
+
+    def close(self):
+        """Unmap the file; the store can't be read afterwards."""
+        self._data.close()
+
+class ChunkTimes(Sequence):
+    def __init__(self, data, start, count):
+        """(start, end) seconds per chunk, read from a mapped chunk store; unknown times are None."""
+        self._data = data
+        self._start = start
+        self._count = count
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(self._count))]
+        if idx < 0:
+            idx += self._count
+        if not 0 <= idx < self._count:
+            raise IndexError("chunk index out of range")
+        start, end = TIME_RANGE.unpack_from(self._data, self._start + idx * TIME_RANGE.size)
+        # NaN marks an unknown time
+        return (None if start != start else start, None if end != end else end)
+
+def convert_legacy_chunks(file_path, remove_legacy=True):
+    """
+    Convert the .chunks.json (and .meta.json) files of a saved index to a chunk store.
+
+    Args:
+        file_path (str): Index path without extension
+        remove_legacy (bool): Delete the JSON files after converting
+
+    Returns:
+        bool: True if the index was converted
+    """
+    legacy_path = file_path + LEGACY_CHUNKS_EXTENSION
+    if not os.path.exists(legacy_path):
+        return False
+    with open(legacy_path, "r", encoding="utf-8") as f:
+        chunks = json.load(f)
+    chunk_times = None
+    meta_path = f"{file_path}.meta.json"
+    if os.path.exists(meta_path):
+        with open(meta_path, "r", encoding="utf-8") as f:
+            chunk_times = json.load(f).get("chunk_times")
+
+    write_chunk_store(file_path + CHUNK_STORE_EXTENSION, chunks, chunk_times)
+    if remove_legacy:
+        os.remove(legacy_path)
+        if os.path.exists(meta_path):
+            os.remove(meta_path)
+    return True
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage binary chunk stores of saved indexes")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    convert_parser = subparsers.add_parser("convert", help="Convert .chunks.json files to chunk stores")
+    convert_parser.add_argument("index_dir", nargs="?", default="./rag_indexes")
+    convert_parser.add_argument("--keep-json", action="store_true", help="Keep the .chunks.json files")
+    args = parser.parse_args()
+
+    converted = 0
+    for name in sorted(os.listdir(args.index_dir)):
+        if name.endswith(LEGACY_CHUNKS_EXTENSION):
+            file_path = os.path.join(args.index_dir, name[:-len(LEGACY_CHUNKS_EXTENSION)])
+            before = os.path.getsize(file_path + LEGACY_CHUNKS_EXTENSION)
+            if convert_legacy_chunks(file_path, remove_legacy=not args.keep_json):
+                after = os.path.getsize(file_path + CHUNK_STORE_EXTENSION)
+                print(f"✅ {file_path}: {before / 1024:.0f} KB -> {after / 1024:.0f} KB")
+                converted += 1
+    print(f"📊 {converted} indexes converted")
+
+if __name__ == "__main__":
+    main()
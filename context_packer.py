@@ -0,0 +1,133 @@
+"""
+Token-budget context packing.
+Fits retrieved chunks into the prompt space the LLM has left after the
+question, the prompt template and the tokens reserved for the answer.
+Chunks are taken in rank order; near-duplicates are dropped and the text
+neighbouring chunks share (the splitter's chunk_overlap) is sent once.
+"""
+
+import os
+import re
+
+# Upper limit on context tokens per question (0: whatever the context window leaves)
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", "0"))
+# Chunks whose word 3-grams overlap at least this much (Jaccard) with a packed chunk are dropped
+NEAR_DUPLICATE_THRESHOLD = 0.8
+# Shortest shared text between two chunks that is treated as splitter overlap
+MIN_OVERLAP_CHARS = 20
+# Longest overlap searched for (the splitter overlaps chunks by 50 characters)
+MAX_OVERLAP_CHARS = 200
+CHUNK_SEPARATOR = "\n\n"
+
+# "[00:01:00 - 00:02:00] " and "(video title) " labels added by retrieval
+CHUNK_LABEL = re.compile(r"^(\[[^\]]*\]\s*)?(\([^)]*\)\s*)?")
+
+def split_label(chunk):
+    """Split a retrieved chunk into its timestamp/title label and its text."""
+    label = CHUNK_LABEL.match(chunk).group(0)
+    return label, chunk[len(label):]
+
+def chronological_order(chunks):
+    """
+    Sort chunks by the start time in their label (unlabelled chunks last, by text).
+
+    The same set of chunks then always gives the same context text, whatever
+    order retrieval ranked them in.
+    """
+    def start_seconds(chunk):
+        label, _ = split_label(chunk)
+        match = re.match(r"\[(\d+(?::\d+)*)", label)
+        if not match:
+            return float("inf")
+        seconds = 0
+        for part in match.group(1).split(":"):
+            seconds = seconds * 60 + int(part)
+        return seconds
+    return sorted(chunks, key=lambda chunk: (start_seconds(chunk), chunk))
+
+def word_shingles(text, size=3):
+    """Set of word n-grams of a text, for near-duplicate detection."""
+    words = re.findall(r"\w+", text.lower())
+    if len(words) < size:
+        return {tuple(words)} if words else set()
+    return {tuple(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+def shared_overlap(before, after):
+    """Length of the longest end of before that is also the start of after (0 if shorter than MIN_OVERLAP_CHARS)."""
+    for length in range(min(len(before), len(after), MAX_OVERLAP_CHARS), MIN_OVERLAP_CHARS - 1, -1):
+        if before.endswith(after[:length]):
+            return length
+    return 0
+
+def pack_context(chunks, budget, tokenize, detokenize=None):
+    """
+    Choose and trim chunks so that they fit a token budget.
+
+    Args:
+        chunks (list): Retrieved chunks, most relevant first
+        budget (int): Tokens the joined context may use
+        tokenize (callable): tokenize(text) -> list of token IDs of the LLM
+        detokenize (callable): detokenize(token IDs) -> text; used to cut the first chunk if even that does not fit
+
+    Returns:
+        tuple: (packed chunks in rank order, stats dict with token counts and what was left out)
+    """
+    separator_tokens = len(tokenize(CHUNK_SEPARATOR))
+    stats = {
+        "budget": max(budget, 0),
+        "input_tokens": len(tokenize(CHUNK_SEPARATOR.join(chunks))) if chunks else 0,
+        "duplicates": 0,
+        "overlap_chars": 0,
+        "over_budget": 0,
+        "truncated": False,
+    }
+    packed, packed_texts, packed_shingles = [], [], []
+    used = 0
+    for chunk in chunks:
+        label, text = split_label(chunk)
+        shingles = word_shingles(text)
+        if any(shingles and len(shingles & other) / len(shingles | other) >= NEAR_DUPLICATE_THRESHOLD
+               for other in packed_shingles):
+            stats["duplicates"] += 1
+            continue
+
+        # Text this chunk shares with an already packed neighbour is sent once
+        for other in packed_texts:
+            overlap = shared_overlap(other, text)
+            if overlap:
+                text = text[overlap:].lstrip()
+                stats["overlap_chars"] += overlap
+            overlap = shared_overlap(text, other)
+            if overlap:
+                text = text[:-overlap].rstrip()
+                stats["overlap_chars"] += overlap
+        if not text.strip():
+            stats["duplicates"] += 1
+            continue
+
+        candidate = label + text
+        tokens = len(tokenize(candidate)) + (separator_tokens if packed else 0)
+        if used + tokens > budget:
+            if packed or detokenize is None or budget <= 0:
+                # A lower-ranked, shorter chunk may still fit
+                stats["over_budget"] += 1
+                continue
+            # Not even the best chunk fits: send as much of it as the budget allows
+            candidate_tokens = tokenize(candidate)
+            cut = budget
+            while True:
+                candidate = detokenize(candidate_tokens[:cut])
+                tokens = len(tokenize(candidate))
+                # Decoded text can tokenize differently at the cut
+                if tokens <= budget or cut <= 1:
+                    break
+                cut -= 1
+            stats["truncated"] = True
+        packed.append(candidate)
+        packed_texts.append(text)
+        packed_shingles.append(shingles)
+        used += tokens
+
+    stats["context_tokens"] = used
+    stats["saved_tokens"] = max(stats["input_tokens"] - used, 0)
+    return packed, stats
@@ -0,0 +1,147 @@
+"""
+Persistent embedding cache.
+Embeddings are stored in SQLite keyed by (model name, SHA-256 of the text),
+so re-indexing a transcript only sends new or changed chunks to the model.
+"""
+
+import os
+import hashlib
+import sqlite3
+import threading
+
+import numpy as np
+
+EMBEDDING_CACHE_PATH = os.environ.get("EMBEDDING_CACHE_PATH", "./embedding_cache.db")
+# Keys per SELECT, below SQLite's limit on query parameters
+LOOKUP_BATCH_SIZE = 500
+
+def text_sha256(text):
+    """Hash of a chunk's text, used as its cache key."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+class EmbeddingCache:
+    def __init__(self, db_path=EMBEDDING_CACHE_PATH):
+        """
+        Open (or create) the cache database.
+
+        Args:
+            db_path (str): SQLite database file
+        """
+        self.db_path = db_path
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._create_tables()
+
+    def encode(self, model_name, texts, encode_fn, dimension):
+        """
+        Return embeddings for texts, calling encode_fn only for texts not in the cache.
+
+        Args:
+            model_name (str): Identifies the model (and any output transformation such as normalization)
+            texts (list): Texts to embed
+            encode_fn (callable): encode_fn(list of texts) -> float32 matrix
+            dimension (int): Embedding size, so that no texts still give a (0, dimension) matrix
+
+        Returns:
+            np.ndarray: float32 matrix, one row per text
+        """
+        keys = [text_sha256(text) for text in texts]
+        found = self._lookup(model_name, set(keys))
+
+        # Identical texts are encoded once
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+        if missing:
+            vectors = np.asarray(encode_fn(list(missing.values())), dtype="float32")
+            new_entries = dict(zip(missing, vectors))
+            self._store(model_name, new_entries)
+            found.update(new_entries)
+
+        hits = sum(1 for key in keys if key not in missing)
+        with self._lock:
+            self.hits += hits
+            self.misses += len(texts) - hits
+        if texts:
+            print(f"🧠 Embeddings: {hits} from cache, {len(missing)} encoded")
+        return np.vstack([found[key] for key in keys]) if keys else np.zeros((0, dimension), dtype="float32")
+
+    def stats(self):
+        """Return hit/miss counts of this process and the number of stored embeddings."""
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        conn = self._connect()
+        try:
+            entries = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        finally:
+            conn.close()
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / (hits + misses), 4) if hits + misses else None,
+            "entries": entries,
+        }
+
+    def _lookup(self, model_name, keys):
+        keys = list(keys)
+        found = {}
+        conn = self._connect()
+        try:
+            for i in range(0, len(keys), LOOKUP_BATCH_SIZE):
+                batch = keys[i:i + LOOKUP_BATCH_SIZE]
+                rows = conn.execute(
+                    f"SELECT text_sha256, vector FROM embeddings WHERE model = ? "
+                    f"AND text_sha256 IN ({','.join('?' * len(batch))})",
+                    (model_name, *batch)
+                ).fetchall()
+                for key, vector in rows:
+                    found[key] = np.frombuffer(vector, dtype="float32")
+        finally:
+            conn.close()
+        return found
+
+    def _store(self, model_name, entries):
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_sha256, vector) VALUES (?, ?, ?)",
+                [(model_name, key, vector.tobytes()) for key, vector in entries.items()]
+            )
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+
+    def _create_tables(self):
+        directory = os.path.dirname(self.db_path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        conn = self._connect()
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS embeddings (
+                    model TEXT NOT NULL,
+                    text_sha256 TEXT NOT NULL,
+                    vector BLOB NOT NULL,
+                    PRIMARY KEY (model, text_sha256)
+                ) WITHOUT ROWID
+            """)
+        finally:
+            conn.close()
+
+_embedding_cache = None
+_embedding_cache_lock = threading.Lock()
+
+def get_embedding_cache():
+    """Return the embedding cache shared by the whole process."""
+    global _embedding_cache
+    with _embedding_cache_lock:
+        if _embedding_cache is None:
+            _embedding_cache = EmbeddingCache()
+        return _embedding_cache
@@ -0,0 +1,49 @@
+"""
+Small file helpers shared by the downloader, the transcriber and the global index.
+"""
+
+import os
+import time
+import hashlib
+from contextlib import contextmanager
+
+def file_sha256(file_path, block_size=1024 * 1024):
+    """Compute the SHA-256 hash of a file in blocks."""
+    sha = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+@contextmanager
+def file_lock(lock_path):
+    """
+    Hold an exclusive lock on a file, shared by all processes using the same path.
+
+    The lock is not reentrant: a thread holding it must not take it again.
+    """
+    with open(lock_path, "a+b") as f:
+        if os.name == "nt":
+            import msvcrt
+
+            f.seek(0)
+            while True:
+                try:
+                    # LK_LOCK gives up after about 10 seconds, so it is retried
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    time.sleep(0.1)
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
@@ -0,0 +1,530 @@
+"""
+Global vector index over all videos.
+The vectors of every indexed video live in one ID-mapped FAISS index split
+into shards, with per-vector metadata (video, chunk text, segment times) in
+SQLite. Videos can be added, replaced and removed without a rebuild, and
+searches can be limited to a subset of videos. The shard being filled is a
+flat index; once full it is rebuilt as the index type its size calls for.
+Vectors are unit length and searched by inner product (cosine similarity).
+Several processes can share the directory: writes are serialized by a lock
+file, and shards changed by another process are read again.
+
+Usage:
+    python global_index.py import ./rag_indexes
+    python global_index.py list
+    python global_index.py remove <video_id>
+"""
+
+import os
+import re
+import time
+import sqlite3
+import argparse
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager, ExitStack
+
+import numpy as np
+
+from file_utils import file_lock
+from index_builder import (INDEX_MEMORY_BUDGET_MB, VECTOR_ENCODING, create_index, build_index, choose_index_type,
+                           index_type_of, set_search_params, search_parameters, supports_removal, rebuild_index,
+                           index_vectors, reconstruct_vectors, normalize_vectors, needs_migration, migrate_index)
+
+GLOBAL_INDEX_DIR = os.environ.get("GLOBAL_INDEX_DIR", "./rag_indexes/global")
+# Vectors per shard; a new shard is started when the last one is full
+SHARD_SIZE = int(os.environ.get("GLOBAL_INDEX_SHARD_SIZE", "100000"))
+# Shards kept in memory at once; the others are read from disk when searched
+MAX_LOADED_SHARDS = int(os.environ.get("GLOBAL_INDEX_MAX_LOADED_SHARDS", "4"))
+# The shard being filled must not need training, so int8 shards are filled as float16 and converted when full
+WRITABLE_ENCODING = "float16" if VECTOR_ENCODING == "int8" else VECTOR_ENCODING
+
+# Transcripts are named "<audio name>_<YYYYmmdd_HHMMSS>"; the audio name identifies the video
+TIMESTAMP_SUFFIX = re.compile(r"_\d{8}_\d{6}$")
+
+def video_id_for_path(file_path):
+    """
+    Derive the video ID used in the global index from a transcript or index path.
+
+    Re-transcribing a video gives a new timestamped file but the same video ID,
+    so the new vectors replace the old ones.
+    """
+    base_name = os.path.basename(file_path)
+    for extension in (".jsonl", ".txt", ".index"):
+        if base_name.endswith(extension):
+            base_name = base_name[:-len(extension)]
+    return TIMESTAMP_SUFFIX.sub("", base_name)
+
+class GlobalIndex:
+    def __init__(self, index_dir=GLOBAL_INDEX_DIR, dimension=None, shard_size=SHARD_SIZE,
+                 max_loaded_shards=MAX_LOADED_SHARDS, memory_budget_mb=INDEX_MEMORY_BUDGET_MB):
+        """
+        Open (or create) the global index in a directory.
+
+        Args:
+            index_dir (str): Directory holding the shards and the metadata database
+            dimension (int): Embedding dimension; required only when the index is new
+            shard_size (int): Maximum vectors per shard
+            max_loaded_shards (int): Shards kept in memory at once
+            memory_budget_mb (float): Memory for all loaded shards, used to pick the type of full shards
+        """
+        self.index_dir = index_dir
+        self.shard_size = shard_size
+        self.max_loaded_shards = max_loaded_shards
+        self.memory_budget_mb = memory_budget_mb
+        self.nprobe = None
+        self.ef_search = None
+        self.db_path = os.path.join(index_dir, "metadata.db")
+        self.lock_path = os.path.join(index_dir, "write.lock")
+        self._shards = OrderedDict()
+        # Modification time of each loaded shard's file when it was loaded or saved
+        self._shard_mtimes = {}
+        # Index version the loaded shards belong to
+        self._synced_version = None
+        self._write_depth = 0
+        self._lock = threading.RLock()
+        if not os.path.exists(index_dir):
+            os.makedirs(index_dir)
+        self._create_tables()
+
+        stored_dimension = self._get_meta("dimension")
+        if stored_dimension is None and dimension is not None:
+            self._set_meta("dimension", dimension)
+            stored_dimension = dimension
+        if stored_dimension is not None and dimension is not None and int(stored_dimension) != dimension:
+            raise ValueError(f"❌ Global index has dimension {stored_dimension}, embeddings have {dimension}")
+        self.dimension = int(stored_dimension) if stored_dimension is not None else None
+
+    @property
+    def version(self):
+        """Number incremented on every change, so caches of search results can tell they are stale."""
+        return int(self._get_meta("version") or 0)
+
+    def add_video(self, video_id, embeddings, chunks, chunk_times=None, title=None, source=None):
+        """
+        Add a video's chunk vectors, replacing the video if it is already indexed.
+
+        Args:
+            video_id (str): Video identifier
+            embeddings (np.ndarray): One float32 vector per chunk
+            chunks (list): Chunk texts
+            chunk_times (list): (start, end) seconds per chunk, or None for untimed transcripts
+            title (str): Display name of the video
+            source (str): File the vectors came from
+
+        Returns:
+            int: Number of vectors added
+        """
+        embeddings = normalize_vectors(embeddings)
+        if len(embeddings) != len(chunks):
+            raise ValueError("❌ Embeddings and chunks differ in length")
+        if self.dimension is None:
+            self.dimension = embeddings.shape[1]
+            self._set_meta("dimension", self.dimension)
+        chunk_times = chunk_times or [(None, None)] * len(chunks)
+
+        with self._writing():
+            # IDs are reserved before any vector is written. If the process stops before the rows are
+            # committed, the written vectors have no metadata (searches skip them) and their IDs are
+            # never issued again, so they can't be mistaken for a later chunk.
+            next_id = self._reserve_ids(len(chunks))
+            ids = np.arange(next_id, next_id + len(chunks), dtype="int64")
+
+            conn = self._connect()
+            try:
+                # The old chunks are deleted in the transaction that inserts the new ones,
+                # so readers see either version of the video, never neither
+                conn.execute("BEGIN IMMEDIATE")
+                self._remove_vectors(video_id, conn)
+                rows, offset = [], 0
+                while offset < len(chunks):
+                    shard_number = self._writable_shard(conn)
+                    shard = self._load_shard(shard_number)
+                    end = min(len(chunks), offset + self.shard_size - shard.ntotal)
+                    shard.add_with_ids(embeddings[offset:end], ids[offset:end])
+                    # Saved right away: loading the next shard may evict this one from memory
+                    self._save_shard(shard_number)
+                    for position in range(offset, end):
+                        start_time, end_time = chunk_times[position]
+                        rows.append((int(ids[position]), video_id, shard_number, position,
+                                     chunks[position], start_time, end_time))
+                    offset = end
+
+                conn.executemany("INSERT INTO chunks VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+                conn.execute("INSERT OR REPLACE INTO videos VALUES (?, ?, ?, ?, ?)",
+                             (video_id, title or video_id, source, len(chunks), time.time()))
+                version = self._bump_version(conn)
+                conn.execute("COMMIT")
+                self._synced_version = version
+            finally:
+                conn.close()
+        print(f"✅ Added {len(chunks)} vectors of {video_id} to the global index")
+        return len(chunks)
+
+    def tune(self, nprobe=None, ef_search=None):
+        """Set nprobe (IVF-PQ shards) and efSearch (HNSW shards) for later searches."""
+        with self._lock:
+            self.nprobe, self.ef_search = nprobe, ef_search
+            for shard in self._shards.values():
+                set_search_params(shard, nprobe, ef_search)
+
+    def remove_video(self, video_id):
+        """
+        Remove a video's vectors and metadata.
+
+        Returns:
+            int: Number of vectors removed
+        """
+        with self._writing():
+            conn = self._connect()
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                removed = self._remove_vectors(video_id, conn)
+                conn.execute("DELETE FROM videos WHERE video_id = ?", (video_id,))
+                version = self._bump_version(conn)
+                conn.execute("COMMIT")
+                self._synced_version = version
+            finally:
+                conn.close()
+        print(f"🗑️ Removed {removed} vectors of {video_id} from the global index")
+        return removed
+
+    def search(self, query_embedding, top_k=3, video_ids=None):
+        """
+        Find the chunks closest to a query embedding.
+
+        Args:
+            query_embedding (np.ndarray): Query vector of shape (1, dimension)
+            top_k (int): Number of results
+            video_ids (list): Only search these videos (None searches all)
+
+        Returns:
+            list: Dicts with id, video_id, title, text, start, end and score (cosine similarity), closest first
+        """
+        import faiss
+
+        query_embedding = np.ascontiguousarray(query_embedding, dtype="float32")
+        with self._lock:
+            self._sync()
+            candidates = []
+            for shard_number in self._shards_to_search(video_ids):
+                shard = self._load_shard(shard_number)
+                if shard.ntotal == 0:
+                    continue
+                params = None
+                if video_ids is not None:
+                    # Restrict the search to the chosen videos' IDs instead of filtering afterwards
+                    selector = faiss.IDSelectorBatch(self._chunk_ids(video_ids, shard_number))
+                    params = search_parameters(shard, selector)
+                scores, ids = shard.search(query_embedding, min(top_k, shard.ntotal), params=params)
+                candidates.extend((float(score), int(chunk_id))
+                                  for score, chunk_id in zip(scores[0], ids[0]) if chunk_id >= 0)
+
+        candidates.sort(reverse=True)
+        candidates = candidates[:top_k]
+        metadata = self._chunk_metadata([chunk_id for _, chunk_id in candidates])
+        # Vectors whose metadata is missing (interrupted write) are skipped
+        return [dict(metadata[chunk_id], score=score)
+                for score, chunk_id in candidates if chunk_id in metadata]
+
+    def list_videos(self):
+        """Return the indexed videos as dicts (video_id, title, source, chunk_count, added)."""
+        return [dict(row) for row in self._query("SELECT * FROM videos ORDER BY title")]
+
+    def stats(self):
+        """Return counts of videos, vectors and shards."""
+        return {
+            "videos": self._query("SELECT COUNT(*) AS n FROM videos")[0]["n"],
+            "vectors": self._query("SELECT COUNT(*) AS n FROM chunks")[0]["n"],
+            "shards": int(self._get_meta("shards") or 0),
+            "loaded_shards": len(self._shards),
+            "version": self.version,
+        }
+
+    def migrate(self):
+        """Convert every shard saved before embeddings were normalized."""
+        with self._writing():
+            for shard_number in range(int(self._get_meta("shards") or 0)):
+                self._load_shard(shard_number)
+
+    @contextmanager
+    def _writing(self):
+        """Hold the thread lock and, across processes, the lock file; nested use only takes the thread lock."""
+        with self._lock, ExitStack() as stack:
+            if not self._write_depth:
+                stack.enter_context(file_lock(self.lock_path))
+                # Another process may have written since the shards in memory were loaded
+                self._sync()
+            self._write_depth += 1
+            try:
+                yield
+            finally:
+                self._write_depth -= 1
+
+    def _sync(self):
+        """Forget the loaded shards if the index changed since they were loaded."""
+        version = self.version
+        if version != self._synced_version:
+            self._shards.clear()
+            self._shard_mtimes.clear()
+            self._synced_version = version
+
+    def _remove_vectors(self, video_id, conn):
+        """Remove a video's vectors from its shards and delete its chunk rows in the caller's transaction."""
+        import faiss
+
+        rows = conn.execute("SELECT id, shard FROM chunks WHERE video_id = ?", (video_id,)).fetchall()
+        by_shard = {}
+        for row in rows:
+            by_shard.setdefault(row["shard"], []).append(row["id"])
+        for shard_number, ids in by_shard.items():
+            shard = self._load_shard(shard_number)
+            ids = np.array(ids, dtype="int64")
+            if supports_removal(shard):
+                shard.remove_ids(ids)
+            else:
+                # HNSW and IVF-PQ shards can't drop vectors in place, so the shard is rebuilt from the remaining ones
+                vectors, shard_ids = index_vectors(shard)
+                keep = ~np.isin(shard_ids, ids)
+                if keep.any():
+                    self._shards[shard_number] = rebuild_index(shard, vectors[keep], shard_ids[keep])
+                else:
+                    self._shards[shard_number] = faiss.IndexIDMap2(
+                        create_index("flat", self.dimension, encoding=WRITABLE_ENCODING)
+                    )
+                self._tune_shard(self._shards[shard_number])
+            self._save_shard(shard_number)
+        conn.execute("DELETE FROM chunks WHERE video_id = ?", (video_id,))
+        return len(rows)
+
+    def _shards_to_search(self, video_ids):
+        if video_ids is None:
+            return range(int(self._get_meta("shards") or 0))
+        placeholders = ",".join("?" * len(video_ids))
+        rows = self._query(f"SELECT DISTINCT shard FROM chunks WHERE video_id IN ({placeholders})",
+                           tuple(video_ids))
+        return sorted(row["shard"] for row in rows)
+
+    def _chunk_ids(self, video_ids, shard_number):
+        placeholders = ",".join("?" * len(video_ids))
+        rows = self._query(f"SELECT id FROM chunks WHERE shard = ? AND video_id IN ({placeholders})",
+                           (shard_number, *video_ids))
+        return np.array([row["id"] for row in rows], dtype="int64")
+
+    def _chunk_metadata(self, chunk_ids):
+        if not chunk_ids:
+            return {}
+        placeholders = ",".join("?" * len(chunk_ids))
+        rows = self._query(
+            f"SELECT c.id, c.video_id, v.title, c.text, c.start_time, c.end_time FROM chunks c "
+            f"JOIN videos v ON v.video_id = c.video_id WHERE c.id IN ({placeholders})",
+            tuple(chunk_ids)
+        )
+        return {row["id"]: {"id": row["id"], "video_id": row["video_id"], "title": row["title"],
+                            "text": row["text"], "start": row["start_time"], "end": row["end_time"]}
+                for row in rows}
+
+    def _writable_shard(self, conn):
+        shard_count = int(self._get_meta("shards", conn) or 0)
+        if shard_count and self._load_shard(shard_count - 1).ntotal < self.shard_size:
+            return shard_count - 1
+        if shard_count:
+            self._seal_shard(shard_count - 1)
+        self._set_meta("shards", shard_count + 1, conn)
+        return shard_count
+
+    def _seal_shard(self, shard_number):
+        # A full shard no longer grows, so it is rebuilt once as the type its size and budget call for
+        shard = self._load_shard(shard_number)
+        if index_type_of(shard) != "flat":
+            return
+        index_type = choose_index_type(shard.ntotal, self.dimension, self.memory_budget_mb / self.max_loaded_shards)
+        if index_type == "flat" and VECTOR_ENCODING == WRITABLE_ENCODING:
+            return
+        print(f"📦 Rebuilding full shard {shard_number} as {index_type}...")
+        vectors, ids = index_vectors(shard)
+        self._shards[shard_number] = build_index(vectors, ids, index_type=index_type)
+        self._tune_shard(self._shards[shard_number])
+        self._save_shard(shard_number)
+
+    def _tune_shard(self, shard):
+        set_search_params(shard, self.nprobe, self.ef_search)
+
+    def _shard_path(self, shard_number):
+        return os.path.join(self.index_dir, f"shard_{shard_number:04d}.index")
+
+    def _shard_mtime(self, shard_number):
+        try:
+            return os.stat(self._shard_path(shard_number)).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _load_shard(self, shard_number):
+        import faiss
+
+        if shard_number in self._shards:
+            if self._shard_mtimes.get(shard_number) == self._shard_mtime(shard_number):
+                self._shards.move_to_end(shard_number)
+                return self._shards[shard_number]
+            # Saved by another process since it was loaded
+            del self._shards[shard_number]
+
+        path = self._shard_path(shard_number)
+        if os.path.exists(path):
+            mtime = self._shard_mtime(shard_number)
+            shard = faiss.read_index(path)
+            self._shard_mtimes[shard_number] = mtime
+            if needs_migration(shard):
+                # Shards written before embeddings were normalized are converted once, in place
+                with self._writing():
+                    print(f"🔄 Converting shard {shard_number} to normalized inner-product vectors...")
+                    shard = migrate_index(faiss.read_index(path))
+                    self._shards[shard_number] = shard
+                    self._save_shard(shard_number)
+            self._tune_shard(shard)
+        else:
+            shard = faiss.IndexIDMap2(create_index("flat", self.dimension, encoding=WRITABLE_ENCODING))
+            self._shard_mtimes[shard_number] = None
+        self._shards[shard_number] = shard
+        # Shards are saved after every change, so evicting one loses nothing
+        while len(self._shards) > self.max_loaded_shards:
+            evicted, _ = self._shards.popitem(last=False)
+            self._shard_mtimes.pop(evicted, None)
+        return shard
+
+    def _save_shard(self, shard_number):
+        import faiss
+
+        path = self._shard_path(shard_number)
+        temp_path = path + ".tmp"
+        faiss.write_index(self._shards[shard_number], temp_path)
+        os.replace(temp_path, path)
+        self._shard_mtimes[shard_number] = self._shard_mtime(shard_number)
+
+    def _reserve_ids(self, count):
+        """Advance next_id by count in its own transaction and return the first reserved ID."""
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT value FROM meta WHERE key = 'next_id'").fetchone()
+            next_id = int(row["value"]) if row else 0
+            self._set_meta("next_id", next_id + count, conn)
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+        return next_id
+
+    def _bump_version(self, conn):
+        row = conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        version = int(row["value"]) + 1 if row else 1
+        self._set_meta("version", version, conn)
+        return version
+
+    def _get_meta(self, key, conn=None):
+        sql, args = "SELECT value FROM meta WHERE key = ?", (key,)
+        rows = conn.execute(sql, args).fetchall() if conn is not None else self._query(sql, args)
+        return rows[0]["value"] if rows else None
+
+    def _set_meta(self, key, value, conn=None):
+        sql, args = "INSERT OR REPLACE INTO meta VALUES (?, ?)", (key, str(value))
+        if conn is not None:
+            conn.execute(sql, args)
+        else:
+            self._execute(sql, args)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _execute(self, sql, args=()):
+        conn = self._connect()
+        try:
+            conn.execute(sql, args)
+        finally:
+            conn.close()
+
+    def _query(self, sql, args=()):
+        conn = self._connect()
+        try:
+            return conn.execute(sql, args).fetchall()
+        finally:
+            conn.close()
+
+    def _create_tables(self):
+        conn = self._connect()
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS videos (
+                    video_id TEXT PRIMARY KEY,
+                    title TEXT NOT NULL,
+                    source TEXT,
+                    chunk_count INTEGER NOT NULL,
+                    added REAL NOT NULL
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS chunks (
+                    id INTEGER PRIMARY KEY,
+                    video_id TEXT NOT NULL,
+                    shard INTEGER NOT NULL,
+                    position INTEGER NOT NULL,
+                    text TEXT NOT NULL,
+                    start_time REAL,
+                    end_time REAL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS chunks_video ON chunks (video_id, shard)")
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        finally:
+            conn.close()
+
+_global_index = None
+_global_index_lock = threading.Lock()
+
+def get_global_index(dimension=None):
+    """Return the global index shared by the whole process, opening it on first use."""
+    global _global_index
+    with _global_index_lock:
+        if _global_index is None:
+            _global_index = GlobalIndex(dimension=dimension)
+        return _global_index
+
+def import_saved_indexes(index_dir="./rag_indexes"):
+    """Add every per-transcript index saved in index_dir to the global index."""
+    from rag_helper import RAGIndex
+
+    for name in sorted(os.listdir(index_dir)):
+        if not name.endswith(".index"):
+            continue
+        file_path = os.path.join(index_dir, name[:-len(".index")])
+        rag_index = RAGIndex.load(file_path)
+        embeddings = reconstruct_vectors(rag_index.index)
+        video_id = video_id_for_path(file_path)
+        get_global_index(embeddings.shape[1]).add_video(
+            video_id, embeddings, rag_index.chunks, rag_index.chunk_times, source=file_path
+        )
+        rag_index.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the global multi-video index")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    import_parser = subparsers.add_parser("import", help="Add saved per-transcript indexes")
+    import_parser.add_argument("index_dir", nargs="?", default="./rag_indexes")
+    subparsers.add_parser("list", help="List indexed videos")
+    remove_parser = subparsers.add_parser("remove", help="Remove a video")
+    remove_parser.add_argument("video_id")
+    args = parser.parse_args()
+
+    if args.command == "import":
+        import_saved_indexes(args.index_dir)
+    elif args.command == "remove":
+        get_global_index().remove_video(args.video_id)
+    else:
+        for video in get_global_index().list_videos():
+            print(f"{video['video_id']}: {video['chunk_count']} chunks")
+    print(get_global_index().stats())
+
+if __name__ == "__main__":
+    main()
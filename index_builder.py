@@ -0,0 +1,287 @@
+"""
+Vector index construction.
+Chooses between exact (Flat), graph (HNSW) and compressed inverted-file
+(IVF-PQ) FAISS indexes by vector count and memory budget, trains IVF
+centroids on a sample and applies search-time tuning (nprobe, efSearch).
+
+Embeddings are unit length, so indexes use inner product (cosine
+similarity) and store vectors as float16 or int8 scalar-quantized codes.
+"""
+
+import os
+import math
+
+import numpy as np
+
+INDEX_TYPES = ["flat", "hnsw", "ivfpq"]
+
+# Storage of full vectors in Flat and HNSW indexes: factory suffix and bytes per dimension
+VECTOR_ENCODINGS = {
+    "float32": ("Flat", 4),
+    "float16": ("SQfp16", 2),
+    "int8": ("SQ8", 1),
+}
+VECTOR_ENCODING = os.environ.get("VECTOR_ENCODING", "float16")
+# Normalized embeddings: inner product is cosine similarity (faiss.METRIC_INNER_PRODUCT; the value is
+# written out so that importing this module does not load faiss)
+INDEX_METRIC = 0
+
+# Up to this many vectors an exact search is fast enough
+FLAT_MAX_VECTORS = int(os.environ.get("FLAT_MAX_VECTORS", "50000"))
+INDEX_MEMORY_BUDGET_MB = float(os.environ.get("INDEX_MEMORY_BUDGET_MB", "1024"))
+HNSW_M = int(os.environ.get("HNSW_M", "32"))
+# Search-time accuracy/speed trade-offs: IVF lists visited, HNSW candidate list size
+DEFAULT_NPROBE = int(os.environ.get("INDEX_NPROBE", "16"))
+DEFAULT_EF_SEARCH = int(os.environ.get("INDEX_EF_SEARCH", "64"))
+
+# IVF-PQ needs enough vectors to train 256 codewords per sub-quantizer
+IVFPQ_MIN_VECTORS = 10000
+# IVF centroids are trained on a sample of at most this many vectors per list
+TRAINING_SAMPLES_PER_LIST = 64
+
+def ivf_list_count(num_vectors):
+    """Number of IVF lists: about 4 * sqrt(n), with at least 39 training vectors per list."""
+    return max(1, min(int(4 * math.sqrt(num_vectors)), num_vectors // 39))
+
+def pq_subquantizers(dimension):
+    """Number of PQ sub-vectors: a divisor of the dimension close to 8 dimensions per sub-vector."""
+    for m in range(max(1, dimension // 8), 0, -1):
+        if dimension % m == 0:
+            return m
+    return 1
+
+def estimate_index_memory_mb(index_type, num_vectors, dimension, encoding=VECTOR_ENCODING):
+    """Approximate memory use of an index type for a number of vectors."""
+    bytes_per_dimension = VECTOR_ENCODINGS[encoding][1]
+    if index_type == "flat":
+        size = num_vectors * dimension * bytes_per_dimension
+    elif index_type == "hnsw":
+        # Encoded vectors plus 2 * M neighbour links on the base layer
+        size = num_vectors * (dimension * bytes_per_dimension + HNSW_M * 2 * 4)
+    elif index_type == "ivfpq":
+        # PQ codes and IDs per vector, plus the coarse centroids
+        size = num_vectors * (pq_subquantizers(dimension) + 8) + ivf_list_count(num_vectors) * dimension * 4
+    else:
+        raise ValueError(f"Unknown index type: {index_type} (options: {', '.join(INDEX_TYPES)})")
+    return size / (1024 * 1024)
+
+def choose_index_type(num_vectors, dimension, memory_budget_mb=INDEX_MEMORY_BUDGET_MB, encoding=VECTOR_ENCODING):
+    """
+    Pick the index type for a corpus.
+
+    Flat while exact search is cheap, HNSW while full vectors fit the memory
+    budget, IVF-PQ beyond that.
+
+    Args:
+        num_vectors (int): Number of vectors to index
+        dimension (int): Embedding dimension
+        memory_budget_mb (float): Memory the index may use
+        encoding (str): Vector encoding of Flat and HNSW indexes
+
+    Returns:
+        str: One of INDEX_TYPES
+    """
+    if num_vectors <= FLAT_MAX_VECTORS and \
+            estimate_index_memory_mb("flat", num_vectors, dimension, encoding) <= memory_budget_mb:
+        return "flat"
+    if num_vectors < IVFPQ_MIN_VECTORS or \
+            estimate_index_memory_mb("hnsw", num_vectors, dimension, encoding) <= memory_budget_mb:
+        return "hnsw"
+    return "ivfpq"
+
+def index_factory_string(index_type, num_vectors, dimension, encoding=VECTOR_ENCODING):
+    """FAISS index_factory description of an index type."""
+    if encoding not in VECTOR_ENCODINGS:
+        raise ValueError(f"Unknown vector encoding: {encoding} (options: {', '.join(VECTOR_ENCODINGS)})")
+    storage = VECTOR_ENCODINGS[encoding][0]
+    if index_type == "flat":
+        return storage
+    if index_type == "hnsw":
+        return f"HNSW{HNSW_M}" if storage == "Flat" else f"HNSW{HNSW_M},{storage}"
+    if index_type == "ivfpq":
+        # PQ codes are already compressed; the encoding does not apply
+        return f"IVF{ivf_list_count(num_vectors)},PQ{pq_subquantizers(dimension)}"
+    raise ValueError(f"Unknown index type: {index_type} (options: {', '.join(INDEX_TYPES)})")
+
+def create_index(index_type, dimension, num_vectors=0, encoding=VECTOR_ENCODING):
+    """Create an empty (possibly untrained) inner-product index of a type."""
+    import faiss
+
+    index = faiss.index_factory(dimension, index_factory_string(index_type, num_vectors, dimension, encoding),
+                                INDEX_METRIC)
+    set_search_params(index)
+    return index
+
+def normalize_vectors(vectors):
+    """Return float32 copies of vectors scaled to unit length."""
+    import faiss
+
+    vectors = np.array(vectors, dtype="float32")
+    faiss.normalize_L2(vectors)
+    return vectors
+
+def build_index(embeddings, ids=None, index_type="auto", memory_budget_mb=INDEX_MEMORY_BUDGET_MB,
+                nprobe=None, ef_search=None, encoding=VECTOR_ENCODING):
+    """
+    Build a searchable index from embeddings.
+
+    Args:
+        embeddings (np.ndarray): float32 matrix of unit-length vectors, one per row
+        ids (np.ndarray): int64 IDs for the vectors; the index is wrapped in an IndexIDMap2 if given
+        index_type (str): "auto" or one of INDEX_TYPES
+        memory_budget_mb (float): Memory budget used by "auto"
+        nprobe (int): IVF lists visited per query
+        ef_search (int): HNSW candidate list size per query
+        encoding (str): Vector encoding of Flat and HNSW indexes (see VECTOR_ENCODINGS)
+
+    Returns:
+        faiss.Index: The filled index
+    """
+    import faiss
+
+    embeddings = np.ascontiguousarray(embeddings, dtype="float32")
+    num_vectors, dimension = embeddings.shape
+    if index_type == "auto":
+        index_type = choose_index_type(num_vectors, dimension, memory_budget_mb, encoding)
+    if index_type == "ivfpq" and num_vectors < IVFPQ_MIN_VECTORS:
+        print(f"⚠️ {num_vectors} vectors are too few to train IVF-PQ, using HNSW")
+        index_type = "hnsw"
+
+    index = create_index(index_type, dimension, num_vectors, encoding)
+    if not index.is_trained:
+        # Centroids, codebooks and int8 ranges are trained on a random sample rather than the whole corpus
+        sample_size = min(num_vectors, max(IVFPQ_MIN_VECTORS, ivf_list_count(num_vectors) * TRAINING_SAMPLES_PER_LIST))
+        sample = embeddings[np.random.default_rng(0).choice(num_vectors, sample_size, replace=False)]
+        print(f"🎯 Training {index_type} index on {sample_size} of {num_vectors} vectors...")
+        index.train(sample)
+
+    if ids is not None:
+        index = faiss.IndexIDMap2(index)
+        index.add_with_ids(embeddings, np.ascontiguousarray(ids, dtype="int64"))
+    else:
+        index.add(embeddings)
+    set_search_params(index, nprobe, ef_search)
+    return index
+
+def base_index(index):
+    """Return the index inside an IndexIDMap wrapper (or the index itself)."""
+    import faiss
+
+    if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        return faiss.downcast_index(index.index)
+    return faiss.downcast_index(index)
+
+def index_type_of(index):
+    """Return the INDEX_TYPES name of an index."""
+    import faiss
+
+    if faiss.try_extract_index_ivf(index) is not None:
+        return "ivfpq"
+    if isinstance(base_index(index), faiss.IndexHNSW):
+        return "hnsw"
+    return "flat"
+
+def set_search_params(index, nprobe=None, ef_search=None):
+    """Apply nprobe (IVF) or efSearch (HNSW) to an index; defaults come from the environment."""
+    import faiss
+
+    index_type = index_type_of(index)
+    if index_type == "ivfpq":
+        faiss.ParameterSpace().set_index_parameter(index, "nprobe", nprobe or DEFAULT_NPROBE)
+    elif index_type == "hnsw":
+        faiss.ParameterSpace().set_index_parameter(index, "efSearch", ef_search or DEFAULT_EF_SEARCH)
+
+def search_parameters(index, selector):
+    """
+    SearchParameters restricting a search to selected IDs.
+
+    IVF and HNSW indexes need their own parameter types, which also carry
+    the index's current nprobe/efSearch.
+    """
+    import faiss
+
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        return faiss.SearchParametersIVF(sel=selector, nprobe=ivf.nprobe)
+    base = base_index(index)
+    if isinstance(base, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=base.hnsw.efSearch)
+    return faiss.SearchParameters(sel=selector)
+
+def supports_removal(index):
+    """
+    Whether remove_ids can be used on an ID-mapped index.
+
+    HNSW graphs can't remove vectors. An IVF index inside an IndexIDMap2
+    keeps the internal IDs the wrapper compacts on removal, so results would
+    map to the wrong IDs. Both have to be rebuilt without the vectors.
+    """
+    return index_type_of(index) == "flat"
+
+def rebuild_index(index, embeddings, ids):
+    """
+    Build an ID-mapped index of the same type as index from embeddings.
+
+    IVF-PQ indexes keep their trained centroids and codebooks instead of
+    being trained again.
+    """
+    import faiss
+
+    index_type = index_type_of(index)
+    if index_type != "ivfpq":
+        return build_index(embeddings, ids, index_type=index_type)
+    empty = faiss.clone_index(base_index(index))
+    empty.reset()
+    rebuilt = faiss.IndexIDMap2(empty)
+    rebuilt.add_with_ids(np.ascontiguousarray(embeddings, dtype="float32"), np.ascontiguousarray(ids, dtype="int64"))
+    return rebuilt
+
+def reconstruct_vectors(index):
+    """Read back all vectors of an index (approximate for float16, int8 and PQ encodings)."""
+    import faiss
+
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.make_direct_map()
+    return base_index(index).reconstruct_n(0, index.ntotal)
+
+def index_vectors(index):
+    """
+    Read back the vectors and IDs of an ID-mapped index.
+
+    Returns:
+        tuple: (float32 vectors, int64 IDs)
+    """
+    import faiss
+
+    return reconstruct_vectors(index), faiss.vector_to_array(index.id_map)
+
+def needs_migration(index):
+    """Indexes saved before embeddings were normalized use L2 distance on raw vectors."""
+    return index.metric_type != INDEX_METRIC
+
+def migrate_index(index, encoding=VECTOR_ENCODING):
+    """
+    Rebuild an index as a normalized inner-product index of the same type.
+
+    The stored vectors are normalized instead of embedding the chunks again;
+    normalizing a raw embedding gives the same vector the encoder now returns.
+
+    Args:
+        index (faiss.Index): Index to convert (IDs are kept if it is ID-mapped)
+        encoding (str): Vector encoding of the new index
+
+    Returns:
+        faiss.Index: The converted index
+    """
+    import faiss
+
+    ids = None
+    if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        vectors, ids = index_vectors(index)
+    else:
+        vectors = reconstruct_vectors(index)
+    if index.ntotal == 0:
+        empty = create_index("flat", index.d, encoding="float32")
+        return faiss.IndexIDMap2(empty) if ids is not None else empty
+    return build_index(normalize_vectors(vectors), ids, index_type=index_type_of(index), encoding=encoding)
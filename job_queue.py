@@ -0,0 +1,332 @@
+"""
+Persistent background job queue.
+Jobs are stored in SQLite and run by worker threads, with a concurrency limit
+per stage, progress reporting, cancellation and retries.
+
+Several processes (the app, batch runs) can share one database. A running
+job records the queue that owns it, and that queue refreshes the job's
+heartbeat while it runs. Only jobs whose heartbeat has gone stale, because
+their process died, are picked up again by another queue.
+"""
+
+import os
+import json
+import time
+import uuid
+import socket
+import sqlite3
+import threading
+
+JOB_DB_PATH = os.environ.get("JOB_DB_PATH", "./jobs.db")
+# Seconds between heartbeats of running jobs
+HEARTBEAT_INTERVAL = float(os.environ.get("JOB_HEARTBEAT_INTERVAL", "10"))
+# A running job whose heartbeat is older than this is considered abandoned and queued again
+HEARTBEAT_TIMEOUT = float(os.environ.get("JOB_HEARTBEAT_TIMEOUT", "60"))
+
+# Job states
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED_STATES = (COMPLETED, FAILED, CANCELLED)
+
+class JobCancelled(Exception):
+    """Raised inside a job handler when the job has been cancelled."""
+
+class JobContext:
+    def __init__(self, job_queue, job_id, attempt):
+        """Handle given to a job handler to report progress and check for cancellation."""
+        self.job_queue = job_queue
+        self.id = job_id
+        self.attempt = attempt
+
+    def update(self, progress=None, message=None):
+        """
+        Report progress and stop the job if it has been cancelled.
+
+        Args:
+            progress (float): Fraction done between 0 and 1
+            message (str): Short status text shown to the user
+        """
+        self.job_queue._update_progress(self.id, progress, message)
+        self.check_cancelled()
+
+    def check_cancelled(self):
+        """Raise JobCancelled if cancellation was requested."""
+        if self.job_queue._cancel_requested(self.id):
+            raise JobCancelled(f"Job {self.id} cancelled")
+
+class JobQueue:
+    def __init__(self, db_path=JOB_DB_PATH, stage_limits=None, poll_interval=0.5,
+                 heartbeat_interval=HEARTBEAT_INTERVAL, heartbeat_timeout=HEARTBEAT_TIMEOUT):
+        """
+        Initialize the queue and its database.
+
+        Args:
+            db_path (str): SQLite database file
+            stage_limits (dict): Maximum concurrently running jobs per stage
+            poll_interval (float): Seconds an idle worker waits between checks
+            heartbeat_interval (float): Seconds between heartbeats of this queue's running jobs
+            heartbeat_timeout (float): Age of a heartbeat after which a running job is queued again
+        """
+        self.db_path = db_path
+        self.stage_limits = stage_limits or {}
+        self.poll_interval = poll_interval
+        self.heartbeat_interval = heartbeat_interval
+        self.heartbeat_timeout = heartbeat_timeout
+        # Identifies this queue's running jobs among those of other processes sharing the database
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.handlers = {}
+        self._wakeup = threading.Condition()
+        self._workers = []
+        self._create_tables()
+        # Jobs left running by a process that stopped are picked up again; live workers' jobs are left alone
+        self._reclaim_stale_jobs()
+        self._heartbeat = threading.Thread(target=self._beat, name="job-heartbeat", daemon=True)
+        self._heartbeat.start()
+
+    def register_handler(self, stage, handler):
+        """
+        Register the function that runs jobs of a stage and start its workers.
+
+        Args:
+            stage (str): Stage name, e.g. "download"
+            handler (callable): handler(params, job) -> JSON-serializable result
+        """
+        self.handlers[stage] = handler
+        for i in range(self.stage_limits.get(stage, 1)):
+            worker = threading.Thread(target=self._work, args=(stage,), name=f"job-worker-{stage}-{i}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def submit(self, stage, params, max_attempts=3):
+        """
+        Add a job to the queue.
+
+        Args:
+            stage (str): Stage whose handler runs the job
+            params (dict): JSON-serializable job parameters
+            max_attempts (int): Runs allowed before the job is marked failed
+
+        Returns:
+            str: The job ID
+        """
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        self._execute(
+            "INSERT INTO jobs (id, stage, params, status, progress, attempts, max_attempts, "
+            "not_before, cancel_requested, created, updated) VALUES (?, ?, ?, ?, 0, 0, ?, 0, 0, ?, ?)",
+            (job_id, stage, json.dumps(params, ensure_ascii=False), QUEUED, max_attempts, now, now)
+        )
+        self._notify()
+        return job_id
+
+    def get(self, job_id):
+        """Return a job as a dict, or None if it does not exist."""
+        rows = self._query("SELECT * FROM jobs WHERE id = ?", (job_id,))
+        return self._row_to_job(rows[0]) if rows else None
+
+    def list_jobs(self, stage=None, limit=50):
+        """Return the most recent jobs, optionally only of one stage."""
+        if stage:
+            rows = self._query("SELECT * FROM jobs WHERE stage = ? ORDER BY created DESC LIMIT ?", (stage, limit))
+        else:
+            rows = self._query("SELECT * FROM jobs ORDER BY created DESC LIMIT ?", (limit,))
+        return [self._row_to_job(row) for row in rows]
+
+    def cancel(self, job_id):
+        """Cancel a queued job, or ask a running one to stop at its next progress update."""
+        now = time.time()
+        self._execute(
+            f"UPDATE jobs SET status = '{CANCELLED}', updated = ? WHERE id = ? AND status = '{QUEUED}'",
+            (now, job_id)
+        )
+        self._execute(
+            f"UPDATE jobs SET cancel_requested = 1, updated = ? WHERE id = ? AND status = '{RUNNING}'",
+            (now, job_id)
+        )
+
+    def retry(self, job_id):
+        """Queue a failed or cancelled job again with a fresh attempt budget."""
+        self._execute(
+            f"UPDATE jobs SET status = '{QUEUED}', attempts = 0, progress = 0, error = NULL, "
+            f"cancel_requested = 0, not_before = 0, owner = NULL, updated = ? "
+            f"WHERE id = ? AND status IN ('{FAILED}', '{CANCELLED}')",
+            (time.time(), job_id)
+        )
+        self._notify()
+
+    def _work(self, stage):
+        while True:
+            job = self._claim_next(stage)
+            if job is None:
+                with self._wakeup:
+                    self._wakeup.wait(self.poll_interval)
+                continue
+            self._run(job)
+
+    def _beat(self):
+        while True:
+            time.sleep(self.heartbeat_interval)
+            try:
+                self._execute(f"UPDATE jobs SET heartbeat = ? WHERE owner = ? AND status = '{RUNNING}'",
+                              (time.time(), self.owner))
+            except sqlite3.Error as e:
+                print(f"⚠️ Job heartbeat failed: {e}")
+
+    def _reclaim_stale_jobs(self, conn=None):
+        sql = (f"UPDATE jobs SET status = '{QUEUED}', owner = NULL, updated = ? "
+               f"WHERE status = '{RUNNING}' AND COALESCE(heartbeat, 0) < ?")
+        now = time.time()
+        args = (now, now - self.heartbeat_timeout)
+        if conn is not None:
+            reclaimed = conn.execute(sql, args).rowcount
+        else:
+            conn = self._connect()
+            try:
+                reclaimed = conn.execute(sql, args).rowcount
+            finally:
+                conn.close()
+        if reclaimed:
+            print(f"♻️ {reclaimed} abandoned jobs queued again")
+        return reclaimed
+
+    def _claim_next(self, stage):
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            self._reclaim_stale_jobs(conn)
+            row = conn.execute(
+                f"SELECT * FROM jobs WHERE stage = ? AND status = '{QUEUED}' AND not_before <= ? "
+                f"ORDER BY created LIMIT 1",
+                (stage, time.time())
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            now = time.time()
+            conn.execute(
+                f"UPDATE jobs SET status = '{RUNNING}', attempts = attempts + 1, owner = ?, heartbeat = ?, "
+                f"updated = ? WHERE id = ?",
+                (self.owner, now, now, row["id"])
+            )
+            conn.execute("COMMIT")
+            job = self._row_to_job(row)
+            job["attempts"] += 1
+            return job
+        finally:
+            conn.close()
+
+    def _run(self, job):
+        # Outcomes are only recorded while this queue still owns the job; if its heartbeat went stale
+        # and another queue reclaimed the job, that queue's run decides the result
+        context = JobContext(self, job["id"], job["attempts"])
+        try:
+            print(f"⚙️ Running {job['stage']} job {job['id']} (attempt {job['attempts']})")
+            result = self.handlers[job["stage"]](job["params"], context)
+            self._execute(
+                f"UPDATE jobs SET status = '{COMPLETED}', progress = 1, result = ?, error = NULL, updated = ? "
+                f"WHERE id = ? AND owner = ?",
+                (json.dumps(result, ensure_ascii=False), time.time(), job["id"], self.owner)
+            )
+            print(f"✅ {job['stage']} job {job['id']} completed")
+        except JobCancelled:
+            self._execute(
+                f"UPDATE jobs SET status = '{CANCELLED}', updated = ? WHERE id = ? AND owner = ?",
+                (time.time(), job["id"], self.owner)
+            )
+            print(f"🛑 {job['stage']} job {job['id']} cancelled")
+        except Exception as e:
+            if job["attempts"] < job["max_attempts"]:
+                # Exponential backoff before the next attempt
+                delay = 2 ** job["attempts"]
+                self._execute(
+                    f"UPDATE jobs SET status = '{QUEUED}', owner = NULL, error = ?, not_before = ?, updated = ? "
+                    f"WHERE id = ? AND owner = ?",
+                    (str(e), time.time() + delay, time.time(), job["id"], self.owner)
+                )
+                print(f"⚠️ {job['stage']} job {job['id']} failed, retrying in {delay}s: {e}")
+            else:
+                self._execute(
+                    f"UPDATE jobs SET status = '{FAILED}', error = ?, updated = ? WHERE id = ? AND owner = ?",
+                    (str(e), time.time(), job["id"], self.owner)
+                )
+                print(f"❌ {job['stage']} job {job['id']} failed: {e}")
+
+    def _update_progress(self, job_id, progress, message):
+        if progress is not None:
+            self._execute("UPDATE jobs SET progress = ?, updated = ? WHERE id = ?",
+                          (min(1.0, max(0.0, progress)), time.time(), job_id))
+        if message is not None:
+            self._execute("UPDATE jobs SET message = ?, updated = ? WHERE id = ?", (message, time.time(), job_id))
+
+    def _cancel_requested(self, job_id):
+        rows = self._query("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,))
+        return bool(rows and rows[0]["cancel_requested"])
+
+    def _notify(self):
+        with self._wakeup:
+            self._wakeup.notify_all()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _execute(self, sql, args=()):
+        conn = self._connect()
+        try:
+            conn.execute(sql, args)
+        finally:
+            conn.close()
+
+    def _query(self, sql, args=()):
+        conn = self._connect()
+        try:
+            return conn.execute(sql, args).fetchall()
+        finally:
+            conn.close()
+
+    def _create_tables(self):
+        directory = os.path.dirname(self.db_path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        conn = self._connect()
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    stage TEXT NOT NULL,
+                    params TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    progress REAL NOT NULL,
+                    message TEXT,
+                    result TEXT,
+                    error TEXT,
+                    attempts INTEGER NOT NULL,
+                    max_attempts INTEGER NOT NULL,
+                    not_before REAL NOT NULL,
+                    cancel_requested INTEGER NOT NULL,
+                    created REAL NOT NULL,
+                    updated REAL NOT NULL,
+                    owner TEXT,
+                    heartbeat REAL
+                )
+            """)
+            # Databases created before jobs had owners
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+            for column, column_type in (("owner", "TEXT"), ("heartbeat", "REAL")):
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {column_type}")
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_stage_status ON jobs (stage, status, created)")
+        finally:
+            conn.close()
+
+    def _row_to_job(self, row):
+        job = dict(row)
+        job["params"] = json.loads(job["params"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        job["cancel_requested"] = bool(job["cancel_requested"])
+        return job
@@ -0,0 +1,92 @@
+"""
+Convert saved indexes to normalized inner-product vectors.
+Indexes built before embeddings were normalized hold raw vectors in L2
+indexes. This rebuilds them with unit-length vectors in the configured
+encoding (VECTOR_ENCODING) without embedding the chunks again. The global
+index is converted as well, and indexes saved before keyword search get
+their BM25 index.
+
+Usage:
+    python migrate_indexes.py ./rag_indexes
+    python migrate_indexes.py ./rag_indexes --encoding int8 --force
+"""
+
+import os
+import argparse
+
+import faiss
+
+from index_builder import VECTOR_ENCODINGS, VECTOR_ENCODING, needs_migration, migrate_index
+from bm25_index import BM25_EXTENSION
+from global_index import GLOBAL_INDEX_DIR, GlobalIndex
+
+def migrate_index_file(index_path, encoding=VECTOR_ENCODING, force=False):
+    """
+    Convert one saved .index file in place.
+
+    Args:
+        index_path (str): Path to the .index file
+        encoding (str): Vector encoding of the converted index
+        force (bool): Also rebuild indexes that are already normalized (e.g. to change the encoding)
+
+    Returns:
+        bool: True if the file was rewritten
+    """
+    index = faiss.read_index(index_path)
+    if not force and not needs_migration(index):
+        return False
+
+    size_before = os.path.getsize(index_path)
+    converted = migrate_index(index, encoding)
+    # Write then rename so an interrupted migration never leaves a truncated index
+    temp_path = index_path + ".tmp"
+    faiss.write_index(converted, temp_path)
+    os.replace(temp_path, index_path)
+    print(f"✅ {index_path}: {size_before / 1024:.0f} KB -> {os.path.getsize(index_path) / 1024:.0f} KB")
+    return True
+
+def build_keyword_index(file_path):
+    """
+    Save the BM25 index of a saved index that was created before keyword search.
+
+    Args:
+        file_path (str): Index path without extension
+
+    Returns:
+        bool: True if a keyword index was written
+    """
+    from rag_helper import RAGIndex
+
+    bm25_path = file_path + BM25_EXTENSION
+    if os.path.exists(bm25_path):
+        return False
+    rag_index = RAGIndex.load(file_path)
+    try:
+        rag_index.bm25.save(bm25_path)
+    finally:
+        rag_index.close()
+    print(f"✅ {bm25_path}: keyword index of {len(rag_index.chunks)} chunks")
+    return True
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert saved indexes to normalized inner-product vectors")
+    parser.add_argument("index_dir", nargs="?", default="./rag_indexes")
+    parser.add_argument("--encoding", default=VECTOR_ENCODING, choices=list(VECTOR_ENCODINGS),
+                        help="Encoding of converted per-transcript indexes (the global index uses VECTOR_ENCODING)")
+    parser.add_argument("--force", action="store_true", help="Rebuild indexes that are already converted")
+    args = parser.parse_args()
+
+    converted, keyword_indexes = 0, 0
+    for name in sorted(os.listdir(args.index_dir)):
+        if name.endswith(".index"):
+            converted += migrate_index_file(os.path.join(args.index_dir, name), args.encoding, args.force)
+            keyword_indexes += build_keyword_index(os.path.join(args.index_dir, name[:-len(".index")]))
+    print(f"📊 {converted} per-transcript indexes converted, {keyword_indexes} keyword indexes built")
+
+    if os.path.exists(os.path.join(GLOBAL_INDEX_DIR, "metadata.db")):
+        # Shards are converted when loaded
+        GlobalIndex(GLOBAL_INDEX_DIR).migrate()
+        print("✅ Global index converted")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+"""
+Process-wide model manager for heavy models.
+This module keeps one instance of each model per process and shares it
+between all Streamlit sessions.
+"""
+
+import os
+import time
+import queue
+import threading
+import weakref
+from concurrent.futures import Future
+
+# Seconds an unused model stays in memory before it is unloaded
+MODEL_IDLE_TTL = int(os.environ.get("MODEL_IDLE_TTL", "1800"))
+
+class ModelHandle:
+    """A reference to a shared model held by one user, e.g. one Streamlit session."""
+
+    def __init__(self, manager, name):
+        self.manager = manager
+        self.name = name
+        # Release the reference when the handle is dropped with its session
+        self._finalizer = weakref.finalize(self, manager.release, name)
+
+    @property
+    def model(self):
+        """The shared model instance. Use run() for models that are not thread-safe."""
+        return self.manager.get_instance(self.name)
+
+    def run(self, fn, *args, **kwargs):
+        """Call fn(model, *args, **kwargs), queued behind other requests if the model is serialized."""
+        return self.manager.run(self.name, fn, *args, **kwargs)
+
+    def stream(self, fn, *args, **kwargs):
+        """Iterate over fn(model, *args, **kwargs) as it produces items, holding the model's queue meanwhile."""
+        return self.manager.stream(self.name, fn, *args, **kwargs)
+
+    def release(self):
+        """Drop this reference. Safe to call more than once."""
+        self._finalizer()
+
+class _SharedModel:
+    def __init__(self, name, loader, serialize):
+        self.name = name
+        self.loader = loader
+        self.serialize = serialize
+        self.instance = None
+        self.refcount = 0
+        self.last_used = time.time()
+        self.load_lock = threading.Lock()
+        self.requests = None
+        self.worker = None
+
+class ModelManager:
+    def __init__(self, idle_ttl=MODEL_IDLE_TTL):
+        """Initialize an empty manager that unloads models idle for idle_ttl seconds."""
+        self.idle_ttl = idle_ttl
+        self._models = {}
+        self._lock = threading.Lock()
+        self._reaper = None
+
+    def acquire(self, name, loader, serialize=False):
+        """
+        Get a handle to a shared model, loading it on first use.
+
+        Args:
+            name (str): Unique model key, e.g. "llm:./models/model.gguf"
+            loader (callable): Creates the model instance when it is not loaded
+            serialize (bool): Run all calls on one worker thread, one at a time
+
+        Returns:
+            ModelHandle: A reference that keeps the model loaded until released
+        """
+        with self._lock:
+            entry = self._models.get(name)
+            if entry is None:
+                entry = _SharedModel(name, loader, serialize)
+                self._models[name] = entry
+            entry.refcount += 1
+            entry.last_used = time.time()
+
+        try:
+            self._ensure_loaded(entry)
+        except Exception:
+            with self._lock:
+                entry.refcount -= 1
+            raise
+
+        self._start_reaper()
+        return ModelHandle(self, name)
+
+    def release(self, name):
+        """Drop one reference to a model."""
+        with self._lock:
+            entry = self._models.get(name)
+            if entry is not None:
+                entry.refcount = max(0, entry.refcount - 1)
+                entry.last_used = time.time()
+
+    def get_instance(self, name):
+        """Return the loaded instance of a model."""
+        entry = self._models[name]
+        entry.last_used = time.time()
+        return entry.instance
+
+    def run(self, name, fn, *args, **kwargs):
+        """Call fn with the model instance, through the request queue for serialized models."""
+        entry = self._models[name]
+        entry.last_used = time.time()
+        if not entry.serialize:
+            return fn(entry.instance, *args, **kwargs)
+
+        future = Future()
+        entry.requests.put((fn, args, kwargs, future))
+        return future.result()
+
+    def stream(self, name, fn, *args, **kwargs):
+        """
+        Yield the items of the iterator fn returns for the model instance.
+
+        For serialized models the iteration runs on the model's worker thread
+        and items are handed over as they are produced; other requests wait
+        until the iterator is exhausted or the caller stops reading.
+        """
+        entry = self._models[name]
+        entry.last_used = time.time()
+        if not entry.serialize:
+            yield from fn(entry.instance, *args, **kwargs)
+            return
+
+        items = queue.Queue()
+        stopped = threading.Event()
+        done = object()
+
+        def produce(instance):
+            try:
+                for item in fn(instance, *args, **kwargs):
+                    # The caller stopped reading; free the model for the next request
+                    if stopped.is_set():
+                        break
+                    items.put(item)
+            finally:
+                items.put(done)
+
+        future = Future()
+        entry.requests.put((produce, (), {}, future))
+        try:
+            while True:
+                item = items.get()
+                if item is done:
+                    # Re-raises an exception of the iterator
+                    future.result()
+                    return
+                yield item
+        finally:
+            stopped.set()
+
+    def unload_idle(self):
+        """Unload every model with no references that has been idle longer than the TTL."""
+        with self._lock:
+            candidates = [entry for entry in self._models.values() if self._is_idle(entry)]
+        # Unloading waits for a running load of the model, which must not block acquire/release/stats
+        for entry in candidates:
+            self._unload(entry)
+
+    def stats(self):
+        """Return the state of every known model."""
+        now = time.time()
+        with self._lock:
+            return [{
+                "name": entry.name,
+                "loaded": entry.instance is not None,
+                "refcount": entry.refcount,
+                "idle_seconds": int(now - entry.last_used),
+                "queued_requests": entry.requests.qsize() if entry.requests else 0,
+            } for entry in self._models.values()]
+
+    def _ensure_loaded(self, entry):
+        with entry.load_lock:
+            if entry.instance is not None:
+                return
+            print(f"🔄 Loading shared model {entry.name}...")
+            entry.instance = entry.loader()
+            if entry.serialize:
+                entry.requests = queue.Queue()
+                entry.worker = threading.Thread(
+                    target=self._serve_requests, args=(entry, entry.instance, entry.requests),
+                    name=f"model-worker-{entry.name}", daemon=True
+                )
+                entry.worker.start()
+            print(f"✅ Shared model {entry.name} loaded")
+
+    def _is_idle(self, entry):
+        return entry.instance is not None and entry.refcount == 0 and time.time() - entry.last_used > self.idle_ttl
+
+    def _unload(self, entry):
+        with entry.load_lock:
+            with self._lock:
+                # Acquired again since it was picked for unloading
+                if not self._is_idle(entry):
+                    return
+            if entry.requests is not None:
+                entry.requests.put(None)
+            entry.instance = None
+            entry.requests = None
+            entry.worker = None
+        print(f"🧹 Unloaded idle model {entry.name}")
+
+    def _serve_requests(self, entry, instance, requests):
+        while True:
+            item = requests.get()
+            if item is None:
+                break
+            fn, args, kwargs, future = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(fn(instance, *args, **kwargs))
+            except Exception as e:
+                future.set_exception(e)
+            finally:
+                entry.last_used = time.time()
+
+    def _start_reaper(self):
+        with self._lock:
+            if self._reaper is not None:
+                return
+            self._reaper = threading.Thread(target=self._reap_forever, name="model-reaper", daemon=True)
+            self._reaper.start()
+
+    def _reap_forever(self):
+        interval = max(1, min(60, self.idle_ttl // 2))
+        while True:
+            time.sleep(interval)
+            self.unload_idle()
+
+_manager = None
+_manager_lock = threading.Lock()
+
+def get_model_manager():
+    """Return the model manager shared by the whole process."""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = ModelManager()
+        return _manager
+
+def acquire_model(name, loader, serialize=False):
+    """Get a handle to a shared model from the process-wide manager."""
+    return get_model_manager().acquire(name, loader, serialize=serialize)
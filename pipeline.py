@@ -0,0 +1,204 @@
+"""
+Pipeline stages run as background jobs.
+This module defines the download, transcribe and index stages and the
+process-wide job queue that runs them.
+"""
+
+import os
+import threading
+from datetime import datetime
+
+from job_queue import JobQueue
+from capabilities import is_available
+from transcript_format import TRANSCRIPT_EXTENSION, read_transcript, write_transcript, transcript_text
+
+# Concurrently running jobs per stage
+STAGE_LIMITS = {
+    "download": int(os.environ.get("DOWNLOAD_WORKERS", "2")),
+    "transcribe": int(os.environ.get("TRANSCRIBE_WORKERS", "1")),
+    "index": int(os.environ.get("INDEX_WORKERS", "1")),
+}
+
+def index_path_for(transcript_path, index_dir="./rag_indexes"):
+    """Return the index path used for a transcript file."""
+    base_name = os.path.basename(transcript_path).rsplit(".", 1)[0]
+    return os.path.join(index_dir, base_name)
+
+def run_download(params, job):
+    """
+    Download stage: fetch the audio of a YouTube URL and, if the caption policy allows, its captions.
+
+    Params:
+        url (str): YouTube video URL
+        output_dir (str): Directory to save audio files
+        audio_format (str): "native", "wav16k" or "mp3"
+        caption_policy (str): "manual", "auto" or "asr" (see youtube_downloader.CAPTION_POLICIES)
+        caption_languages (list): Preferred caption language codes
+
+    Returns:
+        dict: audio_path, duration, captions_path and caption_kind (None without usable captions)
+    """
+    from youtube_downloader import download_youtube_media
+
+    job.update(0.0, "Ses indiriliyor...")
+    media = download_youtube_media(
+        params["url"], params.get("output_dir", "./audios"), params.get("audio_format", "native"),
+        caption_policy=params.get("caption_policy", "manual"),
+        caption_languages=params.get("caption_languages")
+    )
+    captions = media["captions"] or {}
+    return {
+        "audio_path": media["audio_path"],
+        "duration": media["duration"],
+        "captions_path": captions.get("path"),
+        "caption_kind": captions.get("kind"),
+    }
+
+def run_transcribe(params, job):
+    """
+    Transcribe stage: write a .jsonl and .txt transcript, optionally building the RAG index on the way.
+
+    When the download stage found captions, they become the transcript and
+    Whisper does not run.
+
+    Params:
+        audio_path (str): Audio file to transcribe
+        model_size (str): Whisper model size
+        mode (str): Transcription mode (standard, throughput, parallel)
+        build_index (bool): Chunk and embed segments while transcribing (skipped if the RAG packages are missing)
+        transcript_path (str): Optional .jsonl output path (generated under transcript_dir if missing)
+        transcript_dir (str): Directory for transcripts
+        captions_path (str): Optional caption transcript from the download stage
+
+    Returns:
+        dict: transcript_path, text_path, index_path (if built), source ("captions" or "whisper")
+        and audio_seconds
+
+    A built index is also added to the global multi-video index.
+    """
+    audio_path = params["audio_path"]
+    model_size = params.get("model_size", "medium")
+    mode = params.get("mode", "standard")
+    transcript_dir = params.get("transcript_dir", "./transcripts")
+
+    transcript_path = params.get("transcript_path")
+    if not transcript_path:
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        base_filename = os.path.basename(audio_path).rsplit(".", 1)[0]
+        transcript_path = os.path.join(transcript_dir, f"{base_filename}_{timestamp}{TRANSCRIPT_EXTENSION}")
+    text_path = transcript_path.rsplit(".", 1)[0] + ".txt"
+
+    processor, index_builder = None, None
+    if params.get("build_index") and not is_available("rag"):
+        # Indexing is optional here; a missing RAG stack must not fail the transcription
+        print("⚠️ RAG packages are not installed, transcribing without building the index")
+        job.update(0.0, "RAG paketleri kurulu değil, indeks oluşturulmayacak")
+    elif params.get("build_index"):
+        from rag_helper import RAGProcessor
+
+        processor = RAGProcessor()
+        index_builder = processor.start_incremental_index()
+
+    segments = []
+    try:
+        # Parallel mode transcribes while the source is created, so it belongs inside the try as well
+        captions_path = params.get("captions_path")
+        if captions_path and os.path.exists(captions_path):
+            job.update(0.0, "Altyazılar kullanılıyor, Whisper atlanıyor...")
+            source = "captions"
+            caption_segments = read_transcript(captions_path)
+            write_transcript(transcript_path, caption_segments)
+            segment_source = iter(caption_segments)
+        elif mode == "parallel":
+            from audio_transcriber import transcribe_audio_parallel
+
+            job.update(0.0, f"{model_size} modeli yükleniyor...")
+            source = "whisper"
+            segment_source = transcribe_audio_parallel(audio_path, model_size, output_path=transcript_path)
+        else:
+            from audio_transcriber import iter_transcribe_audio
+
+            job.update(0.0, f"{model_size} modeli yükleniyor...")
+            source = "whisper"
+            segment_source = iter_transcribe_audio(
+                audio_path, model_size, transcript_path, mode=mode,
+                progress_callback=lambda fraction: job.update(fraction * 0.95)
+            )
+
+        for segment in segment_source:
+            segments.append(segment)
+            if index_builder:
+                index_builder.add_segment(segment)
+            if len(segments) % 10 == 1:
+                job.update(message=f"{len(segments)} segment dönüştürüldü")
+    except BaseException:
+        # Stop the background indexer thread before giving up (failure or cancellation)
+        if index_builder:
+            index_builder.cancel()
+        raise
+
+    with open(text_path, "w", encoding="utf-8") as f:
+        f.write(transcript_text(segments))
+
+    result = {
+        "transcript_path": transcript_path,
+        "text_path": text_path,
+        "index_path": None,
+        "source": source,
+        "audio_seconds": max((segment["end"] or 0 for segment in segments), default=0),
+    }
+    if index_builder:
+        job.update(0.97, "RAG indeksi tamamlanıyor...")
+        index_path = index_path_for(transcript_path)
+        if index_builder.finish() and processor.save_index(index_path):
+            from global_index import video_id_for_path
+
+            result["index_path"] = index_path
+            processor.add_to_global_index(video_id_for_path(transcript_path), source=index_path)
+    return result
+
+def run_index(params, job):
+    """
+    Index stage: chunk, embed and save a transcript's RAG index, and add it to the global index.
+
+    Params:
+        transcript_path (str): .jsonl or .txt transcript
+
+    Returns:
+        dict: index_path
+    """
+    from rag_helper import RAGProcessor
+    from global_index import video_id_for_path
+
+    job.update(0.0, "Gömme modeli hazırlanıyor...")
+    processor = RAGProcessor()
+    job.update(0.2, "Transcript işleniyor...")
+    if not processor.process_transcript_file(params["transcript_path"]):
+        raise RuntimeError("Transcript RAG için hazırlanamadı")
+
+    index_path = index_path_for(params["transcript_path"])
+    if not processor.save_index(index_path):
+        raise RuntimeError("RAG indeksi kaydedilemedi")
+    job.update(0.9, "Genel indekse ekleniyor...")
+    if not processor.add_to_global_index(video_id_for_path(params["transcript_path"]), source=index_path):
+        raise RuntimeError("Video genel indekse eklenemedi")
+    return {"index_path": index_path}
+
+STAGE_HANDLERS = {
+    "download": run_download,
+    "transcribe": run_transcribe,
+    "index": run_index,
+}
+
+_queue = None
+_queue_lock = threading.Lock()
+
+def get_job_queue():
+    """Return the job queue shared by the whole process, starting its workers on first use."""
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = JobQueue(stage_limits=STAGE_LIMITS)
+            for stage, handler in STAGE_HANDLERS.items():
+                _queue.register_handler(stage, handler)
+        return _queue
@@ -0,0 +1,110 @@
+"""
+Prompt prefix state cache.
+Prompts start with a stable prefix (instructions and context chunks) and end
+with the question. After llama.cpp has processed a prefix, its state (the
+KV cache) is saved and kept in an LRU keyed by a hash of the model and the
+prefix. A later question with the same context restores the state and only
+the question is processed, which skips most of the prefill.
+"""
+
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+
+# Memory for saved states; a state holds the KV cache of its prefix (0 disables the cache)
+PROMPT_CACHE_MB = float(os.environ.get("PROMPT_CACHE_MB", "1024"))
+
+def prefix_key(model_name, prefix):
+    """Cache key of a prompt prefix for a model."""
+    return hashlib.sha256(f"{model_name}\0{prefix}".encode("utf-8")).hexdigest()
+
+class PromptStateCache:
+    def __init__(self, max_mb=PROMPT_CACHE_MB):
+        """
+        LRU cache of llama.cpp states.
+
+        Args:
+            max_mb (float): Total size of the saved states
+        """
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.tokens_reused = 0
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def restore(self, llm, model_name, prefix):
+        """
+        Bring llm to the state after processing prefix.
+
+        On a hit the saved state is loaded. On a miss the prefix is processed
+        and its state saved. Either way the following completion call only
+        processes what comes after the prefix.
+
+        Must be called on the thread that owns llm.
+
+        Returns:
+            bool: True if the state came from the cache
+        """
+        key = prefix_key(model_name, prefix)
+        with self._lock:
+            state = self._entries.get(key)
+            if state is not None:
+                self._entries.move_to_end(key)
+        if state is not None:
+            llm.load_state(state)
+            with self._lock:
+                self.hits += 1
+                self.tokens_reused += state.n_tokens
+            return True
+
+        tokens = llm.tokenize(prefix.encode("utf-8"))
+        llm.reset()
+        llm.eval(tokens)
+        self._put(key, llm.save_state())
+        with self._lock:
+            self.misses += 1
+        return False
+
+    def stats(self):
+        """Return hit/miss counts, prefix tokens not processed again and the memory held."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+                "tokens_reused": self.tokens_reused,
+                "entries": len(self._entries),
+                "size_mb": round(self._size / (1024 * 1024), 1),
+            }
+
+    def _put(self, key, state):
+        size = state.llama_state_size
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._size -= self._entries.pop(key).llama_state_size
+            self._entries[key] = state
+            self._size += size
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= evicted.llama_state_size
+
+_prompt_cache = None
+_prompt_cache_lock = threading.Lock()
+
+def get_prompt_cache():
+    """Return the prompt state cache shared by the whole process."""
+    global _prompt_cache
+    with _prompt_cache_lock:
+        if _prompt_cache is None:
+            _prompt_cache = PromptStateCache()
+        return _prompt_cache
@@ -4,50 +4,34 @@ This module handles text chunking, embedding, and querying with a local LLM.
 """
 
 import os
-import sys
-import subprocess
 import time
 import json
 import re
+import queue
+import threading
 import numpy as np
-from typing import List, Dict, Any, Tuple, Optional
+from collections import OrderedDict
+from typing import List, Dict, Any, Tuple, Optional, Iterator
 
-# Embedding and vector storage
-from sentence_transformers import SentenceTransformer
-import faiss
+# Models shared by all sessions in this process
+from model_manager import acquire_model
+from capabilities import require, get_capabilities
+from transcript_format import TRANSCRIPT_EXTENSION, read_transcript, format_timestamp
+from global_index import get_global_index
+from embedding_cache import get_embedding_cache
+from chunk_store import CHUNK_STORE_EXTENSION, LEGACY_CHUNKS_EXTENSION, ChunkStore, write_chunk_store
+from bm25_index import BM25_EXTENSION, BM25Index, reciprocal_rank_fusion
+from context_packer import CONTEXT_TOKEN_BUDGET, CHUNK_SEPARATOR, pack_context, chronological_order
+from prompt_cache import get_prompt_cache
+from answer_cache import get_answer_cache
+from index_builder import (build_index as build_vector_index, create_index, reconstruct_vectors,
+                           needs_migration, migrate_index)
 
-# Text chunking
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-
-def install_packages():
-    """Install required packages for RAG functionality."""
-    packages = [
-        "sentence-transformers",
-        "faiss-cpu",  # Use faiss-gpu if GPU is available
-        "langchain",
-        "llama-cpp-python",  # For local LLM inference
-    ]
-    
-    all_installed = True
-    for package in packages:
-        try:
-            if package == "faiss-cpu":
-                import faiss
-                print(f"✅ {package} already installed.")
-            else:
-                module_name = package.replace("-", "_")
-                __import__(module_name)
-                print(f"✅ {package} already installed.")
-        except ImportError:
-            print(f"📦 Installing {package}...")
-            try:
-                subprocess.check_call([sys.executable, "-m", "pip", "install", package])
-                print(f"✅ {package} installed successfully.")
-            except Exception as e:
-                print(f"❌ Failed to install {package}: {e}")
-                all_installed = False
-    
-    return all_installed
+EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
+# "hybrid" fuses vector and BM25 keyword rankings, "dense" uses the vector index only
+RETRIEVAL_MODE = os.environ.get("RETRIEVAL_MODE", "hybrid")
+# Candidates taken from each ranking before fusion
+HYBRID_CANDIDATES = int(os.environ.get("HYBRID_CANDIDATES", "20"))
 
 def download_model_if_needed(model_path="./models"):
     """Download models if they don't exist locally."""
@@ -59,8 +43,9 @@ def download_model_if_needed(model_path="./models"):
     embedding_model_path = os.path.join(model_path, "embedding_model")
     if not os.path.exists(embedding_model_path):
         print("📥 Downloading embedding model...")
+        from sentence_transformers import SentenceTransformer
         # This will trigger the download of the model when we initialize it
-        embedding_model = SentenceTransformer("all-MiniLM-L6-v2", cache_folder=embedding_model_path)
+        embedding_model = SentenceTransformer(EMBEDDING_MODEL_NAME, cache_folder=embedding_model_path)
         print("✅ Embedding model downloaded.")
     
     # Check for LLM model
@@ -74,44 +59,507 @@ def download_model_if_needed(model_path="./models"):
     
     return True
 
+def acquire_embedding_model(model_path="./models"):
+    """Get a handle to the embedding model shared by the whole process."""
+    embedding_model_path = os.path.join(model_path, "embedding_model")
+    
+    def load():
+        from sentence_transformers import SentenceTransformer
+        return SentenceTransformer(EMBEDDING_MODEL_NAME, cache_folder=embedding_model_path)
+    
+    return acquire_model(
+        f"embedding:{EMBEDDING_MODEL_NAME}",
+        load
+    )
+
+def acquire_llm(full_model_path):
+    """Get a handle to a shared llama.cpp model. Calls are queued because Llama is not thread-safe."""
+    from llama_cpp import Llama
+    
+    return acquire_model(
+        f"llm:{os.path.abspath(full_model_path)}",
+        lambda: Llama(
+            model_path=full_model_path,
+            n_ctx=2048,  # Context window size
+            n_batch=512,  # Batch size for prompt processing
+            n_gpu_layers=-1  # Attempt to offload all layers to GPU
+        ),
+        serialize=True
+    )
+
+class Embedder:
+    # Cache key of the vectors this class produces (model and normalization)
+    cache_name = f"{EMBEDDING_MODEL_NAME}:normalized"
+    
+    def __init__(self, model_path="./models"):
+        """Wrap the shared embedding model. Cheap once the model is loaded in this process."""
+        self.handle = acquire_embedding_model(model_path)
+        self.model = self.handle.model
+        self.dimension = self.model.get_sentence_embedding_dimension()
+    
+    def encode(self, texts: List[str], use_cache: bool = True) -> np.ndarray:
+        """
+        Encode texts into a float32 matrix of unit-length embeddings (inner product = cosine similarity).
+        
+        Chunk embeddings are looked up in the persistent embedding cache first,
+        so only new or changed texts reach the model. Queries pass use_cache=False.
+        """
+        if not use_cache:
+            return self._encode(texts)
+        return get_embedding_cache().encode(self.cache_name, texts, self._encode, self.dimension)
+    
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, self.dimension), dtype="float32")
+        return np.array(self.model.encode(texts, normalize_embeddings=True)).astype('float32')
+
+class RAGIndex:
+    def __init__(self, index, chunks: List[str], file_path: Optional[str] = None,
+                 chunk_times: Optional[List[Tuple[float, float]]] = None, bm25: Optional[BM25Index] = None):
+        """A FAISS index, the text chunks its vectors were built from, their time ranges and keyword index."""
+        self.index = index
+        self.chunks = chunks
+        self.file_path = file_path
+        self.chunk_times = chunk_times
+        self._bm25 = bm25
+        # Modification times of the files this index was loaded from or saved to; answers are cached under it
+        self.version = None
+        # Sessions and threads share cached indexes: a chunk store is only unmapped
+        # once nobody is reading it (see acquire/retire)
+        self._readers = 0
+        self._retired = False
+        self._stores_to_unmap = []
+        self._state_lock = threading.Lock()
+    
+    @property
+    def bm25(self) -> BM25Index:
+        """Keyword index of the chunks, built on first use if it was not saved."""
+        if self._bm25 is None:
+            self._bm25 = BM25Index.build(self.chunks)
+        return self._bm25
+    
+    @property
+    def closed(self) -> bool:
+        """True once the index was rebuilt or evicted from the cache, or its chunk store was released."""
+        return self._retired or (isinstance(self.chunks, ChunkStore) and self.chunks.closed)
+    
+    def acquire(self) -> bool:
+        """
+        Take a read reference that keeps the chunk store mapped until release().
+        
+        Returns:
+            bool: False if the index is closed; the current version should be loaded instead
+        """
+        with self._state_lock:
+            if self.closed:
+                return False
+            self._readers += 1
+            return True
+    
+    def release(self):
+        """Drop a read reference taken by acquire()."""
+        with self._state_lock:
+            self._readers -= 1
+            self._unmap_if_idle()
+    
+    def retire(self):
+        """Mark the index as rebuilt or evicted; its chunk store is unmapped after the last reader releases it."""
+        with self._state_lock:
+            self._retired = True
+            if isinstance(self.chunks, ChunkStore):
+                self._stores_to_unmap.append(self.chunks)
+            self._unmap_if_idle()
+    
+    def close(self):
+        """Release the memory-mapped chunk store, if any (for an index nobody else is reading)."""
+        if isinstance(self.chunks, ChunkStore):
+            self.chunks.close()
+    
+    def _unmap_if_idle(self):
+        if self._readers == 0:
+            for store in self._stores_to_unmap:
+                store.close()
+            self._stores_to_unmap = []
+    
+    @classmethod
+    def load(cls, file_path: str) -> "RAGIndex":
+        """Load index, chunks and chunk time ranges (if any) from disk."""
+        import faiss
+        
+        # Taken before reading, so files replaced meanwhile can't be labelled with their newer version
+        version = index_version(file_path)
+        index = faiss.read_index(f"{file_path}.index")
+        if needs_migration(index):
+            # Saved before embeddings were normalized; convert in memory (migrate_indexes.py converts the file)
+            print(f"⚠️ {file_path}.index uses raw L2 vectors, converting in memory. "
+                  f"Run migrate_indexes.py to convert it on disk.")
+            index = migrate_index(index)
+        chunks_path = chunk_file_path(file_path)
+        if chunks_path.endswith(CHUNK_STORE_EXTENSION):
+            # Memory-mapped; chunks are decoded when read
+            chunks = ChunkStore(chunks_path)
+            chunk_times = chunks.chunk_times
+        else:
+            # Saved before the chunk store; chunk_store.py convert rewrites these files
+            with open(chunks_path, 'r', encoding='utf-8') as f:
+                chunks = json.load(f)
+            
+            chunk_times = None
+            if os.path.exists(f"{file_path}.meta.json"):
+                with open(f"{file_path}.meta.json", 'r', encoding='utf-8') as f:
+                    chunk_times = json.load(f).get("chunk_times")
+        
+        bm25_path = f"{file_path}{BM25_EXTENSION}"
+        bm25 = None
+        if os.path.exists(bm25_path):
+            bm25 = BM25Index.load(bm25_path)
+        else:
+            # Saved before keyword search; built in memory on first use, loading never writes files
+            print(f"⚠️ {file_path} has no keyword index, it will be built in memory. "
+                  f"Run migrate_indexes.py to save it.")
+        rag_index = cls(index, chunks, file_path, chunk_times, bm25)
+        rag_index.version = version
+        return rag_index
+    
+    def save(self, file_path: str):
+        """Save index, chunks and chunk time ranges to disk."""
+        import faiss
+        
+        store_path = f"{file_path}{CHUNK_STORE_EXTENSION}"
+        if isinstance(self.chunks, ChunkStore) and os.path.abspath(self.chunks.path) == os.path.abspath(store_path):
+            # Saving over the file these chunks are mapped from: keep them in memory instead
+            with self._state_lock:
+                store = self.chunks
+                self.chunks = list(store)
+                self.chunk_times = list(self.chunk_times) if self.chunk_times is not None else None
+                self._stores_to_unmap.append(store)
+                self._unmap_if_idle()
+        # A mapped file can't be replaced on Windows, so cached loads of this path are retired first
+        # (unmapped unless a search is reading them right now)
+        index_cache.discard(file_path)
+        
+        faiss.write_index(self.index, f"{file_path}.index")
+        write_chunk_store(store_path, self.chunks, self.chunk_times)
+        self.bm25.save(f"{file_path}{BM25_EXTENSION}")
+        # Chunks and times of older saves, superseded by the chunk store
+        for legacy_path in (f"{file_path}{LEGACY_CHUNKS_EXTENSION}", f"{file_path}.meta.json"):
+            if os.path.exists(legacy_path):
+                os.remove(legacy_path)
+        self.file_path = file_path
+        self.version = index_version(file_path)
+    
+    def chunk_with_timestamp(self, idx: int) -> str:
+        """Return a chunk prefixed with its time range, so answers can cite it."""
+        if not self.chunk_times or self.chunk_times[idx][0] is None:
+            return self.chunks[idx]
+        start, end = self.chunk_times[idx]
+        return f"[{format_timestamp(start)} - {format_timestamp(end)}] {self.chunks[idx]}"
+    
+    def search(self, query_embedding: np.ndarray, top_k: int = 3, query: Optional[str] = None,
+               mode: str = RETRIEVAL_MODE) -> List[str]:
+        """
+        Return the chunks most relevant to a query.
+        
+        Args:
+            query_embedding (np.ndarray): Embedding of the query
+            top_k (int): Number of chunks to return
+            query (str): Query text, needed for keyword search
+            mode (str): "hybrid" fuses the vector and BM25 rankings, "dense" uses the vector index only
+        """
+        return [self.chunk_with_timestamp(idx) for idx in self.search_ids(query_embedding, top_k, query, mode)]
+    
+    def search_ids(self, query_embedding: np.ndarray, top_k: int = 3, query: Optional[str] = None,
+                   mode: str = RETRIEVAL_MODE) -> List[int]:
+        """IDs of the chunks most relevant to a query (see search)."""
+        if mode == "dense" or query is None:
+            distances, indices = self.index.search(query_embedding, top_k)
+            # FAISS pads with -1 when the index has fewer than top_k vectors
+            return [int(idx) for idx in indices[0] if idx >= 0]
+        
+        candidates = max(top_k, HYBRID_CANDIDATES)
+        distances, indices = self.index.search(query_embedding, candidates)
+        dense_ranking = [int(idx) for idx in indices[0] if idx >= 0]
+        keyword_ranking = [doc_id for doc_id, score in self.bm25.search(query, candidates)]
+        return reciprocal_rank_fusion([dense_ranking, keyword_ranking], top_k)
+
+def chunk_file_path(file_path: str) -> str:
+    """The chunk store of a saved index, or its .chunks.json if it was saved before the chunk store."""
+    store_path = f"{file_path}{CHUNK_STORE_EXTENSION}"
+    legacy_path = f"{file_path}{LEGACY_CHUNKS_EXTENSION}"
+    return legacy_path if not os.path.exists(store_path) and os.path.exists(legacy_path) else store_path
+
+def index_version(file_path: str) -> str:
+    """Version of a saved index: the modification times of its index and chunk files."""
+    _, index_mtime, chunks_mtime = index_cache_key(file_path)
+    return f"{index_mtime}:{chunks_mtime}"
+
+def index_cache_key(file_path: str) -> Tuple[str, float, float]:
+    """Key a saved index by its path and the modification times of its files."""
+    return (
+        os.path.abspath(file_path),
+        os.path.getmtime(f"{file_path}.index"),
+        os.path.getmtime(chunk_file_path(file_path)),
+    )
+
+class IndexCache:
+    def __init__(self, max_size: int = 8):
+        """LRU cache of loaded indexes, shared by all sessions in the process."""
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, file_path: str) -> RAGIndex:
+        """Return a loaded index, reading it from disk only if it is not cached or has changed."""
+        key = index_cache_key(file_path)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+        
+        rag_index = RAGIndex.load(file_path)
+        self.put(file_path, rag_index, key)
+        return rag_index
+    
+    def put(self, file_path: str, rag_index: RAGIndex, key: Optional[Tuple[str, float, float]] = None):
+        """Store an index, replacing older versions of the same path."""
+        key = key or index_cache_key(file_path)
+        with self._lock:
+            removed = [self._entries.pop(k) for k in [k for k in self._entries if k[0] == key[0] and k != key]]
+            self._entries[key] = rag_index
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                removed.append(self._entries.popitem(last=False)[1])
+        # Replaced and evicted indexes release their mapped chunk files once no session reads them
+        for old_index in removed:
+            if old_index is not rag_index:
+                old_index.retire()
+    
+    def discard(self, file_path: str):
+        """Drop and retire the cached versions of a path, e.g. before its files are rewritten."""
+        path = os.path.abspath(file_path)
+        with self._lock:
+            removed = [self._entries.pop(k) for k in [k for k in self._entries if k[0] == path]]
+        for old_index in removed:
+            old_index.retire()
+
+# Loaded indexes shared by all sessions
+index_cache = IndexCache(int(os.environ.get("RAG_INDEX_CACHE_SIZE", "8")))
+
+class SegmentChunker:
+    def __init__(self, chunk_size: int = 500, window_seconds: float = 60):
+        """Group timestamped segments into chunks, one segment at a time."""
+        self.chunk_size = chunk_size
+        self.window_seconds = window_seconds
+        self.current = []
+        self.start = None
+        self.end = None
+    
+    def add(self, segment: Dict[str, Any]) -> List[Tuple[str, Tuple[float, float]]]:
+        """Add a segment and return the chunks it completed (zero or one)."""
+        text = segment["text"].strip()
+        if not text:
+            return []
+        
+        completed = []
+        if self.current and (segment["end"] - self.start > self.window_seconds or
+                             sum(len(t) + 1 for t in self.current) + len(text) > self.chunk_size):
+            completed = self.flush()
+        if not self.current:
+            self.start = segment["start"]
+        self.current.append(text)
+        self.end = segment["end"]
+        return completed
+    
+    def flush(self) -> List[Tuple[str, Tuple[float, float]]]:
+        """Return the chunk being built, if any."""
+        if not self.current:
+            return []
+        chunk = (" ".join(self.current), (self.start, self.end))
+        self.current = []
+        return [chunk]
+
+class IncrementalIndexBuilder:
+    def __init__(self, processor: "RAGProcessor", batch_size: int = 16):
+        """Chunk and embed segments on a background thread while they are still being produced."""
+        self.processor = processor
+        self.batch_size = batch_size
+        self.chunker = SegmentChunker(processor.chunk_size, processor.window_seconds)
+        # Embeddings are collected and indexed at the end, when the index type can be chosen and trained
+        self.embeddings = []
+        self.chunks = []
+        self.chunk_times = []
+        self.error = None
+        self._cancelled = False
+        self._pending = []
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="incremental-index", daemon=True)
+        self._thread.start()
+    
+    def add_segment(self, segment: Dict[str, Any]):
+        """Queue a transcript segment for chunking and embedding."""
+        self._queue.put(segment)
+    
+    def finish(self) -> bool:
+        """Embed what is left and make the result the processor's current index."""
+        self._queue.put(None)
+        self._thread.join()
+        if self.error is not None:
+            print(f"❌ Error building index incrementally: {str(self.error)}")
+            return False
+        
+        if self.embeddings:
+            index = build_vector_index(np.vstack(self.embeddings))
+        else:
+            index = create_index("flat", self.processor.embedding_dim, encoding="float32")
+        self.processor.rag_index = RAGIndex(index, self.chunks, chunk_times=self.chunk_times)
+        print(f"✅ Incremental RAG index complete ({len(self.chunks)} chunks)")
+        return True
+    
+    def cancel(self):
+        """Stop the background thread without embedding the rest or building an index."""
+        self._cancelled = True
+        self._queue.put(None)
+        self._thread.join()
+    
+    def _run(self):
+        try:
+            while True:
+                segment = self._queue.get()
+                if self._cancelled:
+                    break
+                if segment is None:
+                    self._pending.extend(self.chunker.flush())
+                    self._embed_pending()
+                    break
+                self._pending.extend(self.chunker.add(segment))
+                if len(self._pending) >= self.batch_size:
+                    self._embed_pending()
+        except Exception as e:
+            self.error = e
+    
+    def _embed_pending(self):
+        if not self._pending:
+            return
+        texts = [text for text, _ in self._pending]
+        self.embeddings.append(self.processor.embedder.encode(texts))
+        self.chunks.extend(texts)
+        self.chunk_times.extend(times for _, times in self._pending)
+        self._pending = []
+
 class RAGProcessor:
     def __init__(self, model_path="./models"):
         """Initialize the RAG processor with embedding model and vector store."""
+        require("rag")
         self.model_path = model_path
         
-        # Load embedding model
-        embedding_model_path = os.path.join(model_path, "embedding_model")
-        print("🔄 Loading embedding model...")
-        self.embedding_model = SentenceTransformer("all-MiniLM-L6-v2", cache_folder=embedding_model_path)
-        self.embedding_dim = self.embedding_model.get_sentence_embedding_dimension()
-        print(f"✅ Embedding model loaded (dimension: {self.embedding_dim})")
-        
-        # Initialize text splitter for chunking
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=500,
-            chunk_overlap=50,
-            separators=["\n\n", "\n", ".", "!", "?", ",", " ", ""]
-        )
-        
-        # Initialize FAISS index (will be created per document)
-        self.index = None
-        self.chunks = []
+        # The embedding model is shared by the whole process and only loaded once
+        self.embedder = Embedder(model_path)
+        self.embedding_model = self.embedder.model
+        self.embedding_dim = self.embedder.dimension
+        print(f"✅ Embedding model ready (dimension: {self.embedding_dim})")
+        
+        # Text splitter for plain-text transcripts, created on first use
+        self._text_splitter = None
+        
+        # Time-window chunking for timestamped transcripts
+        self.chunk_size = 500
+        self.window_seconds = 60
+        
+        # Current index (created per document or taken from the index cache)
+        self.rag_index = None
+        
+        # Last retrieval, for keying cached answers: (index ID, index version), chunk IDs and query embedding
+        self.last_retrieval = None
+    
+    @property
+    def text_splitter(self):
+        """Splitter for transcripts without timestamps (langchain is only imported when one is processed)."""
+        if self._text_splitter is None:
+            from langchain.text_splitter import RecursiveCharacterTextSplitter
+            self._text_splitter = RecursiveCharacterTextSplitter(
+                chunk_size=500,
+                chunk_overlap=50,
+                separators=["\n\n", "\n", ".", "!", "?", ",", " ", ""]
+            )
+        return self._text_splitter
+    
+    @property
+    def index(self):
+        return self.rag_index.index if self.rag_index is not None else None
+    
+    @property
+    def chunks(self) -> List[str]:
+        return self.rag_index.chunks if self.rag_index is not None else []
+    
+    @property
+    def loaded_index_path(self) -> Optional[str]:
+        return self.rag_index.file_path if self.rag_index is not None else None
+        
+    def build_index(self, chunks: List[str], chunk_times: Optional[List[Tuple[float, float]]] = None):
+        """Embed chunks and make them the current index."""
+        # Create embeddings for chunks
+        print("🧠 Creating embeddings...")
+        embeddings = self.embedder.encode(chunks)
         
+        # Create FAISS index (type chosen by the number of chunks)
+        print("📊 Creating vector index...")
+        index = build_vector_index(embeddings)
+        self.rag_index = RAGIndex(index, chunks, chunk_times=chunk_times)
+    
+    def chunk_segments(self, segments: List[Dict[str, Any]]) -> Tuple[List[str], List[Tuple[float, float]]]:
+        """
+        Group timestamped segments into chunks of at most window_seconds / chunk_size characters.
+        
+        Returns:
+            Tuple of chunk texts and their (start, end) times
+        """
+        chunker = SegmentChunker(self.chunk_size, self.window_seconds)
+        chunks, chunk_times = [], []
+        for segment in segments:
+            for text, times in chunker.add(segment):
+                chunks.append(text)
+                chunk_times.append(times)
+        for text, times in chunker.flush():
+            chunks.append(text)
+            chunk_times.append(times)
+        return chunks, chunk_times
+    
+    def start_incremental_index(self) -> "IncrementalIndexBuilder":
+        """Start building an index in the background from segments fed while transcribing."""
+        return IncrementalIndexBuilder(self)
+    
+    def process_segments(self, segments: List[Dict[str, Any]]) -> bool:
+        """Process timestamped transcript segments into time-window chunks and create embeddings index."""
+        try:
+            print("🔪 Chunking transcript segments by time window...")
+            chunks, chunk_times = self.chunk_segments(segments)
+            print(f"✅ Created {len(chunks)} chunks")
+            
+            self.build_index(chunks, chunk_times)
+            
+            print("✅ RAG processing complete")
+            return True
+            
+        except Exception as e:
+            print(f"❌ Error processing transcript: {str(e)}")
+            return False
+    
+    def process_transcript_file(self, file_path: str) -> bool:
+        """Process a .jsonl (timestamped) or .txt transcript file."""
+        if file_path.endswith(TRANSCRIPT_EXTENSION):
+            return self.process_segments(read_transcript(file_path))
+        
+        with open(file_path, "r", encoding="utf-8") as f:
+            return self.process_transcript(f.read())
+    
     def process_transcript(self, transcript_text: str) -> bool:
         """Process transcript text into chunks and create embeddings index."""
         try:
             print("🔪 Chunking transcript text...")
-            self.chunks = self.text_splitter.split_text(transcript_text)
-            print(f"✅ Created {len(self.chunks)} chunks")
-            
-            # Create embeddings for chunks
-            print("🧠 Creating embeddings...")
-            embeddings = self.embedding_model.encode(self.chunks)
+            chunks = self.text_splitter.split_text(transcript_text)
+            print(f"✅ Created {len(chunks)} chunks")
             
-            # Create FAISS index
-            print("📊 Creating vector index...")
-            self.index = faiss.IndexFlatL2(self.embedding_dim)
-            self.index.add(np.array(embeddings).astype('float32'))
+            self.build_index(chunks)
             
             print("✅ RAG processing complete")
             return True
@@ -123,78 +571,148 @@ class RAGProcessor:
     def save_index(self, file_path: str) -> bool:
         """Save index and chunks to disk."""
         try:
-            # Save index
-            index_path = f"{file_path}.index"
-            faiss.write_index(self.index, index_path)
+            self.rag_index.save(file_path)
+            # Answers from the previous build of this index may cite chunks that changed
+            get_answer_cache().invalidate(os.path.abspath(file_path))
+            # Later loads of this path are served from memory
+            index_cache.put(file_path, self.rag_index)
             
-            # Save chunks
-            chunks_path = f"{file_path}.chunks.json"
-            with open(chunks_path, 'w', encoding='utf-8') as f:
-                json.dump(self.chunks, f, ensure_ascii=False, indent=2)
-                
-            print(f"✅ Saved index to {index_path} and chunks to {chunks_path}")
+            print(f"✅ Saved index to {file_path}.index, chunks to {file_path}{CHUNK_STORE_EXTENSION} "
+                  f"and keyword index to {file_path}{BM25_EXTENSION}")
             return True
         except Exception as e:
             print(f"❌ Error saving index: {str(e)}")
             return False
             
     def load_index(self, file_path: str) -> bool:
-        """Load index and chunks from disk."""
+        """Load index and chunks from disk, or from the index cache if unchanged."""
         try:
-            # Load index
-            index_path = f"{file_path}.index"
-            self.index = faiss.read_index(index_path)
-            
-            # Load chunks
-            chunks_path = f"{file_path}.chunks.json"
-            with open(chunks_path, 'r', encoding='utf-8') as f:
-                self.chunks = json.load(f)
-                
-            print(f"✅ Loaded index from {index_path} and chunks from {chunks_path}")
+            start_time = time.time()
+            self.rag_index = index_cache.get(file_path)
+            print(f"✅ Loaded index {file_path} in {(time.time() - start_time) * 1000:.1f} ms")
             return True
         except Exception as e:
             print(f"❌ Error loading index: {str(e)}")
             return False
     
-    def retrieve_relevant_chunks(self, query: str, top_k: int = 3) -> List[str]:
-        """Retrieve the most relevant chunks for a query."""
-        if self.index is None or len(self.chunks) == 0:
+    def add_to_global_index(self, video_id: str, title: Optional[str] = None, source: Optional[str] = None) -> bool:
+        """Add the current index's vectors to the global multi-video index, replacing the video's old ones."""
+        try:
+            rag_index = self._acquire_index()
+            try:
+                # The vectors are read back from the index instead of embedding the chunks again
+                embeddings = reconstruct_vectors(rag_index.index)
+                get_global_index(self.embedding_dim).add_video(
+                    video_id, embeddings, rag_index.chunks, rag_index.chunk_times, title=title, source=source
+                )
+            finally:
+                rag_index.release()
+            return True
+        except Exception as e:
+            print(f"❌ Error adding to global index: {str(e)}")
+            return False
+    
+    def retrieve_from_global_index(self, query: str, top_k: int = 3,
+                                   video_ids: Optional[List[str]] = None) -> List[str]:
+        """Retrieve the most relevant chunks across all videos, or only the given ones."""
+        # Cleared first, so a failed retrieval can't key an answer under the previous question's chunks
+        self.last_retrieval = None
+        query_embedding = self.embedder.encode([query], use_cache=False)
+        global_index = get_global_index(self.embedding_dim)
+        results = global_index.search(query_embedding, top_k, video_ids)
+        self.last_retrieval = {
+            "index_id": "global:" + ",".join(sorted(video_ids or [])),
+            "index_version": str(global_index.version),
+            "chunk_ids": [result["id"] for result in results],
+            "query_embedding": query_embedding[0],
+        }
+        chunks = []
+        for result in results:
+            if result["start"] is None:
+                chunks.append(f"({result['title']}) {result['text']}")
+            else:
+                chunks.append(f"[{format_timestamp(result['start'])} - {format_timestamp(result['end'])}] "
+                              f"({result['title']}) {result['text']}")
+        return chunks
+    
+    def retrieve_relevant_chunks(self, query: str, top_k: int = 3, mode: str = RETRIEVAL_MODE) -> List[str]:
+        """Retrieve the most relevant chunks for a query (hybrid keyword and vector search by default)."""
+        # Cleared first, so an early return can't key an answer under the previous question's chunks
+        self.last_retrieval = None
+        rag_index = self._acquire_index()
+        if rag_index is None:
             print("❌ No index available. Process a transcript first.")
             return []
-        
-        # Create query embedding
-        query_embedding = self.embedding_model.encode([query])
-        
-        # Search in FAISS index
-        distances, indices = self.index.search(np.array(query_embedding).astype('float32'), top_k)
-        
-        # Get relevant chunks
-        relevant_chunks = [self.chunks[idx] for idx in indices[0]]
-        return relevant_chunks
+        try:
+            if len(rag_index.chunks) == 0:
+                print("❌ No index available. Process a transcript first.")
+                return []
+            
+            # Create query embedding
+            query_embedding = self.embedder.encode([query], use_cache=False)
+            
+            # Search in FAISS index and, for hybrid retrieval, the keyword index
+            chunk_ids = rag_index.search_ids(query_embedding, top_k, query, mode)
+            file_path = rag_index.file_path
+            self.last_retrieval = {
+                # Indexes that were never saved have no identity to cache answers under
+                "index_id": os.path.abspath(file_path) if file_path else None,
+                "index_version": rag_index.version,
+                "chunk_ids": chunk_ids,
+                "query_embedding": query_embedding[0],
+            }
+            return [rag_index.chunk_with_timestamp(idx) for idx in chunk_ids]
+        finally:
+            rag_index.release()
+    
+    def _acquire_index(self) -> Optional[RAGIndex]:
+        """Take a read reference on the current index, switching to the cached version if it was replaced."""
+        while self.rag_index is not None and not self.rag_index.acquire():
+            # Rebuilt or evicted from the index cache since this session loaded it
+            self.rag_index = index_cache.get(self.rag_index.file_path)
+        return self.rag_index
+
+def build_prompt_prefix(context_text: str) -> str:
+    """The part of the prompt before the question; its processed state is cached and reused."""
+    return f"""Below is a section of a transcript from a video:
+
+{context_text}
+
+Based on the above transcript, please answer the following question.
+If a section starts with a [start - end] timestamp, cite the timestamp of the part you use:
+"""
+
+def build_prompt(query: str, context_text: str) -> str:
+    """The LLM prompt for a question and its joined context chunks."""
+    return f"""{build_prompt_prefix(context_text)}{query}
+
+Answer:"""
 
 class LocalLLM:
     def __init__(self, model_path="./models"):
         """Initialize the local LLM."""
         self.model_path = model_path
-        self.llm = None
+        self.llm = None  # Handle to the shared model
+        self.model_file = None
+        self.prompt_cache = get_prompt_cache()  # Prompt prefix states, shared by all sessions
+        self.last_context_stats = None  # Token use of the last prompt
+        self.last_generation_stats = None  # Latency and speed of the last answer
         
     def load_model(self, model_name="llama-2-7b-chat.Q4_K_M.gguf"):
         """Load the LLM model."""
         try:
-            from llama_cpp import Llama
-            
             full_model_path = os.path.join(self.model_path, model_name)
             if not os.path.exists(full_model_path):
                 print(f"❌ Model not found at {full_model_path}")
                 return False
                 
+            require("llm")
+            if self.llm is not None:
+                self.llm.release()
+            
             print(f"🔄 Loading LLM from {full_model_path}...")
-            self.llm = Llama(
-                model_path=full_model_path,
-                n_ctx=2048,  # Context window size
-                n_batch=512,  # Batch size for prompt processing
-                n_gpu_layers=-1  # Attempt to offload all layers to GPU
-            )
+            self.llm = acquire_llm(full_model_path)
+            self.model_file = os.path.abspath(full_model_path)
             print("✅ LLM loaded successfully")
             return True
             
@@ -202,46 +720,124 @@ class LocalLLM:
             print(f"❌ Error loading LLM: {str(e)}")
             return False
     
-    def generate_response(self, query: str, context_chunks: List[str], max_tokens: int = 512) -> str:
-        """Generate a response using the LLM with context chunks."""
+    def pack_context(self, query: str, context_chunks: List[str], max_tokens: int = 512,
+                     context_budget: int = CONTEXT_TOKEN_BUDGET) -> Tuple[List[str], Dict[str, Any]]:
+        """
+        Fit the highest-ranked chunks into the context window.
+        
+        The window (n_ctx) must hold the prompt template, the question, the
+        context and max_tokens of answer; context_budget lowers the context's
+        share further.
+        
+        Returns:
+            tuple: (chunks to send, token statistics)
+        """
+        # The vocabulary is read-only, so tokenizing does not need the model's request queue
+        llama = self.llm.model
+        tokenize = lambda text: llama.tokenize(text.encode("utf-8"), add_bos=False)
+        detokenize = lambda tokens: llama.detokenize(tokens).decode("utf-8", errors="ignore")
+        
+        prompt_tokens = len(llama.tokenize(build_prompt(query, "").encode("utf-8")))
+        budget = llama.n_ctx() - max_tokens - prompt_tokens
+        if context_budget:
+            budget = min(budget, context_budget)
+        packed, stats = pack_context(context_chunks, budget, tokenize, detokenize)
+        stats["prompt_tokens"] = prompt_tokens + stats["context_tokens"]
+        print(f"📦 Prompt: {stats['prompt_tokens']} tokens ({stats['context_tokens']} context, "
+              f"{len(packed)}/{len(context_chunks)} chunks), saved {stats['saved_tokens']} tokens "
+              f"({stats['duplicates']} duplicates, {stats['overlap_chars']} overlap chars, "
+              f"{stats['over_budget']} over budget)")
+        return packed, stats
+    
+    def stream_response(self, query: str, context_chunks: List[str], max_tokens: int = 512,
+                        context_budget: int = CONTEXT_TOKEN_BUDGET) -> Iterator[str]:
+        """
+        Generate a response token by token.
+        
+        Yields text pieces as the model produces them. When the stream ends,
+        last_generation_stats holds the time to first token (from the call,
+        so it includes waiting for other sessions and prompt processing), the
+        number of tokens and the generation speed.
+        
+        The context is placed in a prompt prefix that is the same for every
+        question on the same chunks; its llama.cpp state is restored from the
+        prompt cache when possible, so only the question has to be processed.
+        """
         if self.llm is None:
-            print("❌ LLM not loaded. Call load_model() first.")
-            return "Error: LLM not loaded. Please load the model first."
+            raise RuntimeError("LLM not loaded. Call load_model() first.")
         
-        try:
-            # Create a prompt with the context chunks
-            context_text = "\n\n".join(context_chunks)
-            
-            prompt = f"""Below is a section of a transcript from a video:
-
-{context_text}
-
-Based on the above transcript, please answer the following question:
-{query}
-
-Answer:"""
-            
-            print(f"🤖 Generating response with {len(context_chunks)} context chunks...")
-            
-            # Generate response
-            response = self.llm(
+        start_time = time.time()
+        # Create a prompt with the context chunks that fit the token budget
+        context_chunks, self.last_context_stats = self.pack_context(query, context_chunks, max_tokens, context_budget)
+        # A stable order keeps the prefix identical when follow-up questions retrieve the same chunks
+        context_text = CHUNK_SEPARATOR.join(chronological_order(context_chunks))
+        prefix = build_prompt_prefix(context_text)
+        prompt = build_prompt(query, context_text)
+        
+        print(f"🤖 Generating response with {len(context_chunks)} context chunks...")
+        
+        prompt_cache = self.prompt_cache
+        prefix_cache_hit = []
+        
+        def generate(llm):
+            # Runs on the model's worker thread, so restoring the state and generating are not interleaved
+            if prompt_cache.enabled:
+                prefix_cache_hit.append(prompt_cache.restore(llm, self.model_file, prefix))
+            yield from llm(
                 prompt,
                 max_tokens=max_tokens,
                 stop=["Human:", "\n\n\n"],
-                echo=False
+                echo=False,
+                stream=True
             )
-            
-            answer = response["choices"][0]["text"].strip()
-            return answer
-            
+        
+        # Generate response (queued behind other sessions using the same model)
+        first_token_time = None
+        pieces = []
+        for chunk in self.llm.stream(generate):
+            text = chunk["choices"][0]["text"]
+            if not text:
+                continue
+            if first_token_time is None:
+                first_token_time = time.time()
+            pieces.append(text)
+            yield text
+        
+        end_time = time.time()
+        answer = "".join(pieces)
+        tokens = len(self.llm.model.tokenize(answer.encode("utf-8"), add_bos=False)) if answer else 0
+        generation_seconds = end_time - (first_token_time or end_time)
+        # The first token's time is prompt processing, so the rate counts the tokens after it
+        tokens_per_second = (tokens - 1) / generation_seconds if tokens > 1 and generation_seconds > 0 else None
+        self.last_generation_stats = {
+            "time_to_first_token": round(first_token_time - start_time, 3) if first_token_time else None,
+            "total_seconds": round(end_time - start_time, 3),
+            "tokens": tokens,
+            "tokens_per_second": round(tokens_per_second, 2) if tokens_per_second else None,
+            "prompt_tokens": self.last_context_stats["prompt_tokens"],
+            "prefix_cache_hit": prefix_cache_hit[0] if prefix_cache_hit else None,
+        }
+        print(f"⏱️ First token after {self.last_generation_stats['time_to_first_token']} s, "
+              f"{tokens} tokens at {self.last_generation_stats['tokens_per_second']} tokens/s"
+              f"{' (prompt prefix from cache)' if self.last_generation_stats['prefix_cache_hit'] else ''}")
+    
+    def generate_response(self, query: str, context_chunks: List[str], max_tokens: int = 512,
+                          context_budget: int = CONTEXT_TOKEN_BUDGET) -> str:
+        """Generate a response using the LLM with the context chunks that fit its context window."""
+        if self.llm is None:
+            print("❌ LLM not loaded. Call load_model() first.")
+            return "Error: LLM not loaded. Please load the model first."
+        
+        try:
+            return "".join(self.stream_response(query, context_chunks, max_tokens, context_budget)).strip()
         except Exception as e:
             print(f"❌ Error generating response: {str(e)}")
             return f"Error generating response: {str(e)}"
 
 # Test function
 if __name__ == "__main__":
-    # Test installation
-    install_packages()
+    # Check the installed backends
+    get_capabilities()
     
     # Test model download
     download_model_if_needed()
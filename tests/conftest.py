@@ -0,0 +1,10 @@
+"""
+Shared test setup.
+The modules live at the repository root, which pytest does not put on the
+import path by itself.
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,95 @@
+"""
+Tests of the semantic answer cache against a temporary database.
+"""
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+import answer_cache
+from answer_cache import AnswerCache
+
+MODEL = "model.gguf"
+
+def unit(*values):
+    vector = np.array(values, dtype="float32")
+    return vector / np.linalg.norm(vector)
+
+class Clock:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(answer_cache.time, "time", clock)
+    return clock
+
+@pytest.fixture
+def cache(tmp_path, clock):
+    return AnswerCache(str(tmp_path / "answers.db"), similarity=0.95, ttl=100, max_entries=2)
+
+def store(cache, question, embedding, answer, index_version="v1", chunk_ids=(1, 2)):
+    cache.store("video", index_version, MODEL, list(chunk_ids), question, embedding, answer, generation_seconds=5.0)
+
+def lookup(cache, embedding, index_version="v1", chunk_ids=(2, 1)):
+    return cache.lookup("video", index_version, MODEL, list(chunk_ids), embedding)
+
+def test_similar_question_on_the_same_chunks_hits(cache):
+    store(cache, "What is FAISS?", unit(1, 0, 0), "A vector index")
+
+    hit = lookup(cache, unit(1, 0.1, 0))
+
+    assert hit["answer"] == "A vector index"
+    assert hit["question"] == "What is FAISS?"
+    assert hit["similarity"] >= 0.95
+    assert cache.stats()["hits"] == 1
+
+def test_questions_below_the_similarity_threshold_miss(cache):
+    store(cache, "What is FAISS?", unit(1, 0, 0), "A vector index")
+
+    # Cosine similarity of about 0.89
+    assert lookup(cache, unit(1, 0.5, 0)) is None
+    # Same question, but it retrieved other chunks
+    assert lookup(cache, unit(1, 0, 0), chunk_ids=(1, 3)) is None
+
+def test_answers_expire_after_the_ttl(cache, clock):
+    store(cache, "What is FAISS?", unit(1, 0, 0), "A vector index")
+
+    clock.now += 99
+    assert lookup(cache, unit(1, 0, 0)) is not None
+    clock.now += 2
+    assert lookup(cache, unit(1, 0, 0)) is None
+
+def test_least_recently_used_answer_is_evicted(cache, clock):
+    store(cache, "first", unit(1, 0, 0), "first answer", chunk_ids=(1,))
+    clock.now += 1
+    store(cache, "second", unit(0, 1, 0), "second answer", chunk_ids=(2,))
+    clock.now += 1
+    # Using the first answer makes the second the least recently used
+    assert lookup(cache, unit(1, 0, 0), chunk_ids=(1,)) is not None
+    clock.now += 1
+    store(cache, "third", unit(0, 0, 1), "third answer", chunk_ids=(3,))
+
+    assert cache.stats()["entries"] == 2
+    assert lookup(cache, unit(1, 0, 0), chunk_ids=(1,)) is not None
+    assert lookup(cache, unit(0, 1, 0), chunk_ids=(2,)) is None
+    assert lookup(cache, unit(0, 0, 1), chunk_ids=(3,)) is not None
+
+def test_new_index_version_invalidates_answers(cache):
+    store(cache, "What is FAISS?", unit(1, 0, 0), "A vector index")
+
+    assert lookup(cache, unit(1, 0, 0), index_version="v2") is None
+    # The old answers are gone, not just hidden
+    assert lookup(cache, unit(1, 0, 0), index_version="v1") is None
+    assert cache.stats()["entries"] == 0
+
+def test_invalidate_drops_the_answers_of_an_index(cache):
+    store(cache, "What is FAISS?", unit(1, 0, 0), "A vector index")
+
+    cache.invalidate("video")
+
+    assert lookup(cache, unit(1, 0, 0)) is None
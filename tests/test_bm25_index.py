@@ -0,0 +1,65 @@
+"""
+Tests of the BM25 keyword index: tokenization, persistence and rank fusion.
+"""
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from bm25_index import BM25_EXTENSION, BM25Index, tokenize, reciprocal_rank_fusion
+
+CHUNKS = [
+    "İstanbul'da FAISS ile vektör araması",
+    "Whisper modeli 2023 yılında güncellendi",
+    "Ankara ve ISTANBUL arasındaki mesafe",
+    "Kelime araması BM25 ile yapılır",
+]
+
+def test_tokenizer_folds_dotted_and_dotless_i():
+    assert tokenize("İstanbul", prefix_length=0) == tokenize("Istanbul", prefix_length=0) == ["istanbul"]
+    assert tokenize("ılık", prefix_length=0) == ["ilik"]
+    # No combining dot is left behind by lowercasing "İ"
+    assert tokenize("İZMİR", prefix_length=0) == ["izmir"]
+
+def test_tokenizer_cuts_words_but_not_numbers():
+    assert tokenize("Güncellendi 20231015 modeli", prefix_length=5) == ["günce", "20231015", "model"]
+    assert tokenize("güncellendi", prefix_length=0) == ["güncellendi"]
+
+def test_search_matches_folded_and_stemmed_terms():
+    index = BM25Index.build(CHUNKS)
+
+    assert {doc_id for doc_id, _ in index.search("istanbul", top_k=5)} == {0, 2}
+    assert index.search("güncelleme", top_k=1)[0][0] == 1
+    # Chunks sharing no term with the query are left out
+    assert index.search("tamamen alakasız", top_k=5) == []
+
+def test_save_and_load_round_trip(tmp_path):
+    index = BM25Index.build(CHUNKS, prefix_length=4)
+    path = str(tmp_path / f"video{BM25_EXTENSION}")
+    index.save(path)
+
+    loaded = BM25Index.load(path)
+
+    assert loaded.prefix_length == 4
+    assert len(loaded) == len(CHUNKS)
+    for query in ["istanbul araması", "BM25", "2023 Whisper"]:
+        assert loaded.search(query, top_k=4) == index.search(query, top_k=4)
+
+def test_empty_index_round_trip(tmp_path):
+    path = str(tmp_path / f"empty{BM25_EXTENSION}")
+    BM25Index.build([]).save(path)
+
+    loaded = BM25Index.load(path)
+
+    assert len(loaded) == 0
+    assert loaded.search("istanbul") == []
+
+def test_fusion_prefers_ids_ranked_well_in_both_lists():
+    dense = [1, 2, 3, 4]
+    keyword = [3, 1, 5]
+
+    fused = reciprocal_rank_fusion([dense, keyword], top_k=5)
+
+    # 1: 1/61 + 1/62, 3: 1/63 + 1/61, 2: 1/62, 5: 1/63, 4: 1/64
+    assert fused == [1, 3, 2, 5, 4]
+    assert reciprocal_rank_fusion([dense, keyword], top_k=2) == [1, 3]
@@ -0,0 +1,243 @@
+"""
+Tests of the concurrent downloader against a local HTTP stand-in.
+The server serves generated fixture media (yt-dlp's generic extractor
+downloads direct media links), streams it slowly so that downloads overlap,
+supports Range requests and can fail a path with 5xx responses.
+"""
+
+import re
+import time
+import random
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+
+pytest.importorskip("yt_dlp")
+
+import bulk_downloader
+from bulk_downloader import HostRateLimiter, download_many, download_with_retries
+from youtube_downloader import media_basename
+
+CHUNK_SIZE = 8 * 1024
+# Pause between chunks, so that a 64 KiB file takes about 0.1 s to serve
+CHUNK_DELAY = 0.0125
+
+def fixture_media(name, size=64 * 1024):
+    """Deterministic bytes standing in for an audio file."""
+    return random.Random(name).randbytes(size)
+
+class MediaServer:
+    def __init__(self, media):
+        """
+        Serve media files over HTTP and record the requests.
+
+        Args:
+            media (dict): URL path -> file bytes
+        """
+        self.media = media
+        self.requests = []
+        self.failures = {}
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    def url(self, path):
+        return f"http://127.0.0.1:{self._server.server_address[1]}{path}"
+
+    def fail(self, path, count):
+        """Answer the next count requests for path with 503."""
+        self.failures[path] = count
+
+    def requests_for(self, path, method="GET"):
+        with self._lock:
+            return [request for request in self.requests if request["path"] == path and request["method"] == method]
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_HEAD(self):
+                self._serve(send_body=False)
+
+            def do_GET(self):
+                self._serve(send_body=True)
+
+            def _serve(self, send_body):
+                with server._lock:
+                    server.requests.append({"method": self.command, "path": self.path, "time": time.time(),
+                                            "range": self.headers.get("Range")})
+                    server.active += 1
+                    server.max_active = max(server.max_active, server.active)
+                    failing = server.failures.get(self.path, 0) > 0
+                    if failing:
+                        server.failures[self.path] -= 1
+                try:
+                    if failing:
+                        self.send_error(503)
+                    elif self.path not in server.media:
+                        self.send_error(404)
+                    else:
+                        self._send_media(server.media[self.path], send_body)
+                except ConnectionError:
+                    # Clients may stop reading once they have seen enough
+                    pass
+                finally:
+                    with server._lock:
+                        server.active -= 1
+
+            def _send_media(self, data, send_body):
+                start = 0
+                match = re.match(r"bytes=(\d+)-(\d*)", self.headers.get("Range") or "")
+                if match:
+                    start = int(match.group(1))
+                    end = int(match.group(2)) + 1 if match.group(2) else len(data)
+                    self.send_response(206)
+                    self.send_header("Content-Range", f"bytes {start}-{end - 1}/{len(data)}")
+                else:
+                    end = len(data)
+                    self.send_response(200)
+                self.send_header("Content-Type", "audio/mpeg")
+                self.send_header("Content-Length", str(end - start))
+                self.send_header("Accept-Ranges", "bytes")
+                self.end_headers()
+                if not send_body:
+                    return
+                pause = threading.Event()
+                for offset in range(start, end, CHUNK_SIZE):
+                    self.wfile.write(data[offset:min(offset + CHUNK_SIZE, end)])
+                    pause.wait(CHUNK_DELAY)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+@pytest.fixture
+def media_server():
+    media = {f"/media/clip{i:02d}.mp3": fixture_media(f"clip{i:02d}") for i in range(6)}
+    with MediaServer(media) as server:
+        yield server
+
+def saved_bytes(item):
+    with open(item["audio_path"], "rb") as f:
+        return f.read()
+
+def test_downloads_are_bounded_per_host(media_server, tmp_path):
+    urls = [media_server.url(path) for path in media_server.media]
+    report = download_many(urls, str(tmp_path), "native", max_workers=4, per_host_interval=0,
+                           per_host_concurrency=2, max_retries=0)
+
+    assert report["completed"] == len(urls)
+    # Four workers, but only two downloads against the one host at a time
+    assert media_server.max_active == 2
+
+def test_downloads_are_bounded_by_workers(media_server, tmp_path):
+    urls = [media_server.url(path) for path in media_server.media]
+    report = download_many(urls, str(tmp_path), "native", max_workers=3, per_host_interval=0,
+                           per_host_concurrency=10, max_retries=0)
+
+    assert report["completed"] == len(urls)
+    assert media_server.max_active == 3
+
+def test_download_starts_are_rate_limited_per_host(media_server, tmp_path, monkeypatch):
+    starts = []
+
+    class RecordingLimiter(HostRateLimiter):
+        def acquire(self, host):
+            super().acquire(host)
+            starts.append(time.time())
+
+    monkeypatch.setattr(bulk_downloader, "HostRateLimiter", RecordingLimiter)
+    interval = 0.3
+    paths = list(media_server.media)[:4]
+    report = download_many([media_server.url(path) for path in paths], str(tmp_path), "native", max_workers=4,
+                           per_host_interval=interval, per_host_concurrency=4, max_retries=0)
+
+    assert report["completed"] == len(paths)
+    # Expanding the (non-YouTube) URLs requests them too, through the same limiter
+    assert len(starts) == 2 * len(paths)
+    gaps = [later - earlier for earlier, later in zip(sorted(starts), sorted(starts)[1:])]
+    assert min(gaps) >= interval * 0.9
+
+def test_known_videos_are_not_expanded(monkeypatch):
+    expanded = []
+    monkeypatch.setattr(bulk_downloader, "expand_playlist", lambda url: expanded.append(url) or [url])
+    limiter = HostRateLimiter(0, 1)
+
+    video = "https://www.youtube.com/watch?v=dQw4w9WgXcQ"
+    playlist = "https://www.youtube.com/playlist?list=PL0123456789"
+    assert bulk_downloader.expand_source(video, limiter) == [video]
+    assert bulk_downloader.expand_source(playlist, limiter) == [playlist]
+    assert expanded == [playlist]
+
+def test_partial_file_is_resumed(media_server, tmp_path):
+    path = "/media/clip00.mp3"
+    data = media_server.media[path]
+    # What an interrupted earlier attempt leaves behind
+    part_path = tmp_path / f"{media_basename({'title': 'clip00', 'id': 'clip00'})}.mp3.part"
+    part_path.write_bytes(data[:len(data) // 2])
+
+    report = download_many([media_server.url(path)], str(tmp_path), "native", max_workers=1,
+                           per_host_interval=0, max_retries=0)
+
+    assert report["completed"] == 1
+    assert saved_bytes(report["per_item"][0]) == data
+    ranges = [request["range"] for request in media_server.requests_for(path)]
+    assert f"bytes={len(data) // 2}-" in ranges
+    assert not part_path.exists()
+
+def test_server_errors_are_retried_with_exponential_backoff(media_server, tmp_path, monkeypatch):
+    path = "/media/clip01.mp3"
+    media_server.fail(path, 2)
+    delays = []
+    monkeypatch.setattr(bulk_downloader.random, "random", lambda: 0.5)
+    monkeypatch.setattr(bulk_downloader.time, "sleep", delays.append)
+
+    item = download_with_retries(media_server.url(path), str(tmp_path), "native", HostRateLimiter(0, 1),
+                                 max_retries=4, backoff_base=2.0)
+
+    assert item["status"] == "completed"
+    assert item["attempts"] == 3
+    assert saved_bytes(item) == media_server.media[path]
+    # backoff_base ** attempt, with the jitter factor fixed at 1
+    assert delays == [2.0, 4.0]
+
+def test_item_fails_after_the_last_retry(media_server, tmp_path, monkeypatch):
+    path = "/media/clip02.mp3"
+    media_server.fail(path, 100)
+    monkeypatch.setattr(bulk_downloader.time, "sleep", lambda seconds: None)
+
+    item = download_with_retries(media_server.url(path), str(tmp_path), "native", HostRateLimiter(0, 1),
+                                 max_retries=2)
+
+    assert item["status"] == "failed"
+    assert item["attempts"] == 3
+    assert "503" in item["error"]
+
+def test_report_has_per_item_throughput(media_server, tmp_path):
+    paths = list(media_server.media)[:3]
+    report = download_many([media_server.url(path) for path in paths], str(tmp_path), "native", max_workers=3,
+                           per_host_interval=0, per_host_concurrency=3, max_retries=0)
+
+    assert report["items"] == report["completed"] == 3
+    assert report["failed"] == 0
+    assert report["total_bytes"] == sum(len(media_server.media[path]) for path in paths)
+    assert report["throughput_mbps"] > 0
+    for path, item in zip(paths, report["per_item"]):
+        assert item["url"] == media_server.url(path)
+        assert item["bytes"] == len(media_server.media[path])
+        assert item["seconds"] > 0
+        assert item["throughput_mbps"] > 0
+        assert item["attempts"] == 1
@@ -0,0 +1,72 @@
+"""
+Tests of token-budget context packing, with whitespace-separated words as tokens.
+"""
+
+from context_packer import pack_context, chronological_order
+
+def tokenize(text):
+    return text.split()
+
+def detokenize(tokens):
+    return " ".join(tokens)
+
+def test_chunks_are_packed_in_rank_order_until_the_budget():
+    chunks = ["one two three four five", "six seven eight nine ten", "eleven twelve thirteen fourteen fifteen",
+              "sixteen seventeen"]
+
+    packed, stats = pack_context(chunks, budget=12, tokenize=tokenize, detokenize=detokenize)
+
+    # The third chunk does not fit, the shorter one after it does
+    assert packed == [chunks[0], chunks[1], chunks[3]]
+    assert stats["over_budget"] == 1
+    assert stats["context_tokens"] == 12
+    assert stats["saved_tokens"] == 5
+    assert not stats["truncated"]
+
+def test_near_duplicates_are_dropped():
+    chunk = "the model transcribes the audio file into text with timestamps for every segment"
+    chunks = [chunk, chunk + " again", "a completely different chunk about vector search"]
+
+    packed, stats = pack_context(chunks, budget=100, tokenize=tokenize)
+
+    assert packed == [chunks[0], chunks[2]]
+    assert stats["duplicates"] == 1
+
+def test_overlap_with_a_packed_neighbour_is_sent_once():
+    shared = "text that both neighbouring chunks contain"
+    first = f"[00:00:00 - 00:01:00] The first chunk ends with {shared}"
+    second = f"[00:01:00 - 00:02:00] {shared} and the second chunk continues"
+
+    packed, stats = pack_context([first, second], budget=100, tokenize=tokenize)
+
+    assert packed == [first, "[00:01:00 - 00:02:00] and the second chunk continues"]
+    assert stats["overlap_chars"] == len(shared)
+
+def test_first_chunk_is_truncated_when_it_alone_is_over_budget():
+    chunks = ["one two three four five six", "seven eight"]
+
+    packed, stats = pack_context(chunks, budget=3, tokenize=tokenize, detokenize=detokenize)
+
+    assert packed == ["one two three"]
+    assert stats["truncated"]
+    assert stats["context_tokens"] == 3
+    assert stats["over_budget"] == 1
+
+def test_first_chunk_is_skipped_without_detokenize():
+    packed, stats = pack_context(["one two three four"], budget=3, tokenize=tokenize)
+
+    assert packed == []
+    assert stats["over_budget"] == 1
+
+def test_chronological_order_reads_hours_minutes_and_seconds():
+    chunks = [
+        "untitled chunk",
+        "[01:00:00 - 01:01:00] (Video) an hour in",
+        "[00:59:59 - 01:00:30] (Video) just before",
+        "[00:02:05 - 00:03:00] (Video) two minutes in",
+        "[00:00:10 - 00:01:00] (Video) the beginning",
+    ]
+
+    assert chronological_order(chunks) == [chunks[4], chunks[3], chunks[2], chunks[1], chunks[0]]
+    # The order does not depend on the retrieval ranking
+    assert chronological_order(list(reversed(chunks))) == chronological_order(chunks)
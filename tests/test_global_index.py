@@ -0,0 +1,69 @@
+"""
+Tests of the global index shared by several processes.
+Two GlobalIndex objects on one directory stand in for two processes: they
+share nothing but the files.
+"""
+
+import multiprocessing
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("faiss")
+
+from global_index import GlobalIndex
+
+DIMENSION = 16
+
+def vectors(seed, count):
+    return np.random.default_rng(seed).standard_normal((count, DIMENSION)).astype("float32")
+
+def chunks(video_id, count):
+    return [f"{video_id} chunk {i}" for i in range(count)]
+
+def test_changes_of_another_process_are_seen(tmp_path):
+    writer = GlobalIndex(str(tmp_path), dimension=DIMENSION, shard_size=8)
+    reader = GlobalIndex(str(tmp_path), dimension=DIMENSION, shard_size=8)
+    first = vectors(0, 5)
+    writer.add_video("a", first, chunks("a", 5))
+    assert reader.search(first[:1], top_k=1)[0]["text"] == "a chunk 0"
+
+    # Replacing the video rewrites the shard the reader has in memory
+    second = vectors(1, 5)
+    writer.add_video("a", second, [f"new {text}" for text in chunks("a", 5)])
+    results = reader.search(second[:1], top_k=5)
+    assert results[0]["text"] == "new a chunk 0"
+    assert all(result["text"].startswith("new") for result in results)
+
+def _add_videos(index_dir, names):
+    index = GlobalIndex(index_dir, dimension=DIMENSION, shard_size=8)
+    for seed, name in enumerate(names):
+        index.add_video(name, vectors(seed, 3), chunks(name, 3))
+
+def test_concurrent_writers_keep_every_vector(tmp_path):
+    GlobalIndex(str(tmp_path), dimension=DIMENSION, shard_size=8)
+    context = multiprocessing.get_context("spawn")
+    workers = [context.Process(target=_add_videos, args=(str(tmp_path), [f"p{worker}v{i}" for i in range(4)]))
+               for worker in range(3)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+        assert worker.exitcode == 0
+
+    index = GlobalIndex(str(tmp_path))
+    assert index.stats()["vectors"] == 36
+    # Every vector in the shards has its metadata, none was lost to a concurrent save
+    stored = sum(index._load_shard(shard).ntotal for shard in range(index.stats()["shards"]))
+    assert stored == 36
+
+def test_replacing_a_video_removes_its_old_chunks(tmp_path):
+    index = GlobalIndex(str(tmp_path), dimension=DIMENSION, shard_size=8)
+    index.add_video("a", vectors(0, 6), chunks("a", 6))
+    index.add_video("b", vectors(1, 4), chunks("b", 4))
+    index.add_video("a", vectors(2, 3), chunks("a", 3))
+
+    assert index.stats()["vectors"] == 7
+    assert {video["video_id"]: video["chunk_count"] for video in index.list_videos()} == {"a": 3, "b": 4}
+    assert index.remove_video("a") == 3
+    assert index.stats()["vectors"] == 4
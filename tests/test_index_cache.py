@@ -0,0 +1,61 @@
+"""
+Tests of the index cache shared by sessions: a cached index that is replaced
+or evicted stays readable while a session is searching it.
+"""
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("faiss")
+
+from index_builder import build_index
+from rag_helper import RAGIndex, IndexCache
+
+DIMENSION = 8
+
+def saved_index(tmp_path, name, texts):
+    vectors = np.random.default_rng(len(texts)).standard_normal((len(texts), DIMENSION)).astype("float32")
+    file_path = str(tmp_path / name)
+    RAGIndex(build_index(vectors, index_type="flat", encoding="float32"), list(texts)).save(file_path)
+    return file_path
+
+def test_evicted_index_is_unmapped_after_the_last_reader(tmp_path):
+    cache = IndexCache(max_size=1)
+    first = cache.get(saved_index(tmp_path, "first", ["a", "b"]))
+    assert first.acquire()
+
+    cache.get(saved_index(tmp_path, "second", ["c"]))
+
+    # Evicted: sessions move on to a fresh load, but the running search can still read
+    assert first.closed
+    assert not first.acquire()
+    assert first.chunks[1] == "b"
+    first.release()
+    assert first.chunks.closed
+
+def test_index_without_readers_is_unmapped_when_replaced(tmp_path):
+    cache = IndexCache()
+    file_path = saved_index(tmp_path, "video", ["old"])
+    old = cache.get(file_path)
+
+    rebuilt = RAGIndex(build_index(np.ones((1, DIMENSION), dtype="float32"), index_type="flat",
+                                   encoding="float32"), ["new"])
+    rebuilt.save(file_path)
+    cache.put(file_path, rebuilt)
+
+    assert old.closed and old.chunks.closed
+    assert cache.get(file_path) is rebuilt
+
+def test_saving_over_its_own_file_keeps_readers_working(tmp_path):
+    file_path = saved_index(tmp_path, "video", ["a", "b"])
+    loaded = RAGIndex.load(file_path)
+    store = loaded.chunks
+    assert loaded.acquire()
+
+    loaded.save(file_path)
+
+    assert not store.closed
+    assert store[0] == "a"
+    loaded.release()
+    assert store.closed
+    assert list(loaded.chunks) == ["a", "b"]
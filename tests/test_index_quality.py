@@ -0,0 +1,81 @@
+"""
+Retrieval-quality regression tests of the vector indexes.
+Synthetic clustered unit vectors stand in for sentence embeddings, so the
+tests need FAISS but no embedding model or transcripts.
+"""
+
+import pytest
+
+np = pytest.importorskip("numpy")
+faiss = pytest.importorskip("faiss")
+
+from index_builder import (INDEX_METRIC, build_index, normalize_vectors, needs_migration, migrate_index,
+                           reconstruct_vectors, index_vectors)
+
+DIMENSION = 384
+NUM_VECTORS = 5000
+NUM_QUERIES = 200
+TOP_K = 5
+# Same bar as `python benchmark.py retrieval-quality`
+MIN_RECALL = 0.95
+
+@pytest.fixture(scope="module")
+def corpus():
+    """Unit vectors grouped around topics, and queries close to some of them."""
+    rng = np.random.default_rng(0)
+    topics = rng.standard_normal((50, DIMENSION))
+    vectors = topics[rng.integers(0, len(topics), NUM_VECTORS)] + 0.5 * rng.standard_normal((NUM_VECTORS, DIMENSION))
+    queries = vectors[rng.choice(NUM_VECTORS, NUM_QUERIES, replace=False)] + \
+        0.3 * rng.standard_normal((NUM_QUERIES, DIMENSION))
+    return normalize_vectors(vectors), normalize_vectors(queries)
+
+def recall_at_k(found, expected):
+    return float(np.mean([len(set(row) & set(exact)) / len(exact) for row, exact in zip(found, expected)]))
+
+@pytest.mark.parametrize("encoding", ["float16", "int8"])
+def test_compressed_encoding_keeps_recall(corpus, encoding):
+    vectors, queries = corpus
+    baseline = build_index(vectors, index_type="flat", encoding="float32")
+    _, exact = baseline.search(queries, TOP_K)
+
+    index = build_index(vectors, index_type="flat", encoding=encoding)
+    _, found = index.search(queries, TOP_K)
+
+    assert index.metric_type == INDEX_METRIC == faiss.METRIC_INNER_PRODUCT
+    assert recall_at_k(found, exact) >= MIN_RECALL
+    assert len(faiss.serialize_index(index)) < len(faiss.serialize_index(baseline))
+
+def test_migrate_index_converts_l2_index_to_normalized_inner_product(corpus):
+    vectors, queries = corpus
+    # Indexes saved before normalization hold raw embeddings of varying length
+    raw = vectors * np.random.default_rng(1).uniform(0.5, 3.0, (len(vectors), 1)).astype("float32")
+    old_index = faiss.IndexFlatL2(DIMENSION)
+    old_index.add(raw)
+    assert needs_migration(old_index)
+
+    migrated = migrate_index(old_index, encoding="float32")
+
+    assert not needs_migration(migrated)
+    assert migrated.metric_type == faiss.METRIC_INNER_PRODUCT
+    assert migrated.ntotal == old_index.ntotal
+    np.testing.assert_allclose(np.linalg.norm(reconstruct_vectors(migrated), axis=1), 1.0, rtol=1e-5)
+    # Same neighbours as L2 search over the normalized vectors, where distance and cosine rank alike
+    normalized_l2 = faiss.IndexFlatL2(DIMENSION)
+    normalized_l2.add(normalize_vectors(raw))
+    _, expected = normalized_l2.search(queries, TOP_K)
+    _, found = migrated.search(queries, TOP_K)
+    np.testing.assert_array_equal(found, expected)
+
+def test_migrate_index_keeps_ids(corpus):
+    vectors, queries = corpus
+    ids = np.arange(1000, 1000 + NUM_VECTORS, dtype="int64")
+    old_index = faiss.IndexIDMap2(faiss.IndexFlatL2(DIMENSION))
+    old_index.add_with_ids(vectors * 2.0, ids)
+
+    migrated = migrate_index(old_index, encoding="float32")
+
+    _, migrated_ids = index_vectors(migrated)
+    np.testing.assert_array_equal(migrated_ids, ids)
+    _, expected = old_index.search(queries, TOP_K)
+    _, found = migrated.search(queries, TOP_K)
+    np.testing.assert_array_equal(found, expected)
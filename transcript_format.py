@@ -0,0 +1,159 @@
+"""
+Structured transcript format.
+Transcripts are stored as JSONL: one segment per line with its start and end
+time, text, average log probability and language.
+"""
+
+import re
+import json
+import html
+
+TRANSCRIPT_EXTENSION = ".jsonl"
+
+def segment_to_dict(segment, language=None):
+    """
+    Convert a faster-whisper segment into a transcript record.
+
+    Args:
+        segment: Segment produced by WhisperModel.transcribe
+        language (str): Detected language of the audio
+
+    Returns:
+        dict: Segment record with start, end, text, avg_logprob and language
+    """
+    return {
+        "start": round(segment.start, 3),
+        "end": round(segment.end, 3),
+        "text": segment.text.strip(),
+        "avg_logprob": round(segment.avg_logprob, 4),
+        "language": language,
+    }
+
+def caption_segment(start, end, text, language=None):
+    """Build a transcript record for a caption cue (captions have no log probability)."""
+    return {
+        "start": round(start, 3),
+        "end": round(end, 3),
+        "text": text,
+        "avg_logprob": None,
+        "language": language,
+    }
+
+def _clip_overlaps(segments):
+    # Caption cues often stay on screen while the next one starts; end each at the next start
+    for segment, following in zip(segments, segments[1:]):
+        if segment["start"] < following["start"] < segment["end"]:
+            segment["end"] = following["start"]
+    return segments
+
+def parse_json3_captions(data, language=None):
+    """
+    Convert a YouTube json3 caption track into transcript records.
+
+    Args:
+        data (str): Contents of the json3 track
+        language (str): Language of the track
+
+    Returns:
+        list: Segment records
+    """
+    segments = []
+    for event in json.loads(data).get("events", []):
+        text = "".join(seg.get("utf8", "") for seg in event.get("segs") or [])
+        text = " ".join(text.split())
+        if not text:
+            continue
+        start = event.get("tStartMs", 0) / 1000
+        end = start + event.get("dDurationMs", 0) / 1000
+        segments.append(caption_segment(start, end, text, language))
+    return _clip_overlaps(segments)
+
+def _vtt_seconds(timestamp):
+    seconds = 0.0
+    for part in timestamp.replace(",", ".").split(":"):
+        seconds = seconds * 60 + float(part)
+    return seconds
+
+def parse_vtt_captions(data, language=None):
+    """
+    Convert a WebVTT caption track into transcript records.
+
+    Lines repeated from the previous cue (rolling automatic captions) are dropped.
+
+    Args:
+        data (str): Contents of the .vtt track
+        language (str): Language of the track
+
+    Returns:
+        list: Segment records
+    """
+    segments = []
+    previous_lines = []
+    for block in re.split(r"\n\s*\n", data.replace("\r\n", "\n")):
+        lines = block.strip().split("\n")
+        timing = next((i for i, line in enumerate(lines) if "-->" in line), None)
+        if timing is None:
+            continue
+        start, end = lines[timing].split("-->")
+        cue_lines = [html.unescape(re.sub(r"<[^>]+>", "", line)).strip() for line in lines[timing + 1:]]
+        cue_lines = [line for line in cue_lines if line]
+        text = " ".join(line for line in cue_lines if line not in previous_lines)
+        previous_lines = cue_lines
+        if text:
+            segments.append(caption_segment(_vtt_seconds(start.strip()),
+                                            _vtt_seconds(end.split()[0]), text, language))
+    return _clip_overlaps(segments)
+
+def append_segments(f, segments):
+    """Write segment records to an open transcript file, one JSON object per line."""
+    for segment in segments:
+        f.write(json.dumps(segment, ensure_ascii=False) + "\n")
+
+def write_transcript(file_path, segments):
+    """Write segment records to a transcript file."""
+    with open(file_path, "w", encoding="utf-8") as f:
+        append_segments(f, segments)
+
+def read_transcript(file_path):
+    """
+    Read segment records from a transcript file.
+
+    Plain-text transcripts are also accepted; every non-empty line becomes a
+    segment without timing information.
+
+    Args:
+        file_path (str): Path to a .jsonl or .txt transcript
+
+    Returns:
+        list: Segment records
+    """
+    segments = []
+    with open(file_path, "r", encoding="utf-8") as f:
+        if not file_path.endswith(TRANSCRIPT_EXTENSION):
+            for line in f:
+                if line.strip():
+                    segments.append({"start": None, "end": None, "text": line.strip(),
+                                     "avg_logprob": None, "language": None})
+            return segments
+
+        for line in f:
+            if line.strip():
+                try:
+                    segments.append(json.loads(line))
+                except ValueError:
+                    # A partially written last line (e.g. after a crash) is skipped
+                    print(f"⚠️ Skipping malformed line in {file_path}")
+    return segments
+
+def transcript_text(segments):
+    """Join segment texts into plain text, one segment per line."""
+    return "\n".join(segment["text"] for segment in segments)
+
+def format_timestamp(seconds):
+    """Format seconds as H:MM:SS or M:SS."""
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    if hours:
+        return f"{hours}:{minutes:02d}:{seconds:02d}"
+    return f"{minutes}:{seconds:02d}"
@@ -1,13 +1,42 @@
 """
 YouTube audio downloader module with enhanced filename sanitization.
-This module handles downloading audio from YouTube videos.
+This module handles downloading audio from YouTube videos and, when the
+video has them, its captions as a ready-made transcript.
 """
 
 import os
 import subprocess
-import sys
 import re
+import json
+import time
+import threading
 import unicodedata
+from concurrent.futures import Future
+
+from transcript_format import TRANSCRIPT_EXTENSION, write_transcript, parse_json3_captions, parse_vtt_captions
+from file_utils import file_sha256
+from capabilities import require
+
+# Cached downloads are indexed by "<extractor>:<video id>" in this file inside the output directory
+DOWNLOAD_INDEX_NAME = "download_index.json"
+YOUTUBE_ID_PATTERN = re.compile(r'(?:v=|youtu\.be/|/shorts/|/embed/|/live/)([A-Za-z0-9_-]{11})')
+# Playlist and channel URLs (/@handle, /channel/, /c/, /user/ and their tabs)
+YOUTUBE_COLLECTION_PATTERN = re.compile(r'[?&]list=|/playlist\b|youtube\.com/(?:@|channel/|c/|user/)')
+
+# "native" keeps the original stream, "wav16k" is 16 kHz mono PCM, "mp3" is for playback
+AUDIO_FORMATS = ["native", "wav16k", "mp3"]
+# File name suffix per format, so the formats of one video do not overwrite each other
+FORMAT_FILE_SUFFIXES = {"native": "", "wav16k": "_16k", "mp3": "_192k"}
+
+# "manual" uses uploaded subtitles only, "auto" also accepts YouTube's automatic
+# captions, "asr" ignores captions and always runs Whisper
+CAPTION_POLICIES = ["manual", "auto", "asr"]
+# Caption track formats we can convert, in order of preference
+CAPTION_FORMATS = ["json3", "vtt"]
+
+_index_lock = threading.Lock()
+_inflight_lock = threading.Lock()
+_inflight_downloads = {}
 
 def sanitize_filename(filename):
     """
@@ -50,123 +79,457 @@ def sanitize_filename(filename):
         
     return filename
 
-def install_yt_dlp():
-    """Install yt-dlp if not already installed."""
-    try:
-        import yt_dlp
-        print("✅ yt-dlp already installed.")
-        return True
-    except ImportError:
-        print("📦 Installing yt-dlp...")
-        try:
-            subprocess.check_call([sys.executable, "-m", "pip", "install", "yt-dlp"])
-            print("✅ yt-dlp installed successfully.")
-            return True
-        except Exception as e:
-            print(f"❌ Failed to install yt-dlp: {e}")
-            return False
-
-def download_youtube_audio(url, output_dir="./audios"):
-    """
-    Download audio from a YouTube video.
+def expand_playlist(url):
+    """
+    Expand a playlist or channel URL into the URLs of its videos.
     
     Args:
-        url (str): YouTube video URL
-        output_dir (str): Directory to save audio files
+        url (str): YouTube video, playlist or channel URL
         
     Returns:
-        str: Path to the downloaded audio file
+        list: Video URLs (just [url] for a single video)
     """
-    # Install yt-dlp if needed
-    if not install_yt_dlp():
-        raise ImportError("Failed to install required package: yt-dlp")
-    
-    # Import yt_dlp after ensuring it's installed
+    require("download")
     import yt_dlp
     
-    # Create output directory if it doesn't exist
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
+    # Flat extraction lists playlist entries without resolving each video
+    with yt_dlp.YoutubeDL({'quiet': True, 'extract_flat': 'in_playlist'}) as ydl:
+        info = ydl.extract_info(url, download=False)
     
-    # Temporary path for info extraction
-    try:
-        # Extract info first without downloading
-        print("📋 Fetching video information...")
-        ydl_opts_info = {
-            'quiet': True,
-            'skip_download': True,
-        }
+    if info.get('_type') not in ('playlist', 'multi_video'):
+        return [url]
+    
+    urls = []
+    for entry in info.get('entries') or []:
+        if entry.get('_type') == 'playlist' or entry.get('ie_key') == 'YoutubeTab':
+            # Channels list their tabs (videos, shorts, ...) as nested playlists
+            urls.extend(expand_playlist(entry['url']))
+        elif entry.get('url', '').startswith('http'):
+            urls.append(entry['url'])
+        elif entry.get('id'):
+            urls.append(f"https://www.youtube.com/watch?v={entry['id']}")
+    print(f"📋 Playlist expanded to {len(urls)} videos")
+    return urls
+
+def extract_video_id(url):
+    """
+    Get the YouTube video ID from a URL without a network request.
+    
+    Args:
+        url (str): YouTube video URL
         
-        with yt_dlp.YoutubeDL(ydl_opts_info) as ydl:
-            info = ydl.extract_info(url, download=False)
-            title = info.get('title', 'video')
-            
-        # Sanitize the title for safe filename
-        safe_title = sanitize_filename(title)
-        print(f"🔤 Video title: {title}")
-        print(f"🔤 Safe filename: {safe_title}")
+    Returns:
+        str: The cache key ("youtube:<id>"), or None if the URL is not recognized
+    """
+    match = YOUTUBE_ID_PATTERN.search(url)
+    return f"youtube:{match.group(1)}" if match else None
+
+def is_collection_url(url):
+    """
+    Check without a network request whether a URL is a playlist or channel that expand_playlist would expand.
+    
+    A URL with a video ID (e.g. watch?v=...&list=...) is treated as that single video.
+    """
+    return extract_video_id(url) is None and YOUTUBE_COLLECTION_PATTERN.search(url) is not None
+
+def load_download_index(output_dir):
+    """Load the metadata index of cached downloads in output_dir."""
+    index_path = os.path.join(output_dir, DOWNLOAD_INDEX_NAME)
+    if not os.path.exists(index_path):
+        return {}
+    try:
+        with open(index_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except ValueError:
+        print("⚠️ Download index is corrupt, starting a new one")
+        return {}
+
+def save_download_index(output_dir, index):
+    """Write the metadata index atomically."""
+    index_path = os.path.join(output_dir, DOWNLOAD_INDEX_NAME)
+    temp_path = f"{index_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(index, f, ensure_ascii=False, indent=2)
+    os.replace(temp_path, index_path)
+
+def _entry_files(entry):
+    """Per-format files of an index entry, moving the single MP3 of an older entry into them."""
+    if "files" not in entry:
+        entry["files"] = {}
+        if entry.get("path"):
+            # Entries from before formats were cached side by side describe one MP3 download
+            entry["files"]["mp3"] = {key: entry.pop(key) for key in ("path", "format", "size", "sha256", "downloaded_at")
+                                     if key in entry}
+    return entry["files"]
+
+def get_cached_download(output_dir, video_key, audio_format="mp3"):
+    """
+    Return the cached file of a video in a format if it is still present and intact.
+    
+    Args:
+        output_dir (str): Directory of the download cache
+        video_key (str): Cache key ("<extractor>:<id>")
+        audio_format (str): One of AUDIO_FORMATS
         
-        # Output template with sanitized name
-        output_template = os.path.join(output_dir, safe_title + ".%(ext)s")
+    Returns:
+        dict: Entry with path, title, duration, format, size and sha256, or None
+    """
+    with _index_lock:
+        entry = load_download_index(output_dir).get(video_key)
+    if not entry or audio_format not in _entry_files(entry):
+        return None
+    
+    file_entry = entry["files"][audio_format]
+    if os.path.exists(file_entry["path"]) and os.path.getsize(file_entry["path"]) == file_entry["size"]:
+        return dict(entry, **file_entry)
+    return None
+
+def record_download(output_dir, video_key, metadata, audio_format, file_path):
+    """Add a downloaded or derived file to the metadata index."""
+    with _index_lock:
+        index = load_download_index(output_dir)
+        entry = index.setdefault(video_key, {"files": {}})
+        entry.update(metadata)
+        _entry_files(entry)[audio_format] = {
+            "path": file_path,
+            "format": os.path.splitext(file_path)[1].lstrip("."),
+            "size": os.path.getsize(file_path),
+            "sha256": file_sha256(file_path),
+            "downloaded_at": int(time.time()),
+        }
+        save_download_index(output_dir, index)
+
+def get_cached_captions(output_dir, video_key, caption_policy):
+    """
+    Look up the captions recorded for a video.
+    
+    Args:
+        output_dir (str): Directory of the download cache
+        video_key (str): Cache key ("<extractor>:<id>")
+        caption_policy (str): One of CAPTION_POLICIES
         
-        # Common ffmpeg locations for Windows
-        potential_ffmpeg_paths = [
-            "C:\\ffmpeg\\bin",
-            "C:\\Program Files\\ffmpeg\\bin",
-            os.path.join(os.environ.get("USERPROFILE", ""), "ffmpeg", "bin")
-        ]
+    Returns:
+        tuple: (known, captions) - known is False if the video has to be checked again,
+        captions is the entry with path, kind and language, or None if there is no usable track
+    """
+    if caption_policy == "asr":
+        return True, None
+    with _index_lock:
+        captions = load_download_index(output_dir).get(video_key, {}).get("captions")
+    if not captions:
+        return False, None
+    
+    if captions.get("kind") and os.path.exists(captions["path"]):
+        if captions["kind"] == "manual" or caption_policy == "auto":
+            return True, captions
+        return True, None
+    # No track was found last time; an "auto" check also covers "manual"
+    known = not captions.get("kind") and captions.get("checked_policy") in (caption_policy, "auto")
+    return known, None
+
+def record_captions(output_dir, video_key, caption_policy, captions):
+    """Record the captions fetched for a video (or that none were usable) in the metadata index."""
+    with _index_lock:
+        index = load_download_index(output_dir)
+        entry = index.setdefault(video_key, {"files": {}})
+        entry["captions"] = dict(captions) if captions else {"kind": None, "checked_policy": caption_policy}
+        save_download_index(output_dir, index)
+
+def _caption_languages(tracks, preferred):
+    # Exact matches first, then regional variants (en -> en-US); a track in any other
+    # language is a translation, not a transcript of the audio
+    bases = [language.split("-")[0] for language in preferred]
+    exact = [language for language in preferred if language in tracks]
+    variants = [language for language in tracks if language not in exact and language.split("-")[0] in bases]
+    return exact + variants
+
+def select_caption_track(info, caption_policy, languages=None):
+    """
+    Choose the caption track to use as the transcript.
+    
+    Args:
+        info (dict): yt-dlp extraction result
+        caption_policy (str): One of CAPTION_POLICIES
+        languages (list): Preferred language codes; the video's own language is tried after them
         
-        # Find ffmpeg path
-        ffmpeg_path = None
-        for path in potential_ffmpeg_paths:
-            if os.path.exists(path):
-                ffmpeg_path = path
-                print(f"🔍 Found ffmpeg at: {ffmpeg_path}")
-                break
+    Returns:
+        tuple: (kind, language, track) with kind "manual" or "auto", or None when no track
+        is in a preferred or the spoken language (Whisper transcribes the audio then)
+    """
+    if caption_policy not in CAPTION_POLICIES:
+        raise ValueError(f"Unknown caption policy: {caption_policy} (options: {', '.join(CAPTION_POLICIES)})")
+    if caption_policy == "asr":
+        return None
+    
+    preferred = [language for language in list(languages or []) + [info.get('language')] if language]
+    candidates = [("manual", info.get('subtitles') or {})]
+    if caption_policy == "auto":
+        candidates.append(("auto", info.get('automatic_captions') or {}))
+    
+    for kind, tracks in candidates:
+        tracks = {language: formats for language, formats in tracks.items() if language != 'live_chat'}
+        if kind == "manual":
+            ordered = _caption_languages(tracks, preferred)
+        else:
+            # Automatic captions include machine translations into every language;
+            # only the track in the spoken language is a transcript
+            ordered = [language for language in tracks if language.endswith('-orig')]
+            ordered += [language for language in preferred if language in tracks]
+        for language in ordered:
+            for caption_format in CAPTION_FORMATS:
+                for track in tracks[language]:
+                    if track.get('ext') == caption_format and track.get('url'):
+                        return kind, language.replace('-orig', ''), track
+    return None
+
+def fetch_captions(ydl, info, output_dir, caption_policy, languages=None):
+    """
+    Download the selected caption track and save it as a transcript next to the audio.
+    
+    Args:
+        ydl: The YoutubeDL instance that extracted info
+        info (dict): yt-dlp extraction result
+        output_dir (str): Directory to save the transcript
+        caption_policy (str): One of CAPTION_POLICIES
+        languages (list): Preferred language codes
         
-        # yt-dlp options
-        ydl_opts = {
+    Returns:
+        dict: path, kind and language of the transcript, or None if no usable track exists
+    """
+    selected = select_caption_track(info, caption_policy, languages)
+    if not selected:
+        return None
+    kind, language, track = selected
+    
+    print(f"💬 Fetching {kind} captions ({language}, {track['ext']})...")
+    data = ydl.urlopen(track['url']).read().decode('utf-8')
+    parse = parse_json3_captions if track['ext'] == 'json3' else parse_vtt_captions
+    segments = parse(data, language)
+    if not segments:
+        print("⚠️ Caption track is empty")
+        return None
+    
+    transcript_path = os.path.join(output_dir, f"{media_basename(info)}.{kind}.{language}{TRANSCRIPT_EXTENSION}")
+    write_transcript(transcript_path, segments)
+    print(f"✅ Captions saved to: {transcript_path}")
+    return {"path": transcript_path, "kind": kind, "language": language}
+
+def find_ffmpeg():
+    """Return the ffmpeg directory from common Windows locations, or None to use PATH."""
+    potential_ffmpeg_paths = [
+        "C:\\ffmpeg\\bin",
+        "C:\\Program Files\\ffmpeg\\bin",
+        os.path.join(os.environ.get("USERPROFILE", ""), "ffmpeg", "bin")
+    ]
+    for path in potential_ffmpeg_paths:
+        if os.path.exists(path):
+            print(f"🔍 Found ffmpeg at: {path}")
+            return path
+    return None
+
+def audio_format_options(audio_format):
+    """
+    yt-dlp options for an audio format.
+    
+    "native" keeps the original opus/m4a stream without re-encoding, "wav16k"
+    converts once to the 16 kHz mono PCM Whisper uses, "mp3" is the 192 kbps
+    playback format.
+    """
+    if audio_format == "native":
+        return {'format': 'bestaudio[acodec=opus]/bestaudio[ext=m4a]/bestaudio/best'}
+    if audio_format == "wav16k":
+        return {
+            'format': 'bestaudio/best',
+            'postprocessors': [{'key': 'FFmpegExtractAudio', 'preferredcodec': 'wav'}],
+            'postprocessor_args': {'extractaudio': ['-ar', '16000', '-ac', '1']},
+        }
+    if audio_format == "mp3":
+        return {
             'format': 'bestaudio/best',
             'postprocessors': [{
                 'key': 'FFmpegExtractAudio',
                 'preferredcodec': 'mp3',
                 'preferredquality': '192',
             }],
-            'outtmpl': output_template,
-            'quiet': False,
         }
+    raise ValueError(f"Unknown audio format: {audio_format} (options: {', '.join(AUDIO_FORMATS)})")
+
+def download_youtube_audio(url, output_dir="./audios", audio_format="mp3", playback_mp3=False):
+    """
+    Download audio from a YouTube video, reusing an earlier download of the same video.
+    
+    The video is resolved once; the same extraction result is used for the
+    download. Downloads are cached by the extractor's video ID, and concurrent
+    requests for the same video wait for a single download.
+    
+    Args:
+        url (str): YouTube video URL
+        output_dir (str): Directory to save audio files
+        audio_format (str): "native" or "wav16k" for transcription, "mp3" for playback
+        playback_mp3 (bool): Also derive an MP3 copy for playback
         
-        # Add ffmpeg location if found
-        if ffmpeg_path:
-            ydl_opts['ffmpeg_location'] = ffmpeg_path
-        
-        print("📥 Downloading audio...")
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            ydl.download([url])
+    Returns:
+        str: Path to the downloaded audio file
+    """
+    return download_youtube_media(url, output_dir, audio_format, playback_mp3)["audio_path"]
+
+def download_youtube_media(url, output_dir="./audios", audio_format="mp3", playback_mp3=False,
+                           caption_policy="asr", caption_languages=None):
+    """
+    Download the audio of a YouTube video and, depending on the caption policy, its captions.
+    
+    Captions come from the same extraction as the audio and are converted to
+    a transcript, so transcription can skip Whisper for this video.
+    
+    Args:
+        url (str): YouTube video URL
+        output_dir (str): Directory to save audio and caption files
+        audio_format (str): "native" or "wav16k" for transcription, "mp3" for playback
+        playback_mp3 (bool): Also derive an MP3 copy for playback
+        caption_policy (str): One of CAPTION_POLICIES
+        caption_languages (list): Preferred caption language codes
         
-        # Expected output file path
-        mp3_path = os.path.join(output_dir, safe_title + ".mp3")
+    Returns:
+        dict: audio_path, duration, and captions (path, kind, language) or None
+    """
+    # Create output directory if it doesn't exist
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    
+    # Recognizable YouTube URLs are answered from the cache without any network request
+    video_key = extract_video_id(url)
+    if video_key and not playback_mp3:
+        cached = get_cached_download(output_dir, video_key, audio_format)
+        known, captions = get_cached_captions(output_dir, video_key, caption_policy)
+        if cached and known:
+            print(f"♻️ Using cached audio: {cached['path']}")
+            return {"audio_path": cached["path"], "duration": cached.get("duration"), "captions": captions}
+    
+    # yt-dlp is imported only when a download needs it
+    require("download")
+    import yt_dlp
+    
+    try:
+        # Resolve the video once; the download reuses this result
+        print("📋 Fetching video information...")
+        with yt_dlp.YoutubeDL({'quiet': True}) as ydl:
+            info = ydl.extract_info(url, download=False)
+            
+            video_key = f"{info.get('extractor_key', 'generic').lower()}:{info['id']}"
+            known, captions = get_cached_captions(output_dir, video_key, caption_policy)
+            if not known:
+                # The extraction result already lists the caption tracks
+                captions = fetch_captions(ydl, info, output_dir, caption_policy, caption_languages)
+                record_captions(output_dir, video_key, caption_policy, captions)
         
-        # Check if the file exists
-        if not os.path.exists(mp3_path):
-            print("⚠️ Could not find expected output file. Looking for alternatives...")
-            # Try to find any MP3 file that was recently created
-            mp3_files = [f for f in os.listdir(output_dir) if f.endswith('.mp3')]
-            if mp3_files:
-                # Sort by creation time (newest first)
-                mp3_files.sort(key=lambda f: os.path.getctime(os.path.join(output_dir, f)), reverse=True)
-                mp3_path = os.path.join(output_dir, mp3_files[0])
-                print(f"🔄 Using alternative file: {mp3_path}")
-            else:
-                raise FileNotFoundError("❌ No MP3 files found in output directory")
+        audio_path = _download_once(yt_dlp, info, output_dir, video_key, audio_format)
         
-        print(f"✅ Audio saved to: {mp3_path}")
-        return mp3_path
+        if playback_mp3 and audio_format != "mp3" and not get_cached_download(output_dir, video_key, "mp3"):
+            derive_playback_mp3(audio_path, output_dir, video_key)
+        return {"audio_path": audio_path, "duration": info.get('duration'), "captions": captions}
             
     except Exception as e:
         print(f"❌ Download error: {str(e)}")
         raise
 
+def _download_once(yt_dlp, info, output_dir, video_key, audio_format):
+    """Return the cached file, join a running download of it, or download it."""
+    cached = get_cached_download(output_dir, video_key, audio_format)
+    if cached:
+        print(f"♻️ Using cached audio: {cached['path']}")
+        return cached["path"]
+    
+    # Only one download per video and format; other requests wait for its result
+    inflight_key = f"{video_key}/{audio_format}"
+    with _inflight_lock:
+        future = _inflight_downloads.get(inflight_key)
+        is_owner = future is None
+        if is_owner:
+            future = Future()
+            _inflight_downloads[inflight_key] = future
+    
+    if not is_owner:
+        print(f"⏳ Waiting for the running download of {video_key}...")
+        return future.result()
+    
+    try:
+        audio_path = _download_audio(yt_dlp, info, output_dir, video_key, audio_format)
+        future.set_result(audio_path)
+        return audio_path
+    except Exception as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight_downloads.pop(inflight_key, None)
+
+def media_basename(info):
+    """Readable file name for a video's files; the video ID keeps it unique."""
+    return sanitize_filename(f"{info.get('title', 'video')[:80]}_{info['id']}")
+
+def _download_audio(yt_dlp, info, output_dir, video_key, audio_format):
+    """Download the audio of an already extracted video, then record it in the cache index."""
+    title = info.get('title', 'video')
+    
+    # Sanitize the title for a readable filename; the video ID keeps it unique.
+    # Converted formats get their own name: the conversion deletes its source file,
+    # which must not be a cached native download
+    safe_title = media_basename(info) + FORMAT_FILE_SUFFIXES[audio_format]
+    print(f"🔤 Video title: {title}")
+    print(f"🔤 Safe filename: {safe_title}")
+    
+    # yt-dlp options
+    ydl_opts = audio_format_options(audio_format)
+    ydl_opts['outtmpl'] = os.path.join(output_dir, safe_title + ".%(ext)s")
+    ydl_opts['quiet'] = False
+    # Continue .part files left by an interrupted attempt instead of starting over
+    ydl_opts['continuedl'] = True
+    
+    # Add ffmpeg location if found
+    ffmpeg_path = find_ffmpeg()
+    if ffmpeg_path:
+        ydl_opts['ffmpeg_location'] = ffmpeg_path
+    
+    print(f"📥 Downloading audio ({audio_format})...")
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        # Processing the extracted info downloads without resolving the video again
+        result = ydl.process_ie_result(info, download=True)
+    
+    # Final path after post-processing; the template fixes the name, so no guessing among other files
+    downloads = result.get('requested_downloads') or [{}]
+    audio_path = downloads[0].get('filepath')
+    if not audio_path:
+        extension = {"mp3": "mp3", "wav16k": "wav"}.get(audio_format, result.get('ext'))
+        audio_path = os.path.join(output_dir, f"{safe_title}.{extension}")
+    if not os.path.exists(audio_path):
+        raise FileNotFoundError(f"❌ Expected output file not found: {audio_path}")
+    
+    record_download(output_dir, video_key, {
+        "url": info.get('webpage_url'),
+        "title": title,
+        "duration": info.get('duration'),
+    }, audio_format, audio_path)
+    
+    print(f"✅ Audio saved to: {audio_path}")
+    return audio_path
+
+def derive_playback_mp3(audio_path, output_dir, video_key):
+    """
+    Create a 192 kbps MP3 copy of a downloaded file for playback.
+    
+    Returns:
+        str: Path to the MP3 file
+    """
+    ffmpeg_path = find_ffmpeg()
+    ffmpeg = os.path.join(ffmpeg_path, "ffmpeg") if ffmpeg_path else "ffmpeg"
+    # The suffix also keeps a native MP3 download from being the output of its own conversion
+    mp3_path = os.path.splitext(audio_path)[0] + FORMAT_FILE_SUFFIXES["mp3"] + ".mp3"
+    
+    print("🎵 Creating MP3 copy for playback...")
+    subprocess.run([ffmpeg, "-y", "-loglevel", "error", "-i", audio_path, "-b:a", "192k", mp3_path], check=True)
+    record_download(output_dir, video_key, {}, "mp3", mp3_path)
+    return mp3_path
+
 # Test function
 if __name__ == "__main__":
     url = input("Enter YouTube URL: ")